@@ -0,0 +1,412 @@
+"""
+In-process stand-in for the Resource Locker Server, used by the benchmarks.
+It implements the endpoints the client talks to and records every request:
+    /                                           root page (connection check)
+    /api/resources                              listing, ?free_only ?label_matches ?name ?signoff
+    /api/resource/<name>                        PUT (or PATCH) to lock/release
+    /api/resource/retrieve_entrypoint/<search>  PUT to create a queue
+    /api/rqueue/<id>                            GET/PUT of a queue
+    /api/rqueue/<id>/events                     server-sent events of the queue (push=True only)
+    /api/rqueues                                listing, ?status
+A queue getting FINISHED locks the first free resource matching its search string with its signoff,
+    and names it in its data section ("resource_locked"), if there is one.
+The listings honour ?fields=a,b (sparse fieldsets) with sparse_fields=True, the answers are
+    gzipped for the clients accepting it with compress=True, gzipped request bodies are always accepted.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlencode, urlsplit
+import collections
+import datetime
+import gzip
+import json
+import re
+import socket
+import threading
+import time
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # Many waiters connect at once, the default backlog of 5 resets some of them
+    request_queue_size = 128
+
+
+class FakeResourceLockerServer:
+    """
+    Usage:
+        with FakeResourceLockerServer(finish_after=3) as server:
+            locker = ResourceLocker(server.url, "token")
+            ...
+            server.count("PUT", "/api/rqueue/")
+    """
+
+    def __init__(
+        self,
+        resources=None,
+        latency=0.0,
+        finish_after=1,
+        etag=False,
+        push=False,
+        page_size=None,
+        sparse_fields=False,
+        compress=False,
+    ):
+        """
+        :param resources: List of resource dictionaries, two free resources by default
+        :param latency: Seconds to sleep before answering every request
+        :param finish_after: Number of status checks of a queue (GETs of the queue, or listings
+            it is part of) after which it becomes FINISHED (INITIALIZING on the first one,
+            PENDING afterwards), None to never finish
+        :param etag: Send an ETag with every queue and resource listing, honour If-Match
+            on PUT of a queue and If-None-Match on GET of the listing
+        :param push: Serve the event stream of the queues, 404 otherwise
+        :param page_size: Paginate the rqueues listing ({"count", "next", "results"}, ?page=N)
+        :param sparse_fields: Honour ?fields= on the listings, ignore it otherwise
+        :param compress: Gzip the answers when the client accepts it
+        """
+        if resources is None:
+            resources = [
+                {"name": f"resource-{i}", "labels_string": "pool", "is_locked": False, "signoff": None}
+                for i in range(2)
+            ]
+        self.resources = {r["name"]: dict(r) for r in resources}
+        self.queues = {}
+        self.latency = latency
+        self.finish_after = finish_after
+        self.etag = etag
+        self.push = push
+        self.page_size = page_size
+        self.sparse_fields = sparse_fields
+        self.compress = compress
+        self.requests = []
+        self._queue_gets = collections.Counter()
+        self._failures = collections.deque()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._connections = set()
+        self._httpd = _HTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        # Clients dropping their keep-alive connections are not worth a traceback
+        self._httpd.handle_error = lambda request, client_address: None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving, the open keep-alive connections are closed too, so the clients
+            see the server going down like a real one
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def fail_next(self, count=1, status=503):
+        """
+        Answer the next requests with an error, whatever they ask for
+        :param count: Number of the requests to fail
+        :param status: Status code of the error
+        """
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests.clear()
+
+    def count(self, method=None, prefix=None):
+        """
+        Number of the received requests, optionally filtered
+        :param method: HTTP method to count
+        :param prefix: Path prefix to count
+        :return int:
+        """
+        with self._lock:
+            return sum(
+                1
+                for m, path in self.requests
+                if (method is None or m == method) and (prefix is None or path.startswith(prefix))
+            )
+
+    def create_queue(self, search_string, priority=1, signoff=None, link=None):
+        with self._lock:
+            queue_id = len(self.queues) + 1
+            self.queues[queue_id] = {
+                "id": queue_id,
+                "status": "INITIALIZING",
+                "priority": priority,
+                "time_requested": str(datetime.datetime.utcnow()),
+                "description": None,
+                "last_beat": None,
+                "data": json.dumps({"search_string": search_string, "signoff": signoff, "link": link}),
+                "_version": 1,
+            }
+            return self._public(self.queues[queue_id])
+
+    def set_status(self, queue_id, status):
+        with self._lock:
+            if status == "FINISHED":
+                self._finish(self.queues[queue_id])
+            else:
+                self.queues[queue_id]["status"] = status
+                self.queues[queue_id]["_version"] += 1
+            self._changed.notify_all()
+
+    def _finish(self, queue):
+        # Called with the lock held
+        queue["status"] = "FINISHED"
+        queue["_version"] += 1
+        data = json.loads(queue["data"])
+        search_string = data.get("search_string")
+        for resource in self.resources.values():
+            if not resource.get("is_locked") and (
+                resource["name"] == search_string or search_string in (resource.get("labels_string") or "").split()
+            ):
+                resource.update(
+                    is_locked=True, signoff=data.get("signoff"), locked_time=str(datetime.datetime.utcnow())
+                )
+                data["resource_locked"] = resource["name"]
+                queue["data"] = json.dumps(data)
+                return
+
+    @staticmethod
+    def _public(queue):
+        return {k: v for k, v in queue.items() if not k.startswith("_")}
+
+    def _progress(self, queue):
+        # Called with the lock held on every GET of a single queue and every listing of it
+        self._queue_gets[queue["id"]] += 1
+        if queue["status"] not in ("INITIALIZING", "PENDING"):
+            return
+        gets = self._queue_gets[queue["id"]]
+        if self.finish_after is not None and gets >= self.finish_after:
+            self._finish(queue)
+        elif gets > 1 and queue["status"] == "INITIALIZING":
+            queue["status"] = "PENDING"
+            queue["_version"] += 1
+        self._changed.notify_all()
+
+    def _filter_resources(self, query):
+        resources = list(self.resources.values())
+        if "signoff" in query:
+            return [r for r in resources if r.get("signoff") == query["signoff"][0]]
+        if query.get("free_only", ["false"])[0] == "true":
+            resources = [r for r in resources if not r.get("is_locked")]
+        if "label_matches" in query:
+            label = query["label_matches"][0]
+            resources = [r for r in resources if label in (r.get("labels_string") or "").split()]
+        if "name" in query:
+            resources = [r for r in resources if r["name"] == query["name"][0]]
+        return resources
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes, Nagle would hold the body for the delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server._connections.add(self.connection)
+
+            def finish(self):
+                with server._lock:
+                    server._connections.discard(self.connection)
+                super().finish()
+
+            def _send(self, code, payload, headers=None):
+                body = json.dumps(payload).encode("utf8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                if server.compress and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+                    body = gzip.compress(body)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _send_queue(self, queue):
+                headers = {"ETag": f'"{queue["_version"]}"'} if server.etag else None
+                self._send(200, server._public(queue), headers)
+
+            def _stream_events(self, queue_id):
+                # Wait for status changes of the queue, keep-alive comment every second
+                self.close_connection = True
+                with server._lock:
+                    queue = server.queues.get(queue_id)
+                    if queue is None:
+                        return self._send(404, {"detail": "Not found."})
+                    status = queue["status"]
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                try:
+                    while True:
+                        with server._lock:
+                            server._changed.wait_for(lambda: queue["status"] != status, timeout=1)
+                            changed = queue["status"] != status
+                            status = queue["status"]
+                            payload = json.dumps(server._public(queue))
+                        self.wfile.write(f"data: {payload}\n\n".encode("utf8") if changed else b": keep-alive\n\n")
+                        self.wfile.flush()
+                        if status not in ("INITIALIZING", "PENDING"):
+                            return
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                return json.loads(body or b"{}")
+
+            def _sparse(self, query, records):
+                if not server.sparse_fields or "fields" not in query:
+                    return records
+                fields = query["fields"][0].split(",")
+                return [{k: v for k, v in record.items() if k in fields} for record in records]
+
+            def _route(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                with server._lock:
+                    server.requests.append((self.command, self.path))
+                    failure = server._failures.popleft() if server._failures else None
+                if failure:
+                    self._body()
+                    self._send(failure, {"detail": "Injected failure."})
+                    return None
+                return urlsplit(self.path)
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_GET(self):
+                url = self._route()
+                if url is None:
+                    return
+                query = parse_qs(url.query)
+                if url.path in ("", "/"):
+                    return self._send(200, {"status": "ok"})
+                if url.path == "/api/resources":
+                    with server._lock:
+                        resources = self._sparse(query, server._filter_resources(query))
+                    if not server.etag:
+                        return self._send(200, resources)
+                    etag = f'"{hash(json.dumps(resources, sort_keys=True)) & 0xFFFFFFFF:x}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.send_header("Content-Length", "0")
+                        return self.end_headers()
+                    return self._send(200, resources, {"ETag": etag})
+                if url.path == "/api/rqueues":
+                    with server._lock:
+                        listed = [
+                            q for q in server.queues.values()
+                            if "status" not in query or q["status"] == query["status"][0]
+                        ]
+                        queues = self._sparse(query, [server._public(q) for q in listed])
+                        # Being listed counts as a status check of the queue as well
+                        for queue in listed:
+                            server._progress(queue)
+                    if not server.page_size:
+                        return self._send(200, queues)
+                    page = int(query.get("page", ["1"])[0])
+                    start = (page - 1) * server.page_size
+                    next_url = None
+                    if start + server.page_size < len(queues):
+                        next_query = {k: v[0] for k, v in query.items()}
+                        next_query["page"] = page + 1
+                        next_url = f"{server.url}{url.path}?{urlencode(next_query)}"
+                    return self._send(
+                        200,
+                        {"count": len(queues), "next": next_url, "results": queues[start:start + server.page_size]},
+                    )
+                match = re.match(r"^/api/rqueue/(\d+)/events$", url.path)
+                if match and server.push:
+                    return self._stream_events(int(match.group(1)))
+                match = re.match(r"^/api/rqueue/(\d+)$", url.path)
+                if match:
+                    with server._lock:
+                        queue = server.queues.get(int(match.group(1)))
+                        if queue is None:
+                            return self._send(404, {"detail": "Not found."})
+                        server._progress(queue)
+                        return self._send_queue(queue)
+                self._send(404, {"detail": "Not found."})
+
+            def do_PUT(self):
+                url = self._route()
+                if url is None:
+                    return
+                body = self._body()
+                match = re.match(r"^/api/resource/retrieve_entrypoint/(.+)$", url.path)
+                if match:
+                    return self._send(
+                        200,
+                        server.create_queue(
+                            unquote(match.group(1)), body.get("priority"), body.get("signoff"), body.get("link")
+                        ),
+                    )
+                match = re.match(r"^/api/resource/(.+)$", url.path)
+                if match:
+                    with server._lock:
+                        resource = server.resources.get(unquote(match.group(1)))
+                        if resource is None:
+                            return self._send(404, {"detail": "Not found."})
+                        resource.update(body)
+                        return self._send(200, dict(resource))
+                match = re.match(r"^/api/rqueue/(\d+)$", url.path)
+                if match:
+                    with server._lock:
+                        queue = server.queues.get(int(match.group(1)))
+                        if queue is None:
+                            return self._send(404, {"detail": "Not found."})
+                        if_match = self.headers.get("If-Match")
+                        if server.etag and if_match and if_match != f'"{queue["_version"]}"':
+                            return self._send(412, {"detail": "Precondition failed."})
+                        if "data" in body and not isinstance(body["data"], str):
+                            body["data"] = json.dumps(body["data"])
+                        queue.update(body)
+                        if set(body) - {"last_beat"}:
+                            queue["_version"] += 1
+                            server._changed.notify_all()
+                        return self._send_queue(queue)
+                self._send(404, {"detail": "Not found."})
+
+            # The updates merge the fields sent, a partial body is a PATCH
+            do_PATCH = do_PUT
+
+        return Handler
@@ -0,0 +1,53 @@
+"""
+Count the requests the client sends to the server per wait_until_finished cycle
+    and per change_queue call.
+Usage:
+    python -m benchmarks.request_count --cycles 20
+"""
+from argparse import ArgumentParser
+from benchmarks.fakeserver import FakeResourceLockerServer
+from rlockertools.resourcelocker import ResourceLocker
+from rlockertools.pollstrategy import FixedPollStrategy
+
+
+def count_wait_cycles(cycles):
+    with FakeResourceLockerServer(finish_after=cycles + 1) as server:
+        with ResourceLocker(server.url, "token") as locker:
+            queue_id = locker.find_resource("pool", signoff="bench", priority=1).json()["id"]
+            server.reset_counters()
+            # No sleep between the checks, the timeout (attempts * interval) is only a safety net
+            locker.wait_until_finished(
+                queue_id, interval=1, attempts=60, poll_strategy=FixedPollStrategy(0, warmup_interval=0)
+            )
+            # The last attempt only sees the queue FINISHED
+            return {
+                "total": server.count(),
+                "GET": server.count("GET"),
+                "HEAD": server.count("HEAD"),
+                "PUT": server.count("PUT"),
+                "per_attempt": round(server.count() / (cycles + 1), 2),
+            }
+
+
+def count_change_queue(calls, etag):
+    with FakeResourceLockerServer(finish_after=None, etag=etag) as server:
+        with ResourceLocker(server.url, "token") as locker:
+            queue_id = locker.find_resource("pool", signoff="bench", priority=1).json()["id"]
+            server.reset_counters()
+            for i in range(calls):
+                locker.change_queue(queue_id, "PENDING", step=i)
+            return {"total": server.count(), "GET": server.count("GET"), "PUT": server.count("PUT")}
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--cycles", type=int, default=20, help="Number of wait cycles to measure")
+    args = parser.parse_args()
+
+    print(f"wait_until_finished, {args.cycles} cycles: {count_wait_cycles(args.cycles)}")
+    for etag in (False, True):
+        print(f"change_queue x{args.cycles} (etag={etag}): {count_change_queue(args.cycles, etag)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Start-up time of the rlock CLI, for the short commands that run thousands of times a day.
+Every command is timed in a fresh interpreter, the time of a bare interpreter start
+    ("python -c pass") is subtracted, as it is not in the hands of the CLI:
+    - help: rlock --help
+    - agent_command: rlock check --agent-socket <missing socket>, the thin path to an agent
+    - import_client: importing the ResourceLocker, paid by every command talking to the server
+The "startup" section of benchmarks/thresholds.json holds the budget in milliseconds.
+Usage:
+    python -m benchmarks.startup --check
+"""
+from argparse import ArgumentParser
+from benchmarks.suite import THRESHOLDS_FILE, check
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CLI = [sys.executable, "-c", "from framework.main import main; main()"]
+COMMANDS = {
+    "help": CLI + ["--help"],
+    "agent_command": CLI + [
+        "check", "--agent-socket", "--agent-socket-path", os.path.join(tempfile.gettempdir(), "rlock-missing.sock")
+    ],
+    "import_client": [sys.executable, "-c", "import rlockertools.resourcelocker"],
+}
+
+
+def measure(command, runs):
+    """
+    :param command: Command line to run
+    :param runs: Number of runs
+    :return float: Median wall clock time in milliseconds
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def bench_startup(runs=15):
+    """
+    :param runs: Number of runs of every command
+    :return dict: Start-up time in milliseconds of every command on top of the interpreter
+    """
+    interpreter = measure([sys.executable, "-c", "pass"], runs)
+    results = {"interpreter_ms": round(interpreter, 1)}
+    for name, command in COMMANDS.items():
+        results[f"{name}_ms"] = round(max(measure(command, runs) - interpreter, 0), 1)
+    return results
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--runs", type=int, default=15, help="Number of runs of every command")
+    parser.add_argument("--check", action="store_true", help="Exit with 1 if a threshold is exceeded")
+    parser.add_argument("--thresholds", default=THRESHOLDS_FILE, help="JSON file of the thresholds")
+    args = parser.parse_args()
+
+    results = {"startup": bench_startup(args.runs)}
+    print(json.dumps(results, indent=2))
+    if args.check:
+        with open(args.thresholds) as f:
+            regressions = check(results, json.load(f))
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
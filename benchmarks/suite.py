@@ -0,0 +1,149 @@
+"""
+Benchmark suite of the client against the in-process fake server, meant to catch
+    regressions of the request volume, latency and resource usage before a release.
+Measures:
+    - requests per lock: find_resource + wait_until_finished + release of one resource
+    - time to lock: wall clock from find_resource until wait_until_finished returns
+    - CPU and memory per waiter, and the throughput of N concurrent wait_until_finished
+        callers sharing one client (the server runs in the same process, so its share
+        is included in the CPU and memory figures)
+Every metric is compared to benchmarks/thresholds.json with --check, a value above its
+    threshold is a regression and makes the suite exit with status 1.
+Usage:
+    python -m benchmarks.suite --waiters 50 --check
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.fakeserver import FakeResourceLockerServer
+from rlockertools.resourcelocker import ResourceLocker
+from rlockertools.pollstrategy import FixedPollStrategy
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+
+
+def _lock(locker, interval, attempts):
+    # attempts * interval is the timeout, the waiting ends at FINISHED anyway
+    start = time.monotonic()
+    queue_id = locker.find_resource("pool", signoff="bench", priority=1).json()["id"]
+    queue = locker.wait_until_finished(
+        queue_id,
+        interval=interval,
+        attempts=attempts,
+        poll_strategy=FixedPollStrategy(interval, warmup_interval=interval),
+    )
+    return time.monotonic() - start, queue
+
+
+def bench_single_lock(finish_after=3, latency=0.0, interval=0.01):
+    """
+    One lock from the queue creation until the release of the resource
+    :param finish_after: Status checks until the fake server finishes the queue
+    :param latency: Latency of every answer of the fake server
+    :param interval: Seconds between the status checks
+    :return dict:
+    """
+    resources = [{"name": "resource-0", "labels_string": "pool", "is_locked": True, "signoff": "bench"}]
+    with FakeResourceLockerServer(resources=resources, latency=latency, finish_after=finish_after) as server:
+        with ResourceLocker(server.url, "token") as locker:
+            time_to_lock, _ = _lock(locker, interval, 100 * (finish_after + 1))
+            locker.release(locker.get_lockable_resources(signoff="bench")[0])
+            return {
+                "requests_per_lock": server.count(),
+                "time_to_lock": round(time_to_lock, 4),
+                "overhead_per_status_check": round((time_to_lock - finish_after * interval) / finish_after, 4),
+            }
+
+
+def _run_waiters(waiters, finish_after, latency, interval):
+    with FakeResourceLockerServer(latency=latency, finish_after=finish_after) as server:
+        with ResourceLocker(server.url, "token", pool_maxsize=waiters) as locker:
+            start = time.monotonic()
+            with ThreadPoolExecutor(max_workers=waiters) as executor:
+                results = list(
+                    executor.map(lambda _: _lock(locker, interval, 100 * (finish_after + 1)), range(waiters))
+                )
+            return time.monotonic() - start, results, server.count()
+
+
+def bench_concurrent_waiters(waiters=50, finish_after=5, latency=0.0, interval=0.05):
+    """
+    waiters concurrent wait_until_finished callers sharing one client. The memory is
+        measured by a second run, as tracing the allocations slows everything down
+    :param waiters: Number of concurrent callers
+    :param finish_after: Status checks until the fake server finishes every queue
+    :param latency: Latency of every answer of the fake server
+    :param interval: Seconds between the status checks
+    :return dict:
+    """
+    cpu_start = time.process_time()
+    wall, results, requests = _run_waiters(waiters, finish_after, latency, interval)
+    cpu = time.process_time() - cpu_start
+
+    tracemalloc.start()
+    _run_waiters(waiters, finish_after, latency, interval)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = sorted(result[0] for result in results)
+    return {
+        "waiters": waiters,
+        "finished": sum(1 for _, queue in results if queue),
+        "wall_time": round(wall, 3),
+        "locks_per_second": round(waiters / wall, 1),
+        "time_to_lock_p50": round(times[len(times) // 2], 4),
+        "time_to_lock_max": round(times[-1], 4),
+        "requests_per_waiter": round(requests / waiters, 2),
+        "cpu_ms_per_waiter": round(cpu * 1000 / waiters, 2),
+        "peak_kib_per_waiter": round(peak / 1024 / waiters, 1),
+    }
+
+
+def check(results, thresholds):
+    """
+    :param results: dict of benchmark name -> dict of metric -> value
+    :param thresholds: Same shape, with the maximal accepted values
+    :return list: Descriptions of the metrics above their thresholds
+    """
+    regressions = []
+    for bench, limits in thresholds.items():
+        for metric, limit in limits.items():
+            value = results.get(bench, {}).get(metric)
+            if value is not None and value > limit:
+                regressions.append(f"{bench}.{metric} = {value} > {limit}")
+    return regressions
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--waiters", type=int, default=50, help="Number of concurrent waiters")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latency of the fake server in seconds")
+    parser.add_argument("--check", action="store_true", help="Exit with 1 if a threshold is exceeded")
+    parser.add_argument("--thresholds", default=THRESHOLDS_FILE, help="JSON file of the thresholds")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {
+        "single_lock": bench_single_lock(latency=args.latency),
+        "concurrent_waiters": bench_concurrent_waiters(waiters=args.waiters, latency=args.latency),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.check:
+        with open(args.thresholds) as f:
+            regressions = check(results, json.load(f))
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,46 @@
-import json
 import os
-import signal
-import pprint as pp
-import time
-import logging
-from urllib.parse import quote
-from requests.exceptions import ConnectionError
-from argparse import ArgumentParser
-from rlockertools.resourcelocker import ResourceLocker
 import sys
+from argparse import SUPPRESS, ArgumentParser
 
-# Configure logging for the rlockertools library
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# Heavy modules (requests through rlockertools) are imported by the functions that need them,
+# so --help and the commands sent to an agent do not pay for them
 
+# Subcommand -> the legacy action flag it stands for
+COMMANDS = {
+    "lock": "lock",
+    "release": "release",
+    "release-all": "release_all",
+    "check": "check",
+    "estimate": "estimate",
+    "agent": "agent",
+}
+# Same names as rlockertools.pollstrategy.POLL_STRATEGIES and rlockertools.waittransport.WAIT_TRANSPORTS
+# (not imported for --help to stay fast), tests/test_main.py checks that they match
+POLL_STRATEGY_CHOICES = ("fixed", "exponential", "position")
+WAIT_TRANSPORT_CHOICES = ("poll", "stream")
 
-def init_argparser():
-    """
-    Initialization  of argument parse library with it's arguments
-    Args:
-        None
-
-    Returns:
-        object: Parsed arguments - returned from parser.parse_args()
-    """
 
-    parser = ArgumentParser()
+def _add_connection_arguments(parser):
     parser.add_argument(
         "--server-url",
-        help="The URL of the Resource Locker Server",
-        required=True,
+        help="The URL of the Resource Locker Server, required unless the actions are sent to an agent",
         action="store",
     )
     parser.add_argument(
         "--token",
-        help="Token of the user that creates API calls",
-        required=True,
+        help="Token of the user that creates API calls, required unless the actions are sent to an agent",
         action="store",
     )
     parser.add_argument(
-        "--release", help="Use this argument to release a resource", action="store_true"
-    )
-    parser.add_argument(
-        "--lock", help="Use this argument to lock a resource", action="store_true"
+        "--agent-socket",
+        help="Send the actions to the agent listening on --agent-socket-path instead of the server",
+        action="store_true",
     )
     parser.add_argument(
-        "--check", help="Use this to check if a resource is available", action="store_true"
+        "--agent-socket-path",
+        help="Socket the agent listens on (default: rlock-agent.sock in $XDG_RUNTIME_DIR "
+        "or the temporary directory)",
+        action="store",
     )
     parser.add_argument(
         "--resume-on-connection-error", help=(
@@ -56,6 +48,28 @@ def init_argparser():
             " in the middle of waiting for queue status being FINISHED"
         ), action="store_true"
     )
+    parser.add_argument(
+        "--rate-limit",
+        help="Maximal number of requests per second to each endpoint of the server (bursts of as many)",
+        type=float,
+        action="store",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help="Write the metrics of the requests (per endpoint counters, latencies, retries, bytes "
+        "and the time to lock) to this file when exiting",
+        action="store",
+    )
+    parser.add_argument(
+        "--metrics-format",
+        help="Use this with --metrics-file, format of the metrics file",
+        choices=["json", "prometheus"],
+        default="json",
+        action="store",
+    )
+
+
+def _add_lock_arguments(parser):
     parser.add_argument(
         "--signoff",
         help="Use this when lock=True, locking a resource requires signoff",
@@ -71,6 +85,13 @@ def init_argparser():
         help="Use this when lock=True or check=True, specify the label or the name of the lockable resource",
         action="store",
     )
+    parser.add_argument(
+        "--any-of",
+        help="Use this when lock=True, another acceptable label or name (repeatable): a queue is submitted "
+        "for --search-string and every --any-of at once, the first FINISHED one is kept and the others "
+        "are aborted (--poll-strategy and --wait-transport do not apply)",
+        action="append",
+    )
     parser.add_argument(
         "--link",
         help="Use this when lock=True, specify the link of the CI/CD pipeline that locks the resource",
@@ -85,12 +106,189 @@ def init_argparser():
     )
     parser.add_argument(
         "--attempts",
-        help="Use this when lock=True, how many times to create an API call"
-        " that will check for a free resource ",
+        help="Use this when lock=True, the timeout of the waiting for a free resource"
+        " is attempts * interval seconds",
+        type=int,
+        action="store",
+    )
+    parser.add_argument(
+        "--poll-strategy",
+        help="Use this when lock=True, how to space the checks of the queue status: "
+        "fixed (every interval seconds), exponential (quick at first, backing off up to interval) "
+        "or position (according to the position of the queue among the PENDING queues)",
+        choices=POLL_STRATEGY_CHOICES,
+        default="fixed",
+        action="store",
+    )
+    parser.add_argument(
+        "--wait-transport",
+        help="Use this when lock=True, how to wait between the checks of the queue status: "
+        "poll (sleep) or stream (server pushed events, falls back to poll if the server does not support it)",
+        choices=WAIT_TRANSPORT_CHOICES,
+        default="poll",
+        action="store",
+    )
+    parser.add_argument(
+        "--heartbeat-interval",
+        help="Use this when lock=True, beat the queue every given seconds from a background thread, "
+        "independently from the checks of the queue status",
         type=int,
         action="store",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--resume",
+        help="Use this when lock=True, reattach to the queue a previous run submitted with the same "
+        "search string and signoff (found in the journal) if it is still waiting, instead of submitting a new one",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--journal",
+        help="Use this when lock=True, journal of the submitted queues "
+        "(default: rlockertools/journal.jsonl in $XDG_STATE_HOME or ~/.local/state)",
+        action="store",
+    )
+
+
+def _add_estimate_arguments(parser):
+    parser.add_argument(
+        "--queue-id",
+        help="Use this when estimate=True, queue to estimate (a new queue of --search-string by default)",
+        type=int,
+        action="store",
+    )
+    parser.add_argument(
+        "--analytics-state",
+        help="Use this when estimate=True, file of the aggregated history of the FINISHED queues, "
+        "so only the queues finished since the previous run are accounted "
+        "(default: rlockertools/analytics.json in $XDG_STATE_HOME or ~/.local/state)",
+        action="store",
+    )
+
+
+def _suppress_defaults(parser):
+    """
+    The options of a subcommand are also options of rlock itself, they only override the value
+        given before the subcommand when they are given after it (rlock --output json check ...)
+    :param parser: ArgumentParser of the subcommand
+    :return: The parser
+    """
+    for action in parser._actions:
+        if action.dest != "help":
+            action.default = SUPPRESS
+    return parser
+
+
+def init_argparser(argv=None):
+    """
+    Initialization  of argument parse library with it's arguments.
+    Both the subcommands (rlock lock --signoff ...) and the action flags
+        (rlock --lock --signoff ...) are accepted
+    Args:
+        argv (list): Arguments to parse, sys.argv[1:] by default
+
+    Returns:
+        object: Parsed arguments - returned from parser.parse_args()
+    """
+
+    parser = ArgumentParser(
+        prog="rlock",
+        epilog="Run rlock <command> --help for the arguments of a command",
+    )
+    parser.add_argument(
+        "--release", help="Use this argument to release a resource", action="store_true"
+    )
+    parser.add_argument(
+        "--release-all",
+        help="Use this argument to release all the resources locked with the given signoff",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--lock", help="Use this argument to lock a resource", action="store_true"
+    )
+    parser.add_argument(
+        "--check", help="Use this to check if a resource is available", action="store_true"
+    )
+    parser.add_argument(
+        "--estimate",
+        help="Use this to estimate the position and the wait of a queue (--queue-id) "
+        "or of a new queue of --search-string",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--output",
+        help="Use this when check=True or estimate=True, format of the output: text or json "
+        "(check: one object with the resources, and the names matching by name and by label)",
+        choices=["text", "json"],
+        default="text",
+        action="store",
+    )
+    parser.add_argument(
+        "--agent",
+        help="Run as an agent serving the rlock invocations of this host over --agent-socket-path, "
+        "with one connection pool and one status polling loop for all of them",
+        action="store_true",
+    )
+    _add_connection_arguments(parser)
+    _add_lock_arguments(parser)
+    _add_estimate_arguments(parser)
+
+    commands = parser.add_subparsers(dest="command", metavar="{" + ",".join(COMMANDS) + "}")
+    lock = commands.add_parser("lock", help="Add a queue for locking a resource and wait for it")
+    _add_connection_arguments(lock)
+    _add_lock_arguments(lock)
+    for name, help_text in (
+        ("release", "Release the resource locked with the signoff"),
+        ("release-all", "Release all the resources locked with the signoff"),
+    ):
+        release = commands.add_parser(name, help=help_text)
+        _add_connection_arguments(release)
+        release.add_argument("--signoff", help="Signoff the resources were locked with", action="store")
+    check = commands.add_parser("check", help="Check if a resource is available")
+    _add_connection_arguments(check)
+    check.add_argument(
+        "--search-string", help="The label or the name of the lockable resource", action="store"
+    )
+    check.add_argument(
+        "--output", help="Format of the available resources", choices=["text", "json"], default="text"
+    )
+    estimate = commands.add_parser(
+        "estimate", help="Estimate the position and the wait of a queue, or of a new queue of a search string"
+    )
+    _add_connection_arguments(estimate)
+    estimate.add_argument(
+        "--search-string", help="The label or the name of the lockable resource", action="store"
+    )
+    _add_estimate_arguments(estimate)
+    estimate.add_argument(
+        "--output", help="Format of the estimate", choices=["text", "json"], default="text"
+    )
+    agent = commands.add_parser(
+        "agent", help="Serve the rlock invocations of this host over --agent-socket-path"
+    )
+    _add_connection_arguments(agent)
+    agent.add_argument(
+        "--interval", help="Seconds between the checks of the waiting queues", type=int, action="store"
+    )
+    agent.add_argument(
+        "--heartbeat-interval",
+        help="Beat the waiting queues every given seconds from a background thread",
+        type=int,
+        action="store",
+    )
+
+    for subparser in commands.choices.values():
+        _suppress_defaults(subparser)
+
+    args = parser.parse_args(argv)
+    if args.command:
+        setattr(args, COMMANDS[args.command], True)
+    if not any(getattr(args, action) for action in COMMANDS.values()):
+        parser.error(f"one of the commands {', '.join(COMMANDS)} (or their --action flags) is required")
+    if args.agent or not args.agent_socket:
+        missing = [flag for flag, value in (("--server-url", args.server_url), ("--token", args.token)) if not value]
+        if missing:
+            parser.error(f"the following arguments are required: {', '.join(missing)}")
+    return args
 
 
 def run(args):
@@ -103,90 +301,575 @@ def run(args):
     Returns:
         None
     """
+    from rlockertools.metrics import Metrics
+
+    metrics = Metrics() if args.metrics_file else None
+    try:
+        if args.agent:
+            _run_agent(args, metrics)
+        else:
+            _run_resuming(args, metrics)
+    finally:
+        if metrics is not None:
+            metrics.write(args.metrics_file, args.metrics_format)
+
+
+def _run_resuming(args, metrics=None):
+    import time
+    from requests.exceptions import ConnectionError
+    from rlockertools.circuitbreaker import jittered
+
+    resume = args.resume
+    while True:
+        try:
+            _run(args, metrics, resume)
+            return
+        except (ConnectionError) as e:
+            print(
+                "Connection Error! \n"
+                "Error is: \n"
+                f"{str(e)}"
+            )
+            if not args.resume_on_connection_error:
+                print("You chose to NOT continue on connection errors. \n"
+                      "To prevent this, you can run next time with --resume-on-connection-error! \n"
+                      "Exiting ... ")
+                return
+            # Jittered, so the pipelines cut off by the same outage do not come back all at once
+            delay = jittered(args.interval or 15)
+            print(f"You chose to continue on connection errors, will try again in {delay:.0f} seconds!")
+            time.sleep(delay)
+            # The queue submitted before the connection error is reattached to
+            resume = True
+        except Exception:
+            print("An unexpected error occured!")
+            raise
+
+
+def _run(args, metrics=None, resume=False):
+    """
+    One pass of the actions, connection errors are left to run()
+    Args:
+        args (object): Parsed arguments - returned from parser.parse_args()
+        metrics (Metrics): Optional metrics to record the requests to
+        resume (bool): Reattach to the queue of a previous run found in the journal
+    """
+    import pprint as pp
+    import signal
+    import time
+    from urllib.parse import quote
+    from requests.exceptions import ConnectionError
+    from rlockertools.resourcelocker import ResourceLocker
+    from rlockertools.pollstrategy import get_poll_strategy
+    from rlockertools.waittransport import get_wait_transport
+    from rlockertools.heartbeater import Heartbeater
+
+    # Instantiate the connection vs Resource locker:
+    inst = ResourceLocker(
+        instance_url=args.server_url, token=args.token, metrics=metrics, rate_limiter=_rate_limiter(args)
+    )
+    if args.release:
+        resource_to_release = inst.get_lockable_resources(signoff=args.signoff)
+        if resource_to_release:
+            release_attempt = inst.release(resource_to_release[0])
+            print(release_attempt.text)
+        else:
+            print(f"There is no resource: {args.signoff} locked, ignoring!")
+
+    if args.release_all:
+        resources_to_release = inst.get_lockable_resources(signoff=args.signoff)
+        if resources_to_release:
+            for name, release_attempt in inst.release_many(resources_to_release).items():
+                print(f"{name}: {getattr(release_attempt, 'text', release_attempt)}")
+        else:
+            print(f"There is no resource: {args.signoff} locked, ignoring!")
+
+    if args.lock and args.any_of:
+        verify_lock = _lock_any(inst, _open_journal(args.journal), args, resume)
+        print("Resource Locked Successfully! Info: \n")
+        pp.pprint(verify_lock)
+
+    elif args.lock:
+        journal = _open_journal(args.journal)
+        queue_id = None
+        if resume and journal:
+            resumed = _resumable_queue(inst, journal, args.search_string, args.signoff)
+            queue_id = resumed["id"] if resumed else None
+        if queue_id is None:
+            link = quote(args.link, safe="") if args.link else None
+            new_queue = inst.find_resource(
+                search_string=args.search_string,
+                signoff=args.signoff,
+                priority=int(args.priority),
+                link=link,
+            )
+            queue_id = new_queue.json().get("id")
+            _journal_record(
+                journal,
+                queue_id,
+                search_string=args.search_string,
+                signoff=args.signoff,
+                priority=int(args.priority),
+                link=link,
+                submitted=time.time(),
+                status=new_queue.json().get("status"),
+            )
+        # Save the queue id in a file
+        with open("queue_id.log", "w") as f:
+            f.write(f"{queue_id}")
+        # We should verify that the resource has been locked by checking
+        # if the queue is finished.
+        # timeout is -> attempts * interval
+
+        abort_action = inst.abort_queue
+        abort_action_args = {
+            "queue_id": queue_id,
+            "abort_msg": "Queue has been aborted in the middle of a CI/CD Pipeline \n"
+            "or during manual execution.",
+        }
+        heartbeater = None
+        if args.heartbeat_interval:
+            heartbeater = Heartbeater(inst, interval=args.heartbeat_interval)
+            heartbeater.start()
+
+        def signal_handler(sig, frame):
+            if heartbeater:
+                heartbeater.stop()
+            abort_action(**abort_action_args)
+            _journal_record(journal, queue_id, status="ABORTED")
+            sys.exit(0)
+
+        signal.signal(signal.SIGTERM, signal_handler)
+        signal.signal(signal.SIGINT, signal_handler)
+
+        try:
+            verify_lock = inst.wait_until_finished(
+                queue_id=queue_id,
+                interval=args.interval,
+                attempts=args.attempts,
+                silent=False,
+                abort_on_timeout=True,
+                resume_on_connection_error=args.resume_on_connection_error,
+                poll_strategy=get_poll_strategy(args.poll_strategy, inst, args.interval),
+                wait_transport=get_wait_transport(args.wait_transport),
+                heartbeater=heartbeater,
+            )
+        except ConnectionError:
+            # Still waiting on the server, the queue is resumed
+            raise
+        except Exception:
+            # Aborted by the timeout, FAILED, or given up on, it is not resumable anymore
+            _journal_record(journal, queue_id, status="ABORTED")
+            raise
+        finally:
+            if heartbeater:
+                heartbeater.stop()
+        # If it will return any object, it means the condition is achieved:
+        if verify_lock:
+            _journal_record(journal, queue_id, status=verify_lock.get("status"))
+            print("Resource Locked Successfully! Info: \n")
+            # We print json response, it is better to visualize it nicer:
+            pp.pprint(verify_lock)
+
+    if args.check:
+        _print_available(inst.find_available(args.search_string), args.output)
+
+    if args.estimate:
+        _print_estimate(_estimate(inst, args), args.output)
+
+
+def _rate_limiter(args):
+    """
+    RateLimiter of --rate-limit, None without it
+    """
+    if not args.rate_limit:
+        return None
+    from rlockertools.ratelimiter import RateLimiter
+
+    return RateLimiter(default=args.rate_limit)
+
+
+def _open_journal(path):
+    """
+    The journal of the queues, None if it cannot be used (e.g. read-only home directory, Windows)
+    """
+    from rlockertools.journal import DEFAULT_JOURNAL, Journal
+
+    try:
+        return Journal(path or DEFAULT_JOURNAL)
+    except (OSError, NotImplementedError) as e:
+        print(f"The journal cannot be used, the queue will not be resumable: {str(e)}")
+        return None
+
+
+def _journal_record(journal, queue_id, **fields):
+    if journal is None:
+        return
+    try:
+        journal.record(queue_id, **fields)
+    except OSError as e:
+        print(f"Could not write to the journal {journal.path}: {str(e)}")
+
+
+def _resumable_queue(inst, journal, search_string, signoff):
+    """
+    The queue of a previous run with the same search string and signoff, if it is still waiting
+        (or already FINISHED) on the server
+    Returns:
+        The queue JSON to reattach to, None to submit a new queue
+    """
+    entry = journal.find_resumable(search_string, signoff)
+    if entry is None:
+        return None
+    queue = inst.get_queue(entry["queue_id"])
+    status = queue.get("status") if queue else None
+    if status in ("INITIALIZING", "PENDING", "FINISHED"):
+        print(f"Resuming the queue {entry['queue_id']} ({status}) instead of submitting a new one")
+        return queue
+    _journal_record(journal, entry["queue_id"], status=status or "ABORTED")
+    return None
+
+
+def _lock_any(inst, journal, args, resume=False):
+    """
+    --lock with --any-of: a queue for every search string, waited on in one loop,
+        the first FINISHED one is kept and the others are aborted
+    Returns:
+        The FINISHED queue
+    """
+    import signal
+    import time
+    from urllib.parse import quote
+    from requests.exceptions import ConnectionError
+    from rlockertools.heartbeater import Heartbeater
+
+    search_strings = list(dict.fromkeys(([args.search_string] if args.search_string else []) + args.any_of))
+    link = quote(args.link, safe="") if args.link else None
+    queues = {}
+    if resume and journal:
+        for search_string in search_strings:
+            resumed = _resumable_queue(inst, journal, search_string, args.signoff)
+            if resumed:
+                queues[search_string] = resumed
+    missing = [search_string for search_string in search_strings if search_string not in queues]
+    if missing:
+        submitted = inst.submit_queues(missing, signoff=args.signoff, priority=int(args.priority), link=link)
+        for search_string, queue in submitted.items():
+            _journal_record(
+                journal,
+                queue.get("id"),
+                search_string=search_string,
+                signoff=args.signoff,
+                priority=int(args.priority),
+                link=link,
+                submitted=time.time(),
+                status=queue.get("status"),
+            )
+        queues.update(submitted)
+    # In the order of preference
+    queues = [queues[search_string] for search_string in search_strings if search_string in queues]
+    with open("queue_id.log", "w") as f:
+        f.write("\n".join(str(queue.get("id")) for queue in queues))
+
+    heartbeater = None
+    if args.heartbeat_interval:
+        heartbeater = Heartbeater(inst, interval=args.heartbeat_interval)
+        heartbeater.start()
+
+    def signal_handler(sig, frame):
+        if heartbeater:
+            heartbeater.stop()
+        for queue in queues:
+            inst.abort_queue(
+                queue_id=queue.get("id"),
+                abort_msg="Queue has been aborted in the middle of a CI/CD Pipeline \n"
+                "or during manual execution.",
+            )
+            _journal_record(journal, queue.get("id"), status="ABORTED")
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGINT, signal_handler)
+
+    try:
+        verify_lock = inst.wait_until_any_finished(
+            queues,
+            interval=args.interval or 15,
+            attempts=args.attempts or 120,
+            abort_on_timeout=True,
+            resume_on_connection_error=args.resume_on_connection_error,
+            heartbeater=heartbeater,
+        )
+    except ConnectionError:
+        raise
+    except Exception:
+        for queue in queues:
+            _journal_record(journal, queue.get("id"), status="ABORTED")
+        raise
+    finally:
+        if heartbeater:
+            heartbeater.stop()
+    for queue in queues:
+        _journal_record(
+            journal, queue.get("id"), status="FINISHED" if queue.get("id") == verify_lock.get("id") else "ABORTED"
+        )
+    with open("queue_id.log", "w") as f:
+        f.write(f"{verify_lock.get('id')}")
+    return verify_lock
+
+
+def _print_available(found, output="text"):
+    """
+    Print the result of find_available, exits with 3 if no resource is available
+    Args:
+        found (dict): Returned from ResourceLocker.find_available()
+        output (str): text or json
+    """
+    import json
+
+    if output == "json":
+        print(json.dumps(found))
+    elif found["resources"]:
+        print("Resources are available:")
+        for resource in found["resources"]:
+            matches = [key[3:] for key in ("by_name", "by_label") if resource["name"] in found[key]]
+            print(f"{resource['name']} (by {', '.join(matches)}): {json.dumps(resource)}")
+    else:
+        print("No resource available.")
+    if not found["resources"]:
+        sys.exit(3)
+
+
+def _estimate(inst, args):
+    """
+    QueueAnalytics.estimate, with the aggregates kept in the analytics state file between the runs
+    """
+    from rlockertools.queueanalytics import DEFAULT_STATE, QueueAnalytics
+
+    path = args.analytics_state or DEFAULT_STATE
+    try:
+        analytics = QueueAnalytics(inst, path=path)
+    except OSError as e:
+        print(f"The analytics state cannot be read, the whole history will be accounted: {str(e)}")
+        analytics = QueueAnalytics(inst)
+    estimate = analytics.estimate(queue_id=args.queue_id, search_string=args.search_string)
+    try:
+        analytics.save(path)
+    except OSError as e:
+        print(f"Could not write the analytics state {path}: {str(e)}")
+    return estimate
+
+
+def _print_estimate(estimate, output="text"):
+    """
+    Args:
+        estimate (dict): Returned from QueueAnalytics.estimate()
+        output (str): text or json
+    """
+    import json
+
+    if output == "json":
+        print(json.dumps(estimate))
+        return
+    if estimate["queue_id"] is not None:
+        print(f"Queue {estimate['queue_id']} ({estimate['status']}) for {estimate['search_string']}")
+    else:
+        print(f"New queue for {estimate['search_string']}")
+    print(
+        f"Position: {estimate['position']} "
+        f"({estimate['free_resources']}/{estimate['total_resources']} resources free)"
+    )
+    if estimate["estimated_wait"] is None:
+        print("Estimated wait: unknown, there is no history of FINISHED queues")
+    else:
+        print(f"Estimated wait: {estimate['estimated_wait']:.0f} seconds")
+    history = estimate["history"]
+    if history["count"]:
+        print(
+            f"History: {history['count']} FINISHED queues, "
+            f"median wait {history['p50_wait']:.0f} seconds, 90th percentile {history['p90_wait']:.0f} seconds"
+        )
+
+
+def _run_agent(args, metrics=None):
+    """
+    Serve the rlock invocations of the host until SIGTERM/SIGINT
+    Args:
+        args (object): Parsed arguments - returned from parser.parse_args()
+        metrics (Metrics): Optional metrics to record the requests to
+    """
+    import signal
+    from rlockertools.resourcelocker import ResourceLocker
+    from rlockertools.heartbeater import Heartbeater
+    from rlockertools.agent import Agent
+    from rlockertools.agentclient import DEFAULT_SOCKET
+
+    # The jobs of the host often ask for the same queue or listing at once
+    with ResourceLocker(
+        instance_url=args.server_url,
+        token=args.token,
+        metrics=metrics,
+        rate_limiter=_rate_limiter(args),
+        coalesce_gets=True,
+    ) as inst:
+        heartbeater = None
+        if args.heartbeat_interval:
+            heartbeater = Heartbeater(inst, interval=args.heartbeat_interval)
+            heartbeater.start()
+        agent = Agent(
+            inst,
+            socket_path=args.agent_socket_path or DEFAULT_SOCKET,
+            interval=args.interval or 15,
+            heartbeater=heartbeater,
+        )
+
+        def signal_handler(sig, frame):
+            agent.stop()
+
+        signal.signal(signal.SIGTERM, signal_handler)
+        signal.signal(signal.SIGINT, signal_handler)
+        try:
+            agent.serve_forever()
+        finally:
+            agent.stop()
+            if heartbeater:
+                heartbeater.stop()
+
+
+def run_via_agent(args):
+    """
+    Same actions as run(), sent to the agent listening on args.agent_socket_path
+    Args:
+        args (object): Parsed arguments - returned from parser.parse_args()
+    """
+    import pprint as pp
+    import signal
+    from urllib.parse import quote
+    from rlockertools.agentclient import DEFAULT_SOCKET, AgentClient, AgentError
+
+    if not any((args.lock, args.release, args.release_all, args.check, args.estimate)):
+        print("No action to send to the agent: use lock, release, release-all, check or estimate")
+        sys.exit(2)
+    socket_path = args.agent_socket_path or DEFAULT_SOCKET
+    client = AgentClient(socket_path)
     try:
-        # Instantiate the connection vs Resource locker:
-        inst = ResourceLocker(instance_url=args.server_url, token=args.token)
         if args.release:
-            resource_to_release = inst.get_lockable_resources(signoff=args.signoff)
-            if resource_to_release:
-                release_attempt = inst.release(resource_to_release[0])
-                print(release_attempt.text)
+            release_attempt = client.request("release", signoff=args.signoff)
+            if release_attempt:
+                print(release_attempt["text"])
             else:
                 print(f"There is no resource: {args.signoff} locked, ignoring!")
 
-        if args.lock:
-            new_queue = inst.find_resource(
+        if args.release_all:
+            release_attempts = client.request("release_all", signoff=args.signoff)
+            if release_attempts:
+                for name, release_attempt in release_attempts.items():
+                    print(f"{name}: {release_attempt}")
+            else:
+                print(f"There is no resource: {args.signoff} locked, ignoring!")
+
+        if args.lock and args.any_of:
+            search_strings = list(dict.fromkeys(([args.search_string] if args.search_string else []) + args.any_of))
+            queues = [
+                client.request(
+                    "enqueue",
+                    search_string=search_string,
+                    signoff=args.signoff,
+                    priority=int(args.priority),
+                    link=quote(args.link, safe="") if args.link else None,
+                )
+                for search_string in search_strings
+            ]
+            with open("queue_id.log", "w") as f:
+                f.write("\n".join(str(queue.get("id")) for queue in queues))
+
+            def signal_handler(sig, frame):
+                for queue in queues:
+                    client.request(
+                        "abort",
+                        queue_id=queue.get("id"),
+                        abort_msg="Queue has been aborted in the middle of a CI/CD Pipeline \n"
+                        "or during manual execution.",
+                    )
+                sys.exit(0)
+
+            signal.signal(signal.SIGTERM, signal_handler)
+            signal.signal(signal.SIGINT, signal_handler)
+
+            wait_args = {"queues": queues, "abort_on_timeout": True}
+            if args.attempts:
+                wait_args["attempts"] = args.attempts
+            if args.interval:
+                wait_args["interval"] = args.interval
+            verify_lock = client.request("wait_any", **wait_args)
+            with open("queue_id.log", "w") as f:
+                f.write(f"{verify_lock.get('id')}")
+            print("Resource Locked Successfully! Info: \n")
+            pp.pprint(verify_lock)
+
+        elif args.lock:
+            new_queue = client.request(
+                "enqueue",
                 search_string=args.search_string,
                 signoff=args.signoff,
                 priority=int(args.priority),
                 link=quote(args.link, safe="") if args.link else None,
             )
-            # Save the queue id in a file
             with open("queue_id.log", "w") as f:
-                f.write(f"{new_queue.json().get('id')}")
-            # We should verify that the resource has been locked by checking
-            # if the queue is finished.
-            # timeout is -> attempts * interval
-
-            abort_action = inst.abort_queue
-            abort_action_args = {
-                "queue_id": new_queue.json().get("id"),
-                "abort_msg": "Queue has been aborted in the middle of a CI/CD Pipeline \n"
-                "or during manual execution.",
-            }
+                f.write(f"{new_queue.get('id')}")
 
             def signal_handler(sig, frame):
-                abort_action(**abort_action_args)
+                client.request(
+                    "abort",
+                    queue_id=new_queue.get("id"),
+                    abort_msg="Queue has been aborted in the middle of a CI/CD Pipeline \n"
+                    "or during manual execution.",
+                )
                 sys.exit(0)
 
             signal.signal(signal.SIGTERM, signal_handler)
             signal.signal(signal.SIGINT, signal_handler)
 
-            verify_lock = inst.wait_until_finished(
-                queue_id=new_queue.json().get("id"),
-                interval=args.interval,
-                attempts=args.attempts,
-                silent=False,
-                abort_on_timeout=True,
-                resume_on_connection_error=args.resume_on_connection_error,
-            )
-            # If it will return any object, it means the condition is achieved:
+            wait_args = {"queue_id": new_queue.get("id"), "abort_on_timeout": True}
+            if args.attempts:
+                wait_args["attempts"] = args.attempts
+            if args.interval:
+                wait_args["interval"] = args.interval
+            verify_lock = client.request("wait", **wait_args)
             if verify_lock:
                 print("Resource Locked Successfully! Info: \n")
-                # We print json response, it is better to visualize it nicer:
                 pp.pprint(verify_lock)
 
         if args.check:
-            resources_by_name = inst.get_lockable_resources(name=args.search_string)
-            resources_by_label = inst.get_lockable_resources(label_matches=args.search_string)
-            if (resources_by_name or resources_by_label):
-                print("Resources are available:")
-                print(f"by name: {json.dumps(resources_by_name)}")
-                print(f"by label: {json.dumps(resources_by_label)}")
-            else:
-                print("No resource available.")
-                sys.exit(3)
+            _print_available(client.request("check", search_string=args.search_string), args.output)
 
-    except (ConnectionError) as e:
+        if args.estimate:
+            _print_estimate(
+                client.request("estimate", search_string=args.search_string, queue_id=args.queue_id),
+                args.output,
+            )
+    except (AgentError, OSError) as e:
         print(
-            "Connection Error! \n"
+            f"The agent on {socket_path} could not handle the request! \n"
             "Error is: \n"
             f"{str(e)}"
         )
-        if args.resume_on_connection_error:
-            print(f"You chose to continue on connection errors, will try again in {args.interval} seconds!")
-            time.sleep(args.interval)
-            run(args)
-        else:
-            print("You chose to NOT continue on connection errors. \n"
-                  "To prevent this, you can run next time with --resume-on-connection-error! \n"
-                  "Exiting ... ")
-    except Exception:
-        print("An unexpected error occured!")
-        raise
+        sys.exit(1)
 
 
-def main():
+def main(argv=None):
     os.environ["PYTHONUNBUFFERED"] = "1"
-    args = init_argparser()
+    args = init_argparser(argv)
+    if args.agent_socket and not args.agent:
+        run_via_agent(args)
+        return
+
+    import logging
+
+    # Configure logging for the rlockertools library
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
     run(args)
@@ -9,6 +9,24 @@ logger.addHandler(logging.NullHandler())
 
 __all__ = [
     "resourcelocker",
+    "asyncresourcelocker",
     "exceptions",
     "utils",
+    "session",
+    "queuewatcher",
+    "pollstrategy",
+    "waittransport",
+    "cache",
+    "resourceindex",
+    "heartbeater",
+    "circuitbreaker",
+    "metrics",
+    "agent",
+    "agentclient",
+    "journal",
+    "models",
+    "queueanalytics",
+    "shardedresourcelocker",
+    "ratelimiter",
+    "singleflight",
 ]
@@ -0,0 +1,313 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from requests.exceptions import ConnectionError
+from rlockertools.agentclient import DEFAULT_SOCKET, AgentClient
+from rlockertools.exceptions import BadRequestError, TimeoutReachedForLockingResource
+from rlockertools.queueanalytics import QueueAnalytics
+from rlockertools.queuewatcher import QueueWatcher
+import json
+import os
+import socketserver
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Agent:
+    """
+    Long-lived process serving many CI jobs of a host over a Unix domain socket,
+        with one pooled ResourceLocker for all of them. The waiting queues of every job
+        share one QueueWatcher: a single status listing and heartbeat round per interval,
+        instead of a poll loop (and a connection) per job. A queue registered between two
+        rounds is checked (and beaten) on its own right away, together with the others
+        registered meanwhile, the next rounds do not beat it again within the interval.
+    The protocol is one JSON line per connection, answered by one JSON line:
+        {"action": "wait", "queue_id": 7, "attempts": 120, "interval": 15}
+        {"ok": true, "result": {...queue...}} or {"ok": false, "error": "...", "type": "..."}
+    Actions: ping, enqueue, wait, wait_any, abort, release, release_all, check, estimate.
+    The socket is only accessible to the user running the agent, as the agent acts with its token.
+    Usage:
+        with ResourceLocker(url, token) as locker:
+            Agent(locker).serve_forever()
+    """
+
+    def __init__(self, locker, socket_path=DEFAULT_SOCKET, interval=15, heartbeater=None, max_workers=8):
+        """
+        :param locker: ResourceLocker instance shared by all the requests
+        :param socket_path: Unix domain socket to listen on
+        :param interval: Time in seconds between the status checks of the waiting queues
+        :param heartbeater: Optional running Heartbeater to beat the waiting queues with,
+            otherwise they are beaten on every status check
+        :param max_workers: Number of heartbeats that are sent concurrently
+        """
+        self.locker = locker
+        self.socket_path = socket_path
+        self.interval = interval
+        self.max_workers = max_workers
+        self.watcher = QueueWatcher(
+            locker, interval=interval, max_workers=max_workers, heartbeater=heartbeater
+        )
+        # Long-lived, every estimate only accounts the queues FINISHED since the previous one
+        self.analytics = QueueAnalytics(locker)
+        self.actions = {
+            "ping": self.ping,
+            "enqueue": self.enqueue,
+            "wait": self.wait,
+            "wait_any": self.wait_any,
+            "abort": self.abort,
+            "release": self.release,
+            "release_all": self.release_all,
+            "check": self.check,
+            "estimate": self.estimate,
+        }
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+        # Queue ids registered since the scheduler last looked, checked on their own
+        self._arrived = []
+        self._arrived_lock = threading.Lock()
+        self._scheduler = None
+        self._server = None
+
+    def ping(self):
+        return {"pid": os.getpid(), "server_url": self.locker.instance_url, "pending": self.watcher.pending}
+
+    def enqueue(self, search_string, signoff, priority, link=None):
+        """
+        Create a queue for a resource
+        :return dict: The created queue
+        """
+        req = self.locker.find_resource(
+            search_string=search_string, signoff=signoff, priority=int(priority), link=link
+        )
+        if not req.ok:
+            raise BadRequestError(f"Status code: {req.status_code} \n{req.text}")
+        return req.json()
+
+    def wait(self, queue_id, attempts=120, interval=None, abort_on_timeout=True):
+        """
+        Wait until the queue is FINISHED, the status checks are done by the shared watcher
+        :param queue_id:
+        :param attempts: The timeout is attempts * interval seconds
+        :param interval: Interval of the job, only used for the timeout,
+            the status is checked every interval of the agent
+        :param abort_on_timeout: Abort the queue once the timeout is reached
+        :return dict: The FINISHED queue
+        """
+        timeout = attempts * (interval or self.interval)
+        future = self.watcher.watch(queue_id)
+        # The first status check is immediate
+        self._arrive([queue_id])
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self.watcher.unwatch(queue_id)
+            if abort_on_timeout:
+                self.abort(
+                    queue_id,
+                    "Timeout Reached for this queue. \n"
+                    f"Attempts: {attempts} \n"
+                    f"Time Waited: {timeout} seconds",
+                )
+            raise TimeoutReachedForLockingResource(f"Timeout Reached! Queue {queue_id} is not FINISHED!")
+
+    def wait_any(self, queues, attempts=120, interval=None, abort_on_timeout=True):
+        """
+        Wait until the first of the queues is FINISHED and abort the others,
+            see ResourceLocker.wait_until_any_finished
+        :param queues: The enqueued queues (JSON), in the order of preference
+        :param attempts: The timeout is attempts * interval seconds
+        :param interval: Interval of the job, only used for the timeout
+        :param abort_on_timeout: Abort the queues once the timeout is reached
+        :return dict: The FINISHED queue
+        """
+        deadline = time.monotonic() + attempts * (interval or self.interval)
+        futures = [self.watcher.watch(queue["id"]) for queue in queues]
+        self._arrive([queue["id"] for queue in queues])
+        pending = set(futures)
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            finished = [future for future in futures if future in done and future.exception() is None]
+            if finished:
+                winner = finished[0].result()
+
+        for queue, future in zip(queues, futures):
+            if winner is not None and queue["id"] == winner["id"]:
+                continue
+            waiting = not future.done()
+            self.watcher.unwatch(queue["id"])
+            if waiting and (winner is not None or abort_on_timeout):
+                self.locker.abort_queue(
+                    queue_id=queue["id"],
+                    abort_msg=f"Another pool was locked first (queue {winner['id']})"
+                    if winner is not None
+                    else "Timeout Reached for this queue.",
+                )
+        if winner is not None:
+            if len(queues) > 1:
+                self.locker._release_extra(winner, queues)
+            return winner
+        if not pending:
+            raise futures[-1].exception()
+        raise TimeoutReachedForLockingResource(
+            f"Timeout Reached! None of the queues {', '.join(str(queue['id']) for queue in queues)} is FINISHED!"
+        )
+
+    def abort(self, queue_id, abort_msg=None):
+        self.watcher.unwatch(queue_id)
+        req = self.locker.abort_queue(queue_id=queue_id, abort_msg=abort_msg)
+        return {"status_code": req.status_code, "text": req.text}
+
+    def release(self, signoff):
+        """
+        Release the first resource locked with the signoff
+        :return dict: Response of the release, None if nothing is locked with the signoff
+        """
+        resources = self.locker.get_lockable_resources(signoff=signoff)
+        if not resources:
+            return None
+        req = self.locker.release(resources[0])
+        return {"status_code": req.status_code, "text": req.text}
+
+    def release_all(self, signoff):
+        """
+        :return dict: resource name -> text of the response or of the error
+        """
+        resources = self.locker.get_lockable_resources(signoff=signoff)
+        if not resources:
+            return {}
+        return {
+            name: getattr(result, "text", str(result))
+            for name, result in self.locker.release_many(resources).items()
+        }
+
+    def check(self, search_string):
+        """
+        :return dict: Returned from ResourceLocker.find_available
+        """
+        return self.locker.find_available(search_string)
+
+    def estimate(self, search_string=None, queue_id=None):
+        """
+        :return dict: Returned from QueueAnalytics.estimate
+        """
+        return self.analytics.estimate(queue_id=queue_id, search_string=search_string)
+
+    def handle(self, request):
+        """
+        :param request: Decoded request of a client
+        :return dict: Answer to send back
+        """
+        params = dict(request)
+        action = self.actions.get(params.pop("action", None))
+        if action is None:
+            return {"ok": False, "error": f"Unknown action: {request.get('action')}", "type": "ValueError"}
+        try:
+            return {"ok": True, "result": action(**params)}
+        except Exception as e:
+            logger.error(f"Agent action {request.get('action')} failed: {str(e)}")
+            return {"ok": False, "error": str(e), "type": type(e).__name__}
+
+    def _arrive(self, queue_ids):
+        with self._arrived_lock:
+            self._arrived.extend(queue_ids)
+        self._wakeup.set()
+
+    def _schedule(self):
+        next_round = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not self._stop_event.is_set():
+                # Cleared first, a queue arriving from now on wakes the next wait up
+                self._wakeup.clear()
+                with self._arrived_lock:
+                    arrived, self._arrived = self._arrived, []
+                now = time.monotonic()
+                if now >= next_round:
+                    next_round = now + self.interval
+                    # Every watched queue, the ones that arrived included
+                    arrived = None
+                if self.watcher.pending:
+                    try:
+                        self.watcher.poll_once(executor, queue_ids=arrived)
+                    except ConnectionError as e:
+                        logger.error(
+                            "Connection Error to the specified URL! \n"
+                            "Error is: \n"
+                            f"{str(e)}"
+                        )
+                    except Exception:
+                        # The waits of every job depend on this thread, it must keep looping
+                        logger.exception("Polling the waiting queues failed")
+                self._wakeup.wait(max(0, next_round - time.monotonic()))
+
+    def _bind(self):
+        if os.path.exists(self.socket_path):
+            if AgentClient(self.socket_path, timeout=5).available():
+                raise OSError(f"An agent is already listening on {self.socket_path}")
+            # Left behind by an agent that did not exit cleanly
+            os.unlink(self.socket_path)
+        agent = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if not line:
+                    return
+                try:
+                    answer = agent.handle(json.loads(line))
+                except ValueError as e:
+                    answer = {"ok": False, "error": f"Invalid request: {str(e)}", "type": "ValueError"}
+                self.wfile.write(json.dumps(answer).encode("utf8") + b"\n")
+
+        old_umask = os.umask(0o077)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        finally:
+            os.umask(old_umask)
+        server.daemon_threads = True
+        return server
+
+    def start(self):
+        """
+        Listen on the socket and start the scheduler, requests are served from a background thread
+        :return: None
+        """
+        self._stop_event.clear()
+        self._server = self._bind()
+        self._scheduler = threading.Thread(target=self._schedule, name="rlockertools-agent", daemon=True)
+        self._scheduler.start()
+        threading.Thread(target=self._server.serve_forever, name="rlockertools-agent-server", daemon=True).start()
+        logger.info(f"Agent listening on {self.socket_path}")
+
+    def serve_forever(self):
+        """
+        Serve until stop() is called from another thread (or a signal handler)
+        :return: None
+        """
+        self.start()
+        self._stop_event.wait()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+        if self._scheduler is not None:
+            self._scheduler.join()
+            self._scheduler = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
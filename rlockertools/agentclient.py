@@ -0,0 +1,72 @@
+"""
+Thin client of the rlock agent (see rlockertools.agent).
+Only the standard library is imported here, so a CI job talking to the agent does not
+    pay for importing requests, nor for opening its own connection to the server.
+"""
+import json
+import os
+import socket
+import tempfile
+
+DEFAULT_SOCKET = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), "rlock-agent.sock")
+
+
+class AgentError(Exception):
+    """
+    The agent could not fulfil the request.
+    Defined here rather than in rlockertools.exceptions, which imports requests.
+    """
+
+    def __init__(self, message, error_type=None):
+        self.error_type = error_type
+        super().__init__(message)
+
+
+class AgentClient:
+    """
+    Sends one request per connection to the agent: a JSON line, answered by a JSON line.
+    Usage:
+        client = AgentClient()
+        queue = client.request("enqueue", search_string="label", signoff="job-1", priority=1)
+        client.request("wait", queue_id=queue["id"], attempts=120, interval=15)
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=None):
+        """
+        :param socket_path: Unix domain socket the agent listens on
+        :param timeout: Optional time in seconds to wait for an answer,
+            no limit by default as "wait" answers once the queue is done
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def available(self):
+        """
+        :return bool: True if an agent answers on the socket
+        """
+        try:
+            self.request("ping")
+            return True
+        except (OSError, AgentError):
+            return False
+
+    def request(self, action, **params):
+        """
+        :param action: One of the actions of the agent (ping, enqueue, wait, abort,
+            release, release_all, check)
+        :param params: Parameters of the action
+        :return: The result of the action, decoded from JSON
+        :raises: AgentError if the action failed, OSError if the agent is not reachable
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps({"action": action, **params}).encode("utf8") + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+        if not line:
+            raise AgentError(f"The agent closed the connection without answering {action}")
+        answer = json.loads(line)
+        if not answer.get("ok"):
+            raise AgentError(answer.get("error"), answer.get("type"))
+        return answer.get("result")
@@ -0,0 +1,514 @@
+from concurrent.futures import ThreadPoolExecutor
+from requests.exceptions import ConnectionError, ReadTimeout, RequestException
+from rlockertools.exceptions import CircuitOpenError, TimeoutReachedForLockingResource
+from rlockertools.utils import prettify_output
+from rlockertools.session import build_session, connection_stats
+from rlockertools.pollstrategy import FixedPollStrategy
+from rlockertools.circuitbreaker import backoff_delay, default_retry_budget, get_circuit_breaker, is_final, jittered
+import asyncio
+import datetime
+import functools
+import json
+import pprint
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncResourceLocker:
+    """
+    Asyncio client for the Resource Locker Server, mirroring ResourceLocker.
+    Requests are sent through a pooled session on a bounded set of worker
+        threads, while all the waiting (backoff, polling intervals) happens
+        on the event loop. Hence, waiting on hundreds of queues at once does
+        not need a thread per queue.
+    Usage:
+        async with AsyncResourceLocker(url, token) as rl:
+            queue = await rl.wait_until_finished(queue_id)
+    """
+
+    def __init__(
+        self,
+        instance_url,
+        token,
+        max_retries=3,
+        retry_delay=1,
+        max_workers=32,
+        pool_connections=10,
+        keep_alive=True,
+        session=None,
+        circuit_breaker=None,
+        retry_budget=None,
+        health_endpoint=None,
+        health_ttl=30,
+    ):
+        """
+        :param instance_url: URL of the Resource Locker Server
+        :param token: Token of the user that creates API calls
+        :param max_retries: Number of attempts for GET requests
+        :param retry_delay: Base delay in seconds for the exponential backoff
+        :param max_workers: Maximum number of requests in flight at once,
+            also the size of the per-host connection pool
+        :param pool_connections: Number of per-host connection pools to cache
+        :param keep_alive: Reuse connections between the requests
+        :param session: Optional requests.Session to use instead of building one,
+            it is not closed by close() in that case
+        :param circuit_breaker: CircuitBreaker guarding the requests, the one shared by the
+            process for this instance_url by default
+        :param retry_budget: RetryBudget limiting the retries, the one shared by the process by default
+        :param health_endpoint: URL (or path relative to instance_url) probed with HEAD
+            by check_connection, the instance_url by default
+        :param health_ttl: Seconds a successful probe, or any successful API call,
+            counts as proof that the server is up. 0 probes on every check_connection
+        """
+        self.instance_url = instance_url
+        self.token = token
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker(instance_url)
+        self.retry_budget = retry_budget or default_retry_budget
+
+        if health_endpoint and health_endpoint.startswith("/"):
+            health_endpoint = self.instance_url + health_endpoint
+        self.health_endpoint = health_endpoint or self.instance_url
+        self.health_ttl = health_ttl
+        self._health_method = "HEAD"
+        self._alive_until = 0
+
+        self._owns_session = session is None
+        self.session = session or build_session(
+            pool_connections=pool_connections,
+            pool_maxsize=max_workers,
+            pool_block=True,
+            keep_alive=keep_alive,
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="rlockertools"
+        )
+
+        self.endpoints = {
+            "resources": f"{self.instance_url}/api/resources",
+            "retrieve_resource": f"{self.instance_url}/api/resource/retrieve_entrypoint/",
+            "resource": f"{self.instance_url}/api/resource/",
+            "rqueue": f"{self.instance_url}/api/rqueue/",
+            "rqueues": f"{self.instance_url}/api/rqueues",
+        }
+
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Token {self.token}",
+        }
+
+    async def __aenter__(self):
+        await self.check_connection()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """
+        Stop the worker threads and close the pooled connections
+        :return: None
+        """
+        self._executor.shutdown(wait=False)
+        if self._owns_session:
+            self.session.close()
+
+    def connection_stats(self):
+        """
+        Counters of the pooled session, showing how many requests
+            reused an already opened connection
+        :return dict:
+        """
+        return connection_stats(self.session)
+
+    async def _request(self, method, url, **kwargs):
+        """
+        Send a single request through the pooled session without blocking the event loop
+        :param method: HTTP method
+        :param url: URL to send the request to
+        :param kwargs: Keyword arguments passed to requests.Session.request
+        :return: requests.Response object
+        """
+        self.circuit_breaker.before_request()
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(
+                self._executor,
+                functools.partial(self.session.request, method, url, **kwargs),
+            )
+        except (ConnectionError, ReadTimeout):
+            self._alive_until = 0
+            self.circuit_breaker.record_failure()
+            raise
+        except RequestException:
+            # A broken answer: ChunkedEncodingError, TooManyRedirects, InvalidHeader...
+            self.circuit_breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled (asyncio.CancelledError), it tells nothing about the server
+            self.circuit_breaker.release_probe()
+            raise
+        self.retry_budget.deposit()
+        if response.status_code < 500:
+            # Any answer of the server that is not a server error proves it is up
+            self._alive_until = time.monotonic() + self.health_ttl
+            self.circuit_breaker.record_success()
+        else:
+            self.circuit_breaker.record_failure()
+        return response
+
+    async def _request_with_retry(self, method, url, headers=None, timeout=None, accept=(200, 304), data=None):
+        """
+        Wrapper for requests with retry logic, same semantics and backoff as
+            ResourceLocker._request_with_retry, the backoff waits on the event loop
+        :param method: HTTP method
+        :param url: URL to make the request to
+        :param headers: Optional headers dictionary
+        :param timeout: Optional timeout value
+        :param accept: Status codes that are returned without retrying
+        :param data: Optional body of the request
+        :return: requests.Response object
+        """
+        last_response = None
+        for attempt in range(self.max_retries):
+            try:
+                response = await self._request(method, url, headers=headers, timeout=timeout, data=data)
+            except CircuitOpenError:
+                raise
+            except (ConnectionError, ReadTimeout):
+                delay = backoff_delay(attempt, self.max_retries, self.retry_delay, self.retry_budget, f"{method} {url}")
+                if delay is None:
+                    raise
+                await self._retrying(url, delay, attempt, "Connection error")
+                continue
+            if is_final(method, response.status_code, accept):
+                return response
+            last_response = response
+            delay = backoff_delay(attempt, self.max_retries, self.retry_delay, self.retry_budget, f"{method} {url}")
+            if delay is None:
+                break
+            await self._retrying(url, delay, attempt, f"Status {response.status_code}")
+        return last_response
+
+    async def _retrying(self, url, delay, attempt, reason):
+        logger.warning(
+            f"{reason} from {url}, retrying in {delay:.1f}s... (attempt {attempt + 1}/{self.max_retries})"
+        )
+        await asyncio.sleep(delay)
+
+    async def _get_with_retry(self, url, headers=None, timeout=None):
+        """
+        Wrapper for GET requests with retry logic for non-200 status codes,
+            same semantics as ResourceLocker._get_with_retry
+        :param url: URL to make GET request to
+        :param headers: Optional headers dictionary
+        :param timeout: Optional timeout value
+        :return: requests.Response object
+        """
+        return await self._request_with_retry("GET", url, headers=headers, timeout=timeout)
+
+    async def check_connection(self, silent=True, force=False):
+        """
+        Checks Connection to the provided URL with a HEAD request on the health endpoint
+            (GET if the server does not allow HEAD), same as ResourceLocker.check_connection.
+        The result is cached for health_ttl seconds, successful API calls refresh it too.
+
+        :param force: Probe the server even if it is known to be up
+        :return: None
+        :raises: Connection Error
+        """
+        if not force and self._alive_until > time.monotonic():
+            return
+        req = await self._request_with_retry(
+            self._health_method, self.health_endpoint, accept=(200, 405, 501)
+        )
+        if req.status_code in (405, 501) and self._health_method == "HEAD":
+            self._health_method = "GET"
+            req = await self._request_with_retry(self._health_method, self.health_endpoint)
+        if req.status_code == 200:
+            if not silent:
+                logger.info({"CONNECTION": "OK"})
+            return
+        else:
+            self._alive_until = 0
+            # Raise Connection Error if no 200
+            raise ConnectionError
+
+    async def find_resource(self, search_string, signoff, priority, link=None, timeout=None):
+        """
+        Create a queue for a lockable resource that matches the search string
+        :param search_string: Label or name of the lockable resource
+        :param signoff: A message to write when the resource is locked
+        :param priority: Priority of the queue
+        :param link: Link of the CI/CD pipeline that locks the resource
+        :param timeout: Optional timeout value
+        :return: Response after the PUT request
+        """
+        final_endpoint = self.endpoints["retrieve_resource"] + search_string
+        data = {
+            "priority": priority,
+            "signoff": signoff,
+        }
+        if link:
+            data["link"] = link
+
+        data_json = json.dumps(data)
+
+        try:
+            req = await self._request(
+                "PUT", final_endpoint, headers=self.headers, data=data_json, timeout=timeout
+            )
+            return req
+
+        except ReadTimeout:
+            raise TimeoutReachedForLockingResource
+
+    async def lock_resource(self, resource, signoff, link=None):
+        """
+        Method that will lock the requested resource
+        :param resource: Resource to lock
+        :param signoff: A message to write when the requested resource
+            is about to lock
+        :return: Response after the PUT request
+        """
+        lockable_resource = dict(resource)
+        lockable_resource["is_locked"] = True
+        lockable_resource["signoff"] = signoff
+        if link:
+            lockable_resource["link"] = link
+
+        final_endpoint = self.endpoints["resource"] + lockable_resource["name"]
+        newjson = json.dumps(lockable_resource)
+
+        req = await self._request_with_retry("PUT", final_endpoint, headers=self.headers, data=newjson)
+        return req
+
+    async def release(self, resource):
+        """
+        Method that will release the requested resource
+        :param resource: Resource to release
+        :return: Response after the PUT request
+        """
+        lockable_resource = dict(resource)
+        lockable_resource["is_locked"] = False
+
+        final_endpoint = self.endpoints["resource"] + lockable_resource["name"]
+        newjson = json.dumps(lockable_resource)
+
+        req = await self._request_with_retry("PUT", final_endpoint, headers=self.headers, data=newjson)
+        if req.status_code == 200:
+            logger.info(f"Released {resource['name']} successfully!")
+            return req
+        else:
+            logger.error("There were some errors from the Resource Locker server:")
+            prettify_output(req.text)
+
+    async def get_lockable_resources(
+        self, free_only=True, label_matches=None, name=None, signoff=None
+    ):
+        if not signoff:
+            final_endpoint = (
+                self.endpoints["resources"] + f"?free_only={str(free_only).lower()}&"
+            )
+            if label_matches:
+                final_endpoint = f"{final_endpoint}label_matches={label_matches}"
+            if name:
+                final_endpoint = f"{final_endpoint}name={name}"
+        else:
+            final_endpoint = self.endpoints["resources"] + f"?signoff={signoff}"
+
+        req = await self._get_with_retry(final_endpoint, headers=self.headers)
+        if req.status_code == 200:
+            return json.loads(req.content)
+
+        return req
+
+    async def get_queues(self, status=None):
+        final_endpoint = (
+            self.endpoints["rqueues"] + f"?status={status}"
+            if status
+            else self.endpoints["rqueues"]
+        )
+        req = await self._get_with_retry(final_endpoint, headers=self.headers)
+        if req.status_code == 200:
+            return json.loads(req.content)
+
+    async def get_queue(self, queue_id, verify_connection=False):
+        """
+        Return queue JSONIFIED by the given queue_id
+        :param queue_id:
+        :param verify_connection: Check the connection to the server before
+            retrieving the JSON for the specific queue, False by default
+        :return:
+        """
+        if verify_connection:
+            await self.check_connection()
+        final_endpoint = self.endpoints["rqueue"] + str(queue_id)
+        req = await self._get_with_retry(final_endpoint, headers=self.headers)
+        if req.status_code == 200:
+            return req.json()
+        else:
+            logger.error(
+                f"The request for the queue returned code: {req.status_code} \n"
+                "Response was: \n"
+                f"{req.text}"
+            )
+            return None
+
+    async def abort_queue(self, queue_id, abort_msg=None):
+        """
+        Abort the queue that was created, and expected to have an associated lockable resource
+        :return: req
+        """
+        final_endpoint = self.endpoints["rqueue"] + str(queue_id)
+        data_json = json.dumps(
+            {
+                "status": "ABORTED",
+                "description": abort_msg,
+            }
+        )
+
+        req = await self._request_with_retry("PUT", final_endpoint, headers=self.headers, data=data_json)
+        if req.status_code == 200:
+            logger.debug(pprint.pformat(req.json()))
+            return req
+
+        logger.error(f"Something went wrong aborting the {queue_id}")
+        logger.debug(pprint.pformat(req.text))
+        return req
+
+    async def beat_queue(self, queue_id, suppress_logs=False):
+        """
+        Write the datetime.utcnow() to the last_beat field of the queue
+        :param queue_id:
+        :param suppress_logs False by default, sometimes we'd like to quiet the logs
+        :return:
+        """
+        final_endpoint = self.endpoints["rqueue"] + str(queue_id)
+        data_json = json.dumps({"last_beat": str(datetime.datetime.utcnow())})
+
+        req = await self._request_with_retry("PUT", final_endpoint, headers=self.headers, data=data_json)
+        if req.status_code == 200:
+            if not suppress_logs:
+                logger.debug(pprint.pformat(req.json()))
+            return req
+
+        logger.error(f"Something went wrong beating {queue_id}")
+        logger.debug(pprint.pformat(req.text))
+        return req
+
+    async def wait_until_finished(
+        self,
+        queue_id,
+        interval=15,
+        attempts=120,
+        silent=False,
+        abort_on_timeout=True,
+        resume_on_connection_error=False,
+        poll_strategy=None,
+    ):
+        """
+        Wait until the queue is FINISHED, see ResourceLocker.wait_until_finished
+        :param queue_id:
+        :param interval: Time to wait in seconds between the attempts (this is the maximum time)
+        :param attempts: The timeout is attempts * interval seconds, whatever the poll strategy
+            makes of the time between the attempts
+        :param silent: If timeout is reached (attempts * interval), then
+            it will silently return None rather than raising Exception.
+        :param abort_on_timeout: Aborts the queue if timeout is reached
+        :param resume_on_connection_error: Do not interrupt the waiting, if in the middle of it
+            we will have connection errors (server is down).
+        :param poll_strategy: PollStrategy deciding the time between the attempts,
+            FixedPollStrategy(interval) by default, the cadence of the synchronous client
+
+        :return queue as JSON response:
+        """
+        if poll_strategy is None:
+            poll_strategy = FixedPollStrategy(interval)
+        expected_status = "FINISHED"
+        timeout = attempts * interval
+        logger.info(
+            f"Waiting until status {expected_status} for queue {queue_id}, "
+            f"timeout is set to {timeout} seconds!"
+        )
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        attempt = 0
+        while True:
+            try:
+                queue_to_check = await self.get_queue(queue_id, verify_connection=True)
+                if not queue_to_check:
+                    raise Exception(
+                        f"Queue {queue_id} seems to not exist on the server! \n"
+                        "Error is not recoverable, raising Exception \n"
+                        "Please check the output of the method. \n"
+                        "Or check the logs of the Resource Locker Server! \n"
+                    )
+                queue_status = queue_to_check.get("status")
+                if queue_status == expected_status:
+                    return queue_to_check
+
+                if queue_status in ["INITIALIZING"] or (queue_status == "PENDING" and not (attempt % 1000)):
+                    logger.info(
+                        f"Queue {queue_id} is {queue_status} \n"
+                        f"More info about the queue: \n"
+                        f"{self.instance_url}/rqueues/{queue_id}"
+                    )
+                elif queue_status in ["ABORTED", "FAILED"]:
+                    err_msg = (
+                        "Queue did NOT finish successfully \n"
+                        f"Error is: \n {queue_to_check}"
+                    )
+                    if silent:
+                        logger.warning(err_msg + "silent=true provided so no exception is raised")
+                        return None
+                    raise Exception(err_msg)
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                await self.beat_queue(queue_id, suppress_logs=True)
+                # The last wait ends at the deadline, for a last check
+                await asyncio.sleep(min(poll_strategy.next_interval(attempt, queue_to_check), remaining))
+                attempt += 1
+            except ConnectionError as e:
+                logger.error(
+                    "Connection Error to the specified URL! \n"
+                    "Error is: \n"
+                    f"{str(e)}"
+                )
+                if not resume_on_connection_error:
+                    raise
+                paused = loop.time()
+                while True:
+                    logger.info(
+                        f"Will try again in {interval} seconds. NOTE: Timeout duration is paused! "
+                        f"Queue {queue_id} will still have a timeout of "
+                        f"{max(deadline - paused, 0):.0f} seconds once the resource locker server is back!"
+                    )
+                    await asyncio.sleep(jittered(interval))
+                    try:
+                        await self.check_connection()
+                        break
+                    except Exception:
+                        pass
+                deadline += loop.time() - paused
+
+        if abort_on_timeout:
+            await self.abort_queue(
+                queue_id=queue_id,
+                abort_msg="Timeout Reached for this queue. \n"
+                f"Attempts: {attempt + 1} \n"
+                f"Interval: {interval} seconds \n"
+                f"Time Waited: {timeout} seconds",
+            )
+        if silent:
+            logger.warning("Timeout reached, silent=true provided so no exception is raised")
+            return None
+        raise TimeoutReachedForLockingResource(
+            "Timeout Reached! \n"
+            f"Status of the queue is not {expected_status}!"
+        )
@@ -0,0 +1,146 @@
+from collections import OrderedDict
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    In-memory LRU cache of GET responses keyed by the full URL (endpoint + query).
+    Entries are fresh for ttl seconds. Afterwards they are kept for revalidation:
+        if the server sent ETag/Last-Modified, the next request is conditional and
+        a 304 answer refreshes the entry without downloading the body again.
+    The body is stored as text and decoded on every hit, so callers can freely
+        modify what they get back.
+    If path is given, the entries are also persisted to that JSON file and loaded
+        back by the next process.
+    """
+
+    def __init__(self, ttl=30, maxsize=128, path=None):
+        """
+        :param ttl: Seconds an entry is served without asking the server
+        :param maxsize: Maximal number of entries, the least recently used is evicted
+        :param path: Optional JSON file to persist the entries to
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    def lookup(self, key):
+        """
+        :param key: URL of the request
+        :return: (text, fresh, validators) or None if the key is not cached,
+            validators are the conditional request headers to revalidate the entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["expires"] <= time.time():
+                self.misses += 1
+            else:
+                self.hits += 1
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            validators = {}
+            if entry.get("etag"):
+                validators["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                validators["If-Modified-Since"] = entry["last_modified"]
+            return entry["text"], entry["expires"] > time.time(), validators
+
+    def store(self, key, response):
+        """
+        Cache the body of a 200 response
+        :param key: URL of the request
+        :param response: requests.Response object
+        :return: None
+        """
+        with self._lock:
+            self._entries[key] = {
+                "text": response.text,
+                "expires": time.time() + self.ttl,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        self._save()
+
+    def refresh(self, key):
+        """
+        The server answered 304 for the entry, it is fresh for another ttl
+        :param key: URL of the request
+        :return: None
+        """
+        with self._lock:
+            self.revalidations += 1
+            if key in self._entries:
+                self._entries[key]["expires"] = time.time() + self.ttl
+        self._save()
+
+    def invalidate(self, prefix=None):
+        """
+        Drop the entries whose key starts with the prefix, all of them if no prefix
+        :param prefix: Optional URL prefix
+        :return: None
+        """
+        with self._lock:
+            for key in [k for k in self._entries if prefix is None or k.startswith(prefix)]:
+                del self._entries[key]
+        self._save()
+
+    def stats(self):
+        """
+        :return dict: Counters of the cache
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring the cache file {self.path}: {str(e)}")
+            return
+        self._entries.update(entries)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            entries = json.dumps(self._entries)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            # Write to a temporary file first, so a reader never sees half of it
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".rlockertools-cache-")
+            with os.fdopen(fd, "w") as f:
+                f.write(entries)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write the cache file {self.path}: {str(e)}")
@@ -0,0 +1,192 @@
+from rlockertools.exceptions import CircuitOpenError
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def jittered(delay, fraction=0.5):
+    """
+    Spread a delay randomly, so clients that failed at the same moment
+        do not come back at the same moment
+    :param delay: Delay in seconds
+    :param fraction: The delay is randomized within +- fraction of itself
+    :return: float
+    """
+    return max(delay * random.uniform(1 - fraction, 1 + fraction), 0)
+
+
+def is_final(method, status_code, accept=(200, 304)):
+    """
+    :param method: HTTP method of the request
+    :param status_code: Status code of its response
+    :param accept: Status codes that are returned without retrying
+    :return bool: True if the response is returned as it is, client errors of a write
+        are final as well, retrying would not change them
+    """
+    return status_code in accept or (method != "GET" and status_code < 500)
+
+
+def backoff_delay(attempt, max_retries, retry_delay, retry_budget, description=""):
+    """
+    Exponential jittered backoff of the retries, shared by ResourceLocker and AsyncResourceLocker
+    :param attempt: Number of the attempt that just failed, starting from 0
+    :param max_retries: Number of the attempts of the request
+    :param retry_delay: Base delay in seconds
+    :param retry_budget: RetryBudget a token is withdrawn from for the retry
+    :param description: Request, for the logs
+    :return: Seconds to wait before the next attempt, None if the request is not retried
+        (it was the last attempt or the retry budget is exhausted)
+    """
+    if attempt >= max_retries - 1:
+        return None
+    if not retry_budget.withdraw():
+        logger.warning(f"Retry budget exhausted, not retrying {description}")
+        return None
+    return jittered(retry_delay * (2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a server that keeps failing.
+        CLOSED: requests go through, consecutive failures are counted
+        OPEN: after failure_threshold consecutive failures, requests fail right away with
+            CircuitOpenError for a jittered recovery_timeout
+        HALF_OPEN: after the timeout, a single probe request goes through, a success closes
+            the circuit, a failure opens it again with a doubled timeout (up to max_recovery_timeout)
+    A failure is a connection error, a broken answer or a 5xx response. Every request let
+        through is resolved by record_success, record_failure or release_probe, otherwise
+        the circuit would stay HALF_OPEN with its probe taken forever.
+    """
+
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    def __init__(self, failure_threshold=5, recovery_timeout=5, max_recovery_timeout=300):
+        """
+        :param failure_threshold: Consecutive failures that open the circuit
+        :param recovery_timeout: Seconds the circuit stays open the first time
+        :param max_recovery_timeout: Upper bound of the doubling recovery timeout
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._current_timeout = recovery_timeout
+        self._open_until = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """
+        :return: None
+        :raises: CircuitOpenError if the request must not be sent
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == self.OPEN and now >= self._open_until:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpenError(max(self._open_until - now, 0))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("The Resource Locker server is back, closing the circuit")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+            self._current_timeout = self.recovery_timeout
+
+    def release_probe(self):
+        """
+        The request ended without telling anything about the server (it was cancelled, or an
+            expected timeout of a long poll), the probe is given back so the next request probes
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN:
+                self._current_timeout = min(self._current_timeout * 2, self.max_recovery_timeout)
+            elif self._failures < self.failure_threshold:
+                return
+            self.state = self.OPEN
+            self._probing = False
+            timeout = jittered(self._current_timeout)
+            self._open_until = time.monotonic() + timeout
+            logger.warning(f"The Resource Locker server keeps failing, circuit open for {timeout:.1f}s")
+
+
+class RetryBudget:
+    """
+    Limits the retries to a fraction of the requests, so an outage does not multiply
+        the load on the server. Every request deposits ratio of a token, every retry
+        withdraws a whole one. min_per_second tokens are granted anyway, so a process
+        with few requests can still retry.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=1, max_tokens=10):
+        """
+        :param ratio: Tokens deposited by a request
+        :param min_per_second: Tokens granted every second regardless of the requests
+        :param max_tokens: Maximal number of saved tokens
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, amount=0):
+        now = time.monotonic()
+        self._tokens = min(
+            self._tokens + amount + (now - self._last) * self.min_per_second, self.max_tokens
+        )
+        self._last = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill(self.ratio)
+
+    def withdraw(self):
+        """
+        :return bool: True if a retry is allowed
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+# Shared by every client of the process
+default_retry_budget = RetryBudget()
+
+
+def get_circuit_breaker(instance_url):
+    """
+    The circuit breaker of a server, shared by every client of the process
+    :param instance_url: URL of the Resource Locker Server
+    :return: CircuitBreaker object
+    """
+    with _circuit_breakers_lock:
+        if instance_url not in _circuit_breakers:
+            _circuit_breakers[instance_url] = CircuitBreaker()
+        return _circuit_breakers[instance_url]
@@ -1,6 +1,49 @@
+from requests.exceptions import ConnectionError
+
+
 class BadRequestError(Exception):
     """Error from the Resource Locker Server!"""
 
 
 class TimeoutReachedForLockingResource(Exception):
     """In the given timeout range, there were no lockable resources that got free"""
+
+
+class QueueFailedError(Exception):
+    """The queue reached ABORTED or FAILED status instead of FINISHED"""
+
+    def __init__(self, queue):
+        self.queue = queue
+        super().__init__(
+            "Queue did NOT finish successfully \n"
+            f"Error is: \n {queue}"
+        )
+
+
+class PartialLockError(BadRequestError):
+    """Only some of the requested resources could be locked, the locked ones were released"""
+
+    def __init__(self, results):
+        self.results = results
+        failed = [name for name, result in results.items() if getattr(result, "status_code", None) != 200]
+        super().__init__(f"Could not lock: {', '.join(failed)}")
+
+
+class CircuitOpenError(ConnectionError):
+    """The Resource Locker Server kept failing, requests are not sent until the circuit recovers"""
+
+    def __init__(self, retry_after=None):
+        self.retry_after = retry_after
+        super().__init__(
+            "The Resource Locker server is failing, not sending requests"
+            + (f" for the next {retry_after:.1f}s" if retry_after else "")
+        )
+
+
+class RateLimitExceededError(Exception):
+    """A request would have to wait longer than the max_wait of the RateLimiter"""
+
+    def __init__(self, endpoint, rate):
+        self.endpoint = endpoint
+        self.rate = rate
+        super().__init__(f"Rate limit of {rate} requests per second to {endpoint} exceeded")
@@ -0,0 +1,168 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Heartbeater:
+    """
+    Beats queues from its own thread, on a cadence independent from the status polling,
+        so a slow status check never delays the last_beat of a live client.
+    All the registered queues are beaten in one tick, concurrently over the pooled session.
+        A queue registered several times (e.g. by several waiters) is beaten once per tick.
+    Usage:
+        with Heartbeater(locker, interval=30) as heartbeater:
+            heartbeater.add(queue_id)
+            ...
+    """
+
+    def __init__(self, locker, queue_ids=(), interval=30, max_workers=8):
+        """
+        :param locker: ResourceLocker instance to send the beats with
+        :param queue_ids: Queue ids to beat right away
+        :param interval: Time in seconds between two ticks
+        :param max_workers: Maximum number of beats in flight at once
+        """
+        self.locker = locker
+        self.interval = interval
+        self.max_workers = max_workers
+        self._queues = Counter(queue_ids)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._latencies = []
+        self._beats = 0
+        self._failures = 0
+        self._ticks = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def add(self, queue_id):
+        """
+        Start beating a queue
+        :param queue_id:
+        :return: None
+        """
+        with self._lock:
+            self._queues[queue_id] += 1
+
+    def remove(self, queue_id):
+        """
+        Stop beating a queue, once every add() of it is matched by a remove()
+        :param queue_id:
+        :return: None
+        """
+        with self._lock:
+            self._queues[queue_id] -= 1
+            if self._queues[queue_id] <= 0:
+                del self._queues[queue_id]
+
+    @property
+    def queue_ids(self):
+        with self._lock:
+            return list(self._queues)
+
+    def _beat(self, queue_id):
+        start = time.monotonic()
+        req = self.locker.beat_queue(queue_id, suppress_logs=True)
+        return time.monotonic() - start, req is not None and req.status_code == 200
+
+    def beat_once(self):
+        """
+        Beat every registered queue once
+        :return int: Number of the queues that were beaten successfully
+        """
+        queue_ids = self.queue_ids
+        if not queue_ids:
+            return 0
+        executor = self._executor or ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = [executor.submit(self._beat, queue_id) for queue_id in queue_ids]
+            beaten = 0
+            for queue_id, future in zip(queue_ids, futures):
+                try:
+                    latency, ok = future.result()
+                except Exception as e:
+                    logger.error(f"Something went wrong beating {queue_id}: {str(e)}")
+                    ok, latency = False, None
+                with self._lock:
+                    self._beats += 1
+                    if latency is not None:
+                        self._latencies.append(latency)
+                        del self._latencies[:-1000]
+                    if not ok:
+                        self._failures += 1
+                beaten += ok
+        finally:
+            if executor is not self._executor:
+                executor.shutdown()
+        with self._lock:
+            self._ticks += 1
+        return beaten
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.beat_once()
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        """
+        Start beating in a background thread, the first tick is immediate
+        :return: None
+        """
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="rlockertools-heartbeat"
+        )
+        self._thread = threading.Thread(target=self._run, name="rlockertools-heartbeater", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop beating, waits for the current tick to finish
+        :param timeout: Optional time to wait for the thread
+        :return: None
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self):
+        """
+        Beat latency metrics in seconds, over the last 1000 beats
+        :return dict:
+        """
+        with self._lock:
+            last = self._latencies[-1] if self._latencies else None
+            latencies = sorted(self._latencies)
+            stats = {
+                "ticks": self._ticks,
+                "beats": self._beats,
+                "failures": self._failures,
+                "queues": len(self._queues),
+            }
+        if latencies:
+            stats.update(
+                {
+                    "latency_last": last,
+                    "latency_avg": sum(latencies) / len(latencies),
+                    "latency_p95": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+                    "latency_max": latencies[-1],
+                }
+            )
+        return stats
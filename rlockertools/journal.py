@@ -0,0 +1,153 @@
+from contextlib import contextmanager
+import json
+import os
+import tempfile
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, the journal cannot be shared safely between the processes there
+    fcntl = None
+
+DEFAULT_JOURNAL = os.path.join(
+    os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state"),
+    "rlockertools",
+    "journal.jsonl",
+)
+
+
+class Journal:
+    """
+    Append-only local journal of the queues submitted from this host, so a job whose
+        rlock process died can reattach to its queue instead of submitting a new one.
+    Every line is a JSON record of a queue (queue_id, search_string, signoff, priority,
+        link, submitted, status, updated), a later record of the same queue overrides
+        the fields it carries. Records are flushed to disk before record() returns.
+    The journal is compacted (one line per queue, the queues not updated for max_age dropped,
+        including those left waiting by a crash) once it grows over max_lines and at least
+        half of its lines would go.
+    Several rlock processes may share it, appends and compaction are serialized
+        by a lock file next to it.
+    Usage:
+        journal = Journal()
+        entry = journal.find_resumable(search_string="label", signoff="job-1")
+        journal.record(queue_id, search_string="label", signoff="job-1", status="PENDING")
+    """
+
+    FINAL_STATUSES = ("FINISHED", "ABORTED", "FAILED")
+
+    def __init__(self, path=DEFAULT_JOURNAL, max_lines=1000, max_age=7 * 24 * 3600):
+        """
+        :param path: File of the journal, created if missing
+        :param max_lines: Number of lines after which the journal is compacted
+        :param max_age: Seconds a queue that is not updated anymore is kept by the compaction
+        :raises: NotImplementedError without fcntl (Windows)
+        """
+        if fcntl is None:
+            raise NotImplementedError("The journal needs fcntl file locks, not available on this platform")
+        self.path = path
+        self.max_lines = max_lines
+        self.max_age = max_age
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        """
+        :return: (dict of queue_id -> merged record, number of lines)
+        """
+        entries = {}
+        lines = 0
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut by a crash in the middle of a write
+                        logger.debug(f"Skipping a corrupted line of the journal {self.path}")
+                        continue
+                    entries.setdefault(str(record["queue_id"]), {}).update(record)
+        except FileNotFoundError:
+            pass
+        return entries, lines
+
+    def entries(self):
+        """
+        :return dict: queue_id (str) -> latest known state of the queue
+        """
+        return self._read()[0]
+
+    def record(self, queue_id, **fields):
+        """
+        Append the new state of a queue
+        :param queue_id:
+        :param fields: Fields of the queue that changed (status, search_string, ...)
+        :return: None
+        """
+        line = json.dumps({"queue_id": queue_id, **fields, "updated": time.time()}) + "\n"
+        with self._locked():
+            with open(self.path, "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            entries, lines = self._read()
+            # At least half of the lines go, so the rewrites stay rare
+            kept = self._kept(entries)
+            if lines > self.max_lines and lines > 2 * len(kept):
+                self._rewrite(kept, len(entries))
+
+    def find_resumable(self, search_string, signoff):
+        """
+        The latest queue submitted with the same search string and signoff
+            that was not known to reach a final status
+        :return dict: Entry of the queue, None if there is none
+        """
+        candidates = [
+            entry
+            for entry in self.entries().values()
+            if entry.get("search_string") == search_string
+            and entry.get("signoff") == signoff
+            and entry.get("status") not in self.FINAL_STATUSES
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda entry: entry.get("submitted") or 0)
+
+    def compact(self):
+        """
+        Rewrite the journal with one line per queue, dropping the queues not updated for
+            max_age seconds: those in a final status and those a crashed run left waiting
+        :return int: Number of the queues kept
+        """
+        with self._locked():
+            entries = self._read()[0]
+            return self._rewrite(self._kept(entries), len(entries))
+
+    def _kept(self, entries):
+        oldest = time.time() - self.max_age
+        return [entry for entry in entries.values() if entry.get("updated", 0) >= oldest]
+
+    def _rewrite(self, kept, total):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".rlockertools-journal-")
+        with os.fdopen(fd, "w") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in kept)
+            f.flush()
+            os.fsync(f.fileno())
+        # Readers never see half of the journal
+        os.replace(tmp_path, self.path)
+        logger.debug(f"Journal {self.path} compacted from {total} to {len(kept)} queues")
+        return len(kept)
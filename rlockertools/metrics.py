@@ -0,0 +1,279 @@
+from collections import defaultdict
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets, Prometheus style
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Upper bounds in seconds of the time to lock histogram buckets
+TIME_TO_LOCK_BUCKETS = (1, 5, 15, 30, 60, 300, 900, 1800, 3600, 7200, 14400)
+
+# Path of the API after the instance URL -> endpoint name, the longest prefix wins
+ENDPOINTS = (
+    ("/api/resource/retrieve_entrypoint/", "retrieve_entrypoint"),
+    ("/api/resources", "resources"),
+    ("/api/resource/", "resource"),
+    ("/api/rqueues", "rqueues"),
+    ("/api/rqueue/", "rqueue"),
+)
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets, as exported to Prometheus
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        :return list: (upper bound, observations lower or equal), the last bound is +Inf
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {
+            "buckets": {_format_bound(bound): count for bound, count in self.cumulative()},
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    Request level instrumentation of a ResourceLocker:
+        - requests per endpoint, method and status code
+        - latency histogram per endpoint
+        - retries per endpoint
+        - bytes sent and received per endpoint (the Content-Length of streamed
+            responses, as their body is not read by the client itself)
+        - time to lock, from find_resource until wait_until_finished returns the FINISHED queue
+    Clients without metrics (the default) do not pay for any of it.
+    Hooks are called with (event, data) after every recorded event:
+        "request": {"method", "endpoint", "status", "latency", "bytes_sent", "bytes_received"}
+        "retry": {"method", "endpoint"}
+        "time_to_lock": {"queue_id", "seconds"}
+    Usage:
+        metrics = Metrics()
+        locker = ResourceLocker(url, token, metrics=metrics)
+        ...
+        print(metrics.to_prometheus())
+    """
+
+    def __init__(self, hooks=()):
+        """
+        :param hooks: Callables(event, data) to call on every recorded event
+        """
+        self.hooks = list(hooks)
+        self._lock = threading.Lock()
+        self._requests = defaultdict(int)
+        self._latency = {}
+        self._retries = defaultdict(int)
+        self._bytes_sent = defaultdict(int)
+        self._bytes_received = defaultdict(int)
+        self._time_to_lock = Histogram(TIME_TO_LOCK_BUCKETS)
+        self._lock_started = {}
+
+    def add_hook(self, hook):
+        """
+        :param hook: Callable(event, data)
+        :return: None
+        """
+        self.hooks.append(hook)
+
+    @staticmethod
+    def endpoint_of(url):
+        """
+        Name of the API endpoint of a URL, "other" if it is none of them (e.g. the health check)
+        :param url:
+        :return str:
+        """
+        for path, name in ENDPOINTS:
+            if path in url:
+                return name
+        return "other"
+
+    def _emit(self, event, data):
+        for hook in self.hooks:
+            try:
+                hook(event, data)
+            except Exception as e:
+                logger.error(f"Metrics hook {hook} raised: {str(e)}")
+
+    def record_request(self, method, url, status, latency, bytes_sent=0, bytes_received=0):
+        """
+        :param method: HTTP method
+        :param url: URL of the request
+        :param status: Status code of the response, None if no response came
+        :param latency: Seconds until the response headers came
+        :param bytes_sent: Size of the request body
+        :param bytes_received: Size of the response body
+        :return: None
+        """
+        endpoint = self.endpoint_of(url)
+        with self._lock:
+            self._requests[(endpoint, method, status)] += 1
+            if endpoint not in self._latency:
+                self._latency[endpoint] = Histogram(LATENCY_BUCKETS)
+            self._latency[endpoint].observe(latency)
+            self._bytes_sent[endpoint] += bytes_sent
+            self._bytes_received[endpoint] += bytes_received
+        if self.hooks:
+            self._emit(
+                "request",
+                {
+                    "method": method,
+                    "endpoint": endpoint,
+                    "status": status,
+                    "latency": latency,
+                    "bytes_sent": bytes_sent,
+                    "bytes_received": bytes_received,
+                },
+            )
+
+    def record_retry(self, method, url):
+        endpoint = self.endpoint_of(url)
+        with self._lock:
+            self._retries[endpoint] += 1
+        if self.hooks:
+            self._emit("retry", {"method": method, "endpoint": endpoint})
+
+    def lock_started(self, queue_id):
+        """
+        The queue was created by find_resource, the time to lock starts now
+        :param queue_id:
+        :return: None
+        """
+        with self._lock:
+            self._lock_started[str(queue_id)] = time.monotonic()
+
+    def lock_finished(self, queue_id):
+        """
+        The queue is FINISHED, records its time to lock if it was started by this client
+        :param queue_id:
+        :return float: Time to lock in seconds, None if the start is unknown
+        """
+        with self._lock:
+            started = self._lock_started.pop(str(queue_id), None)
+            if started is None:
+                return None
+            seconds = time.monotonic() - started
+            self._time_to_lock.observe(seconds)
+        if self.hooks:
+            self._emit("time_to_lock", {"queue_id": queue_id, "seconds": seconds})
+        return seconds
+
+    def snapshot(self):
+        """
+        :return dict: All the metrics, JSON serializable
+        """
+        with self._lock:
+            endpoints = {}
+            for (endpoint, method, status), count in sorted(
+                self._requests.items(), key=lambda item: str(item[0])
+            ):
+                requests = endpoints.setdefault(endpoint, {"requests": {}})["requests"]
+                requests[f"{method} {status}"] = count
+            for endpoint, data in endpoints.items():
+                data["latency"] = self._latency[endpoint].to_dict()
+                data["retries"] = self._retries.get(endpoint, 0)
+                data["bytes_sent"] = self._bytes_sent[endpoint]
+                data["bytes_received"] = self._bytes_received[endpoint]
+            return {
+                "endpoints": endpoints,
+                "time_to_lock": self._time_to_lock.to_dict(),
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """
+        :return str: The metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            lines.append("# HELP rlocker_requests_total Requests sent to the Resource Locker server")
+            lines.append("# TYPE rlocker_requests_total counter")
+            for (endpoint, method, status), count in sorted(
+                self._requests.items(), key=lambda item: str(item[0])
+            ):
+                lines.append(
+                    f'rlocker_requests_total{{endpoint="{_escape(endpoint)}",method="{_escape(method)}",'
+                    f'status="{_escape(status)}"}} {count}'
+                )
+            lines.append("# HELP rlocker_request_duration_seconds Latency of the requests")
+            lines.append("# TYPE rlocker_request_duration_seconds histogram")
+            for endpoint, histogram in sorted(self._latency.items()):
+                lines.extend(
+                    self._prometheus_histogram(
+                        "rlocker_request_duration_seconds", histogram, f'endpoint="{_escape(endpoint)}"'
+                    )
+                )
+            for name, help_text, values in (
+                ("rlocker_retries_total", "Retried requests", self._retries),
+                ("rlocker_sent_bytes_total", "Bytes of the request bodies", self._bytes_sent),
+                ("rlocker_received_bytes_total", "Bytes of the response bodies", self._bytes_received),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for endpoint, value in sorted(values.items()):
+                    lines.append(f'{name}{{endpoint="{_escape(endpoint)}"}} {value}')
+            lines.append("# HELP rlocker_time_to_lock_seconds Time from find_resource until the queue is FINISHED")
+            lines.append("# TYPE rlocker_time_to_lock_seconds histogram")
+            lines.extend(self._prometheus_histogram("rlocker_time_to_lock_seconds", self._time_to_lock))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _prometheus_histogram(name, histogram, labels=""):
+        separator = "," if labels else ""
+        lines = [
+            f'{name}_bucket{{{labels}{separator}le="{_format_bound(bound)}"}} {count}'
+            for bound, count in histogram.cumulative()
+        ]
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {histogram.sum}")
+        lines.append(f"{name}_count{suffix} {histogram.count}")
+        return lines
+
+    def write(self, path, fmt="json"):
+        """
+        Write the metrics to a file, atomically
+        :param path: File to write to
+        :param fmt: json or prometheus
+        :return: None
+        """
+        content = self.to_prometheus() if fmt == "prometheus" else self.to_json()
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".rlockertools-metrics-")
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
@@ -0,0 +1,174 @@
+from rlockertools.utils import parse_queue_data
+import json
+
+
+class Model:
+    """
+    Compact record of the server, with a slot per known field instead of a dictionary.
+    Fields the server sent but the model does not know are kept in a dictionary aside,
+        only if there are any.
+    The assignments to the known fields are tracked, so to_dict(changed_only=True)
+        gives a partial (PATCH style) payload.
+    Models can be read like the dictionaries of the API (model["name"], model.get("name"),
+        dict(model)), so they can be passed wherever a resource or queue dictionary is expected.
+    """
+
+    __slots__ = ("_present", "_extra", "_changed")
+    FIELDS = ()
+
+    def __init__(self, **fields):
+        present = 0
+        for index, name in enumerate(self.FIELDS):
+            if name in fields:
+                present |= 1 << index
+            object.__setattr__(self, self._slot(name), fields.pop(name, None))
+        # Bit i is set if FIELDS[i] was sent by the server or assigned since
+        object.__setattr__(self, "_present", present)
+        object.__setattr__(self, "_extra", fields or None)
+        object.__setattr__(self, "_changed", None)
+
+    @staticmethod
+    def _slot(name):
+        return name
+
+    @classmethod
+    def from_dict(cls, fields):
+        """
+        :param fields: Dictionary of the API
+        :return: Model object
+        """
+        return cls(**fields)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in self.FIELDS:
+            self._mark(name)
+
+    def _mark(self, name):
+        object.__setattr__(self, "_present", self._present | 1 << self.FIELDS.index(name))
+        if self._changed is None:
+            object.__setattr__(self, "_changed", set())
+        self._changed.add(name)
+
+    def _has(self, name):
+        return bool(self._present >> self.FIELDS.index(name) & 1)
+
+    def _raw(self, name):
+        return object.__getattribute__(self, self._slot(name))
+
+    def keys(self):
+        keys = [name for index, name in enumerate(self.FIELDS) if self._present >> index & 1]
+        return keys + list(self._extra or ())
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            if not self._has(key):
+                raise KeyError(key)
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                object.__setattr__(self, "_extra", {})
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        return (key in self.FIELDS and self._has(key)) or bool(self._extra and key in self._extra)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (Model, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    @property
+    def changed(self):
+        """
+        Names of the fields assigned since the model was built (or marked clean)
+        """
+        return set(self._changed or ())
+
+    def mark_clean(self):
+        object.__setattr__(self, "_changed", None)
+
+    def copy(self):
+        """
+        :return: A new model with the same fields and the same fields marked as changed
+        """
+        model = type(self).from_dict(self.to_dict())
+        for name in self._changed or ():
+            model._mark(name)
+        return model
+
+    def to_dict(self, changed_only=False):
+        """
+        :param changed_only: Only the fields assigned since the model was built
+        :return dict:
+        """
+        if changed_only:
+            return {name: self._raw(name) for name in self.FIELDS if name in (self._changed or ())}
+        fields = {name: self._raw(name) for index, name in enumerate(self.FIELDS) if self._present >> index & 1}
+        if self._extra:
+            fields.update(self._extra)
+        return fields
+
+    def to_json(self, changed_only=False):
+        return json.dumps(self.to_dict(changed_only))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Resource(Model):
+    """
+    Lockable resource
+    """
+
+    FIELDS = ("id", "name", "labels_string", "labels", "is_locked", "signoff", "link", "locked_time", "description")
+    __slots__ = FIELDS
+
+
+class Queue(Model):
+    """
+    Queue of a lock request. The data section is decoded on its first access only,
+        an untouched data section is serialized back exactly as it came
+    """
+
+    FIELDS = ("id", "status", "priority", "time_requested", "description", "last_beat", "data")
+    __slots__ = ("id", "status", "priority", "time_requested", "description", "last_beat", "_data")
+
+    @staticmethod
+    def _slot(name):
+        return "_data" if name == "data" else name
+
+    @property
+    def data(self):
+        """
+        The data section as a dictionary, whether the server sent it as a string or as an object
+        """
+        raw = object.__getattribute__(self, "_data")
+        if isinstance(raw, str):
+            raw = parse_queue_data(raw)
+            object.__setattr__(self, "_data", raw)
+        return raw
+
+    @data.setter
+    def data(self, value):
+        object.__setattr__(self, "_data", value)
+        self._mark("data")
@@ -0,0 +1,155 @@
+from abc import ABC, abstractmethod
+from rlockertools.queueanalytics import QueueAnalytics
+import random
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PollStrategy(ABC):
+    """
+    Decides how long wait_until_finished sleeps before the next status check.
+        The timeout of wait_until_finished is a deadline, the strategy only spaces the checks
+    """
+
+    @abstractmethod
+    def next_interval(self, attempt, queue):
+        """
+        :param attempt: Number of the attempt that just checked the queue, starting from 0
+        :param queue: Queue JSON returned by that check
+        :return: Seconds to sleep
+        """
+
+
+class FixedPollStrategy(PollStrategy):
+    """
+    Check every warmup_interval seconds for the first warmup_attempts, then every interval seconds.
+    The defaults are the historical behaviour of wait_until_finished.
+    """
+
+    def __init__(self, interval=15, warmup_interval=20, warmup_attempts=6):
+        self.interval = interval
+        self.warmup_interval = warmup_interval
+        self.warmup_attempts = warmup_attempts
+
+    def next_interval(self, attempt, queue):
+        if attempt < self.warmup_attempts:
+            return self.warmup_interval
+        return self.interval
+
+
+class ExponentialPollStrategy(PollStrategy):
+    """
+    Start checking quickly and back off exponentially up to interval seconds.
+    Jitter spreads the checks of clients that started at the same time.
+    """
+
+    def __init__(self, interval=15, initial=2, factor=2, jitter=0.5):
+        """
+        :param interval: Maximum time to sleep
+        :param initial: Time to sleep after the first attempt
+        :param factor: Growth of the sleep time with every attempt
+        :param jitter: Fraction of the sleep time that is randomized (0 disables jitter)
+        """
+        self.interval = interval
+        self.initial = initial
+        self.factor = factor
+        self.jitter = jitter
+
+    def next_interval(self, attempt, queue):
+        delay = min(self.initial * (self.factor ** min(attempt, 32)), self.interval)
+        return delay - random.uniform(0, delay * self.jitter)
+
+
+class QueuePositionPollStrategy(PollStrategy):
+    """
+    Sleep according to the position of the queue among the PENDING queues.
+    Queues that are served before this one are those with the same search string
+        and a more urgent priority, or the same priority and an older id.
+    The estimated wait is position * seconds_per_position, the strategy sleeps half of it,
+        bounded by min_interval and max_interval. Clients at the back of the line check
+        rarely, the ones at the front check often.
+    The PENDING listing is an extra request, so it is refreshed every refresh_every
+        attempts only, in between the estimate is decreased by the time passed.
+    """
+
+    def __init__(
+        self,
+        locker,
+        interval=15,
+        min_interval=5,
+        max_interval=None,
+        seconds_per_position=60,
+        refresh_every=5,
+        lower_priority_first=True,
+    ):
+        """
+        :param locker: ResourceLocker used to list the PENDING queues
+        :param interval: Time to sleep while the position is unknown
+        :param min_interval: Minimal time to sleep (front of the line)
+        :param max_interval: Maximal time to sleep (back of the line), 4 * interval by default
+        :param seconds_per_position: Estimated time a single queue ahead takes to be served
+        :param refresh_every: Number of attempts between the listings of PENDING queues
+        :param lower_priority_first: True if a lower priority value is served first
+        """
+        self.locker = locker
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval or interval * 4
+        self.seconds_per_position = seconds_per_position
+        self.refresh_every = refresh_every
+        self.lower_priority_first = lower_priority_first
+        self._estimate = None
+        self._estimated_at = None
+        self._last_refresh = None
+
+    def position(self, queue):
+        """
+        Number of PENDING queues that will be served before the given queue
+        :param queue: Queue JSON
+        :return int: position, None if the PENDING queues can not be listed
+        """
+        pending = self.locker.get_queues(status="PENDING", fields=QueueAnalytics.POSITION_FIELDS)
+        if pending is None:
+            return None
+        return QueueAnalytics(self.locker, lower_priority_first=self.lower_priority_first).position(
+            queue, pending=pending
+        )
+
+    def next_interval(self, attempt, queue):
+        if queue.get("status") != "PENDING":
+            return self.min_interval
+        now = time.monotonic()
+        if self._last_refresh is None or attempt - self._last_refresh >= self.refresh_every:
+            self._last_refresh = attempt
+            position = self.position(queue)
+            self._estimate = None if position is None else position * self.seconds_per_position
+            self._estimated_at = now
+            logger.debug(f"Queue {queue.get('id')} position: {position}, estimated wait: {self._estimate}s")
+        if self._estimate is None:
+            return self.interval
+        remaining = self._estimate - (now - self._estimated_at)
+        return max(self.min_interval, min(remaining / 2, self.max_interval))
+
+
+POLL_STRATEGIES = {
+    "fixed": FixedPollStrategy,
+    "exponential": ExponentialPollStrategy,
+    "position": QueuePositionPollStrategy,
+}
+
+
+def get_poll_strategy(name, locker, interval=15):
+    """
+    Build a poll strategy by its name, as used by the rlock --poll-strategy argument
+    :param name: One of POLL_STRATEGIES
+    :param locker: ResourceLocker instance, needed by the position strategy
+    :param interval: Interval that bounds the strategy
+    :return: PollStrategy object
+    """
+    if name not in POLL_STRATEGIES:
+        raise ValueError(f"Unknown poll strategy {name}, choose from {', '.join(POLL_STRATEGIES)}")
+    if name == "position":
+        return QueuePositionPollStrategy(locker, interval=interval)
+    return POLL_STRATEGIES[name](interval=interval)
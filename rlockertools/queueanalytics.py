@@ -0,0 +1,360 @@
+from collections import deque
+from rlockertools.exceptions import BadRequestError
+from rlockertools.utils import parse_queue_data
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE = os.path.join(
+    os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state"),
+    "rlockertools",
+    "analytics.json",
+)
+
+
+def parse_time(value):
+    """
+    :param value: Time of the server, ISO 8601 (with a space or a T), naive times are UTC
+    :return float: POSIX timestamp, None if the value is missing or cannot be parsed
+    """
+    if not value:
+        return None
+    if isinstance(value, str) and value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+
+def queue_search_string(queue):
+    """
+    :param queue: Queue dictionary or Queue model
+    :return: Search string the queue was submitted with, None if unknown
+    """
+    try:
+        return (parse_queue_data(queue.get("data")) or {}).get("search_string")
+    except ValueError:
+        return None
+
+
+def queue_rank(queue, lower_priority_first=True):
+    """
+    Order in which the server serves the queues: by priority, then by age (id)
+    :return tuple:
+    """
+    priority = queue.get("priority") or 0
+    try:
+        priority = int(priority)
+    except (TypeError, ValueError):
+        priority = 0
+    return (priority if lower_priority_first else -priority, int(queue.get("id") or 0))
+
+
+class _Aggregate:
+    """
+    Running statistics of the waits of the FINISHED queues of a search string.
+    The count and the total cover the whole history, the percentiles and the pace of
+        the finishes come from the latest `window` queues only.
+    """
+
+    __slots__ = ("count", "total", "waits", "finishes")
+
+    def __init__(self, window, count=0, total=0.0, waits=(), finishes=()):
+        self.count = count
+        self.total = total
+        self.waits = deque(waits, maxlen=window)
+        self.finishes = deque(sorted(finishes), maxlen=window)
+
+    def add(self, wait, finished_at):
+        self.count += 1
+        self.total += wait
+        self.waits.append(wait)
+        if not self.finishes or finished_at >= self.finishes[-1]:
+            self.finishes.append(finished_at)
+        elif finished_at > self.finishes[0]:
+            # Listings are mostly in order, an out of order finish is rare
+            finishes = sorted([*self.finishes, finished_at])
+            self.finishes.clear()
+            self.finishes.extend(finishes)
+
+    def seconds_between_finishes(self):
+        """
+        Median time between two consecutive finishes, None with less than two finishes.
+        The median leaves out the idle periods when nobody was waiting
+        """
+        gaps = sorted(later - earlier for earlier, later in zip(self.finishes, list(self.finishes)[1:]))
+        return gaps[len(gaps) // 2] if gaps else None
+
+    def summary(self):
+        waits = sorted(self.waits)
+        return {
+            "count": self.count,
+            "mean_wait": self.total / self.count if self.count else None,
+            "p50_wait": waits[len(waits) // 2] if waits else None,
+            "p90_wait": waits[min(len(waits) - 1, int(len(waits) * 0.9))] if waits else None,
+            "seconds_between_finishes": self.seconds_between_finishes(),
+        }
+
+    def to_dict(self):
+        return {"count": self.count, "total": self.total, "waits": list(self.waits), "finishes": list(self.finishes)}
+
+
+class QueueAnalytics:
+    """
+    Position of a queue among the PENDING queues and an estimate of its wait,
+        so a scheduler can decide to wait for a pool or to go to another one.
+    The waits of the FINISHED queues are kept as incremental aggregates per search string:
+        refresh() streams the FINISHED listing and only accounts the queues it has not
+        seen yet, nothing is recomputed from the whole history. The aggregates can be
+        saved to a state file, so the next process only accounts the new queues.
+    The queues seen are not remembered one by one: every queue below a floor id (the highest
+        id seen minus id_window) counts as seen, only the ids above it are kept. A queue
+        submitted more than id_window queues before the latest one accounted and finished
+        after the refresh is therefore never accounted.
+    estimate() does not list the FINISHED queues again before refresh_interval seconds.
+    The server does not store when a queue was FINISHED, the last heartbeat of its waiting
+        client is used instead. The queues that were never beaten are not accounted.
+    The estimated wait is 0 if there are enough free resources for the queues ahead,
+        otherwise one median time between two finishes per queue that needs a resource
+        to be released, or the mean wait of the history when there is no pace yet.
+    Usage:
+        analytics = QueueAnalytics(locker, path=DEFAULT_STATE)
+        estimate = analytics.estimate(search_string="label")
+        estimate["position"], estimate["estimated_wait"]
+    """
+
+    # Fields of the queues used to compute the positions and to account the waits
+    POSITION_FIELDS = ("id", "priority", "data")
+    HISTORY_FIELDS = ("id", "time_requested", "last_beat", "data")
+
+    def __init__(self, locker, window=200, lower_priority_first=True, path=None, id_window=1000, refresh_interval=60):
+        """
+        :param locker: ResourceLocker used to list the queues and the resources
+        :param window: Number of the latest FINISHED queues per search string the percentiles
+            and the pace of the finishes are computed from
+        :param lower_priority_first: True if a lower priority value is served first
+        :param path: Optional JSON file the aggregates are loaded from, and saved to by save()
+        :param id_window: Number of the ids below the highest id seen that are remembered one by one,
+            for the queues that finish out of order
+        :param refresh_interval: Seconds estimate() reuses the aggregates for before listing
+            the FINISHED queues again
+        """
+        self.locker = locker
+        self.window = window
+        self.lower_priority_first = lower_priority_first
+        self.path = path
+        self.id_window = id_window
+        self.refresh_interval = refresh_interval
+        # search string (None for all the queues) -> _Aggregate
+        self._aggregates = {}
+        # The ids up to _floor are all seen, _counted holds the ones seen above it
+        self._floor = 0
+        self._counted = set()
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    def _aggregate(self, search_string):
+        aggregate = self._aggregates.get(search_string)
+        if aggregate is None:
+            aggregate = self._aggregates[search_string] = _Aggregate(self.window)
+        return aggregate
+
+    def _seen(self, queue_id):
+        return queue_id <= self._floor or queue_id in self._counted
+
+    def _advance_floor(self):
+        """
+        Forget the ids that fell id_window below the highest id seen.
+        Only done between the refreshes: a listing that is not in the order of the ids
+            must not raise the floor above the queues it has not yielded yet
+        """
+        if self._counted:
+            floor = max(self._counted) - self.id_window
+            if floor > self._floor:
+                self._floor = floor
+                self._counted = {queue_id for queue_id in self._counted if queue_id > floor}
+
+    def add(self, queue):
+        """
+        Account a FINISHED queue in the aggregates, a queue already accounted is ignored
+        :param queue: Queue dictionary or Queue model
+        :return bool: True if the queue was accounted, False if it was seen before
+            or its wait cannot be told
+        """
+        queue_id = int(queue.get("id") or 0)
+        if self._seen(queue_id):
+            return False
+        requested = parse_time(queue.get("time_requested"))
+        finished = parse_time(queue.get("last_beat"))
+        with self._lock:
+            if self._seen(queue_id):
+                return False
+            # Even if it cannot be accounted, so it is not parsed again by the next refresh
+            self._counted.add(queue_id)
+            if requested is None or finished is None or finished < requested:
+                return False
+            wait = finished - requested
+            self._aggregate(None).add(wait, finished)
+            search_string = queue_search_string(queue)
+            if search_string is not None:
+                self._aggregate(search_string).add(wait, finished)
+        return True
+
+    def refresh(self):
+        """
+        Account the FINISHED queues of the server that are not accounted yet
+        :return int: Number of the queues accounted
+        """
+        added = 0
+        # Models, so the data section of the queues accounted before is never decoded
+        for queue in self.locker.iter_queues(status="FINISHED", models=True, fields=self.HISTORY_FIELDS):
+            if self.add(queue):
+                added += 1
+        with self._lock:
+            self._advance_floor()
+        self._refreshed_at = time.monotonic()
+        logger.debug(f"{added} FINISHED queues accounted, all the queues up to {self._floor} are seen")
+        return added
+
+    def history(self, search_string=None):
+        """
+        :param search_string: Search string, None for all the queues
+        :return dict: count, mean_wait, p50_wait, p90_wait (seconds) and seconds_between_finishes
+            of the FINISHED queues of the search string
+        """
+        with self._lock:
+            return (self._aggregates.get(search_string) or _Aggregate(self.window)).summary()
+
+    def position(self, queue=None, search_string=None, pending=None):
+        """
+        Number of PENDING queues that will be served before the given queue,
+            or before a new queue of the search string
+        :param queue: Queue dictionary, None for a queue that is not submitted yet
+        :param search_string: Search string of the new queue, used without a queue
+        :param pending: PENDING queues, listed from the server if not given
+        :return int: position
+        """
+        if pending is None:
+            pending = self._pending()
+        if queue is not None:
+            search_string = queue_search_string(queue)
+            rank = queue_rank(queue, self.lower_priority_first)
+        return sum(
+            1
+            for other in pending
+            if (queue is None or str(other.get("id")) != str(queue.get("id")))
+            and (search_string is None or queue_search_string(other) in (None, search_string))
+            and (queue is None or queue_rank(other, self.lower_priority_first) < rank)
+        )
+
+    def _pending(self):
+        pending = self.locker.get_queues(status="PENDING", fields=self.POSITION_FIELDS)
+        if not isinstance(pending, list):
+            raise BadRequestError("The PENDING queues cannot be listed")
+        return pending
+
+    def estimate(self, queue_id=None, search_string=None, refresh=True):
+        """
+        Position and estimated wait of a queue, or of a new queue of the search string
+        :param queue_id: Queue to estimate, None for a queue that is not submitted yet
+        :param search_string: Search string of the new queue, used without queue_id
+        :param refresh: Account the new FINISHED queues of the server first,
+            if the last refresh is older than refresh_interval
+        :return dict: {
+            "queue_id", "status", "search_string",
+            "position": number of PENDING queues served before,
+            "free_resources", "total_resources": resources matching the search string,
+            "estimated_wait": seconds, None without any history,
+            "history": history() of the search string (of all the queues if it has none),
+        }
+        :raises: BadRequestError if the queue, the queues or the resources cannot be listed
+        """
+        queue = None
+        if queue_id is not None:
+            queue = self.locker.get_queue(queue_id)
+            if not queue:
+                raise BadRequestError(f"Queue {queue_id} cannot be retrieved")
+            search_string = queue_search_string(queue)
+        if refresh and (
+            self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_interval
+        ):
+            self.refresh()
+
+        status = queue.get("status") if queue else None
+        position = self.position(queue, search_string) if status in (None, "INITIALIZING", "PENDING") else 0
+        if search_string:
+            resources = self.locker.find_available(search_string, free_only=False)["resources"]
+        else:
+            resources = []
+        free = sum(1 for resource in resources if not resource.get("is_locked"))
+
+        history = self.history(search_string)
+        if not history["count"]:
+            history = self.history(None)
+        if status == "FINISHED" or position < free:
+            estimated_wait = 0
+        elif history["seconds_between_finishes"] is not None:
+            estimated_wait = (position + 1 - free) * history["seconds_between_finishes"]
+        else:
+            estimated_wait = history["mean_wait"]
+        return {
+            "queue_id": queue_id,
+            "status": status,
+            "search_string": search_string,
+            "position": position,
+            "free_resources": free,
+            "total_resources": len(resources),
+            "estimated_wait": estimated_wait,
+            "history": history,
+        }
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            logger.warning(f"Ignoring the corrupted analytics state {self.path}")
+            return
+        self._floor = state.get("floor", 0)
+        self._counted = set(state.get("counted", ()))
+        # The state files written before the floor hold every id seen
+        self._advance_floor()
+        for search_string, aggregate in state.get("aggregates", ()):
+            self._aggregates[search_string] = _Aggregate(self.window, **aggregate)
+
+    def save(self, path=None):
+        """
+        Write the aggregates to a file, atomically
+        :param path: File to write to, the path of the constructor by default
+        :return: None
+        """
+        path = path or self.path
+        with self._lock:
+            state = {
+                "floor": self._floor,
+                "counted": sorted(self._counted),
+                # A list of pairs, the search strings include None
+                "aggregates": [
+                    [search_string, aggregate.to_dict()] for search_string, aggregate in self._aggregates.items()
+                ],
+            }
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".rlockertools-analytics-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,273 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.exceptions import ConnectionError
+from rlockertools.exceptions import QueueFailedError
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueueWatcher:
+    """
+    Drives many queues from one poll loop instead of a wait_until_finished call per queue.
+    Every cycle does:
+        - a single connection check
+        - a listing of the INITIALIZING and PENDING queues (bulk status),
+            a queue that left those listings is fetched on its own once.
+            Fewer queues than listings are fetched on their own right away
+        - a heartbeat for every queue that is still waiting and was not beaten
+            during the last interval
+    Each watched queue gets a concurrent.futures.Future, resolved with the queue JSON
+        when it is FINISHED, or failed with QueueFailedError when it is ABORTED/FAILED.
+    Usage:
+        watcher = QueueWatcher(locker, interval=15)
+        futures = [watcher.watch(queue_id) for queue_id in queue_ids]
+        watcher.run(attempts=120)
+    """
+
+    WAITING_STATUSES = ("INITIALIZING", "PENDING")
+    FAILED_STATUSES = ("ABORTED", "FAILED")
+    FINISHED_STATUS = "FINISHED"
+
+    def __init__(
+        self, locker, queue_ids=(), interval=15, beat=True, max_workers=8, heartbeater=None
+    ):
+        """
+        :param locker: ResourceLocker instance to send the requests with
+        :param queue_ids: Queue ids to start watching right away
+        :param interval: Time to wait in seconds between the cycles
+        :param beat: Beat the waiting queues on every cycle
+        :param max_workers: Number of heartbeats that are sent concurrently
+        :param heartbeater: Optional running Heartbeater, the watched queues are beaten
+            by it instead of on every cycle
+        """
+        self.locker = locker
+        self.interval = interval
+        self.beat = beat and heartbeater is None
+        self.heartbeater = heartbeater
+        self.max_workers = max_workers
+        self._watched = {}
+        # queue_id -> time.monotonic() of its last heartbeat
+        self._beaten = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        for queue_id in queue_ids:
+            self.watch(queue_id)
+
+    def watch(self, queue_id, callback=None):
+        """
+        Start watching a queue
+        :param queue_id:
+        :param callback: Optional callable(queue_id, queue) called once
+            the queue reaches FINISHED, ABORTED or FAILED
+        :return: concurrent.futures.Future of the queue JSON
+        """
+        with self._lock:
+            if queue_id in self._watched:
+                return self._watched[queue_id][0]
+            future = Future()
+            self._watched[queue_id] = (future, callback)
+        if self.heartbeater is not None:
+            self.heartbeater.add(queue_id)
+        return future
+
+    def unwatch(self, queue_id):
+        """
+        Stop watching a queue, its future is cancelled if still pending
+        :param queue_id:
+        :return: None
+        """
+        with self._lock:
+            watched = self._watched.pop(queue_id, None)
+            self._beaten.pop(queue_id, None)
+        if watched:
+            watched[0].cancel()
+            if self.heartbeater is not None:
+                self.heartbeater.remove(queue_id)
+
+    @property
+    def pending(self):
+        """
+        Queue ids that did not reach a final status yet
+        """
+        with self._lock:
+            return list(self._watched)
+
+    def _resolve(self, queue_id, queue=None, error=None):
+        with self._lock:
+            watched = self._watched.pop(queue_id, None)
+            self._beaten.pop(queue_id, None)
+        if not watched:
+            return
+        if self.heartbeater is not None:
+            self.heartbeater.remove(queue_id)
+        future, callback = watched
+        if error is not None:
+            future.set_exception(error)
+        elif queue.get("status") == self.FINISHED_STATUS:
+            future.set_result(queue)
+        else:
+            future.set_exception(QueueFailedError(queue))
+        if callback:
+            try:
+                callback(queue_id, queue)
+            except Exception as e:
+                logger.error(f"Callback for queue {queue_id} raised: {str(e)}")
+
+    def _fetch_statuses(self, queue_ids):
+        """
+        Bulk fetch of the watched queues. Waiting queues are found in the listings,
+            the rest changed their status and are fetched one by one
+        :param queue_ids:
+        :return dict: queue_id -> queue JSON (None if the queue does not exist)
+        """
+        wanted = {str(queue_id): queue_id for queue_id in queue_ids}
+        found = {}
+        # Cheaper than the listings for a few queues
+        statuses = self.WAITING_STATUSES if len(queue_ids) > len(self.WAITING_STATUSES) else ()
+        for status in statuses:
+            # Only the status is needed, the rest of the waiting queues is not downloaded
+            listing = self.locker.get_queues(status=status, fields=("id", "status"))
+            if listing is None:
+                break
+            for queue in listing:
+                queue_id = wanted.get(str(queue.get("id")))
+                if queue_id is not None:
+                    found[queue_id] = queue
+        for queue_id in queue_ids:
+            if queue_id not in found:
+                found[queue_id] = self.locker.get_queue(queue_id)
+        return found
+
+    def _due(self, queue_ids):
+        """
+        :return list: The queue ids not beaten during the last interval, marked as beaten now
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                queue_id
+                for queue_id in queue_ids
+                if queue_id in self._watched and now - self._beaten.get(queue_id, -self.interval) >= self.interval
+            ]
+            self._beaten.update(dict.fromkeys(due, now))
+        return due
+
+    def _beat(self, executor, queue_ids):
+        futures = [
+            executor.submit(self.locker.beat_queue, queue_id, suppress_logs=True)
+            for queue_id in queue_ids
+        ]
+        for queue_id, future in zip(queue_ids, futures):
+            try:
+                future.result()
+            except ConnectionError:
+                raise
+            except Exception as e:
+                logger.error(f"Something went wrong beating {queue_id}: {str(e)}")
+
+    def poll_once(self, executor=None, queue_ids=None):
+        """
+        One cycle over the watched queues
+        :param executor: Optional executor to send the heartbeats with
+        :param queue_ids: Only check these watched queues (e.g. the ones just registered),
+            all of them by default
+        :return: list of the queue ids that are still waiting (of the given ones)
+        """
+        pending = self.pending
+        queue_ids = pending if queue_ids is None else [queue_id for queue_id in queue_ids if queue_id in pending]
+        if not queue_ids:
+            return []
+        self.locker.check_connection()
+        for queue_id, queue in self._fetch_statuses(queue_ids).items():
+            if not queue:
+                self._resolve(
+                    queue_id,
+                    error=Exception(f"Queue {queue_id} seems to not exist on the server!"),
+                )
+            elif queue.get("status") in self.FAILED_STATUSES + (self.FINISHED_STATUS,):
+                self._resolve(queue_id, queue)
+        pending = self.pending
+        waiting = [queue_id for queue_id in queue_ids if queue_id in pending]
+        due = self._due(waiting) if self.beat else []
+        if due:
+            if executor is None:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    self._beat(executor, due)
+            else:
+                self._beat(executor, due)
+        return waiting
+
+    def run(self, attempts=None, abort_on_timeout=True):
+        """
+        Poll until every watched queue reached a final status or stop() is called
+        :param attempts: Maximum number of cycles, None means no limit
+        :param abort_on_timeout: Abort the queues that are still waiting
+            after the last attempt
+        :return: None
+        """
+        self._stop_event.clear()
+        attempt = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not self._stop_event.is_set():
+                if attempts is not None and attempt >= attempts:
+                    self._timeout(attempts, abort_on_timeout)
+                    return
+                try:
+                    if not self.poll_once(executor):
+                        return
+                except ConnectionError as e:
+                    logger.error(
+                        "Connection Error to the specified URL! \n"
+                        "Error is: \n"
+                        f"{str(e)}"
+                    )
+                except Exception:
+                    # An odd answer of the server must not leave the futures pending forever,
+                    # the next cycle tries again
+                    logger.exception("Polling the watched queues failed")
+                attempt += 1
+                self._stop_event.wait(self.interval)
+
+    def _timeout(self, attempts, abort_on_timeout):
+        for queue_id in self.pending:
+            if abort_on_timeout:
+                try:
+                    self.locker.abort_queue(
+                        queue_id=queue_id,
+                        abort_msg="Timeout Reached for this queue. \n"
+                        f"Attempts: {attempts} \n"
+                        f"Interval: {self.interval} seconds",
+                    )
+                except Exception as e:
+                    logger.error(f"Could not abort the queue {queue_id}: {str(e)}")
+            self._resolve(
+                queue_id,
+                error=Exception(f"Timeout Reached! Queue {queue_id} is not {self.FINISHED_STATUS}!"),
+            )
+
+    def start(self, attempts=None, abort_on_timeout=True):
+        """
+        Run the poll loop in a background thread
+        :return: threading.Thread
+        """
+        self._thread = threading.Thread(
+            target=self.run,
+            kwargs={"attempts": attempts, "abort_on_timeout": abort_on_timeout},
+            name="rlockertools-queuewatcher",
+            daemon=True,
+        )
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        """
+        Stop the poll loop, the waiting queues keep their pending futures
+        :return: None
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
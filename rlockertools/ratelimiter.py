@@ -0,0 +1,105 @@
+from rlockertools.exceptions import RateLimitExceededError
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    rate tokens per second, up to burst of them saved while idle.
+    A token is reserved even if it is not there yet (the bucket goes below zero),
+        the caller sleeps until it is due, so the waiting callers are served in order
+        and nobody holds the lock while sleeping.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: Tokens per second
+        :param burst: Maximal number of saved tokens, max(1, rate) by default
+        """
+        if rate <= 0:
+            raise ValueError("The rate must be positive")
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait=None):
+        """
+        Take a token
+        :param max_wait: Maximal seconds to wait for it, None for no limit
+        :return float: Seconds to wait before using the token, None if it is beyond max_wait
+            (no token is taken then)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._tokens + (now - self._last) * self.rate, self.burst)
+            self._last = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+
+class RateLimiter:
+    """
+    Token bucket per API endpoint (the names of Metrics.endpoint_of: retrieve_entrypoint,
+        resources, resource, rqueues, rqueue, other), so a client shared by many jobs
+        cannot flood the server. A request over the rate waits for its token.
+    Usage:
+        limiter = RateLimiter({"rqueue": (5, 10)}, default=20)
+        ResourceLocker(url, token, rate_limiter=limiter)
+    """
+
+    def __init__(self, limits=None, default=None, max_wait=None):
+        """
+        :param limits: dict endpoint -> requests per second, or (requests per second, burst)
+        :param default: Limit of every endpoint not in limits (a bucket each), None for no limit
+        :param max_wait: Maximal seconds a request waits for its token, RateLimitExceededError
+            is raised instead of waiting longer. None waits as long as needed
+        """
+        self.limits = dict(limits or {})
+        self.default = default
+        self.max_wait = max_wait
+        self.throttled = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(limit):
+        rate, burst = limit if isinstance(limit, tuple) else (limit, None)
+        return TokenBucket(rate, burst)
+
+    def bucket(self, endpoint):
+        """
+        :return TokenBucket: Bucket of the endpoint, None if it is not limited
+        """
+        with self._lock:
+            if endpoint not in self._buckets:
+                limit = self.limits.get(endpoint, self.default)
+                self._buckets[endpoint] = None if limit is None else self._bucket(limit)
+            return self._buckets[endpoint]
+
+    def acquire(self, endpoint):
+        """
+        Wait until a request to the endpoint is allowed
+        :param endpoint: Name of the endpoint
+        :return float: Seconds waited
+        :raises: RateLimitExceededError if the wait would be longer than max_wait
+        """
+        bucket = self.bucket(endpoint)
+        if bucket is None:
+            return 0.0
+        wait = bucket.reserve(self.max_wait)
+        if wait is None:
+            raise RateLimitExceededError(endpoint, bucket.rate)
+        if wait:
+            with self._lock:
+                self.throttled += 1
+            logger.debug(f"Rate limit of {endpoint} reached, waiting {wait:.2f}s")
+            time.sleep(wait)
+        return wait
@@ -0,0 +1,168 @@
+from collections import defaultdict
+import bisect
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceIndex:
+    """
+    Local index over a snapshot of the lockable resources, answering compound queries
+        without going back to the server or scanning the whole list.
+    Indexes:
+        - name (hash) and a sorted list of names for prefix queries
+        - signoff (hash)
+        - lock state (is_locked)
+        - labels (inverted index label -> names)
+    Usage:
+        index = ResourceIndex.from_locker(locker)
+        index.query(labels=["aws", "east"], free=True, name_prefix="cluster-")
+        index.refresh(locker.all())  # applies only the changed records
+    """
+
+    def __init__(self, resources=()):
+        """
+        :param resources: Iterable of resource dictionaries, as returned by ResourceLocker.all()
+        """
+        self._resources = {}
+        self._names = []
+        self._by_signoff = defaultdict(set)
+        self._by_lock = {True: set(), False: set()}
+        self._by_label = defaultdict(set)
+        self.refresh(resources)
+
+    @classmethod
+    def from_locker(cls, locker):
+        """
+        Build the index from a single ResourceLocker.all() snapshot
+        :param locker: ResourceLocker instance
+        :return: ResourceIndex object
+        """
+        return cls(locker.all())
+
+    @staticmethod
+    def labels_of(resource):
+        """
+        Labels of a resource, whether they come as a list (of names or of dictionaries
+            with a name) or as a single string separated by whitespace or commas
+        :param resource: Resource dictionary
+        :return set:
+        """
+        labels = resource.get("labels")
+        if labels is None:
+            labels = resource.get("labels_string")
+        if not labels:
+            return set()
+        if isinstance(labels, str):
+            return {label for label in re.split(r"[\s,]+", labels) if label}
+        return {label.get("name") if isinstance(label, dict) else str(label) for label in labels} - {None}
+
+    def __len__(self):
+        return len(self._resources)
+
+    def __contains__(self, name):
+        return name in self._resources
+
+    def __iter__(self):
+        return iter(self._resources.values())
+
+    def get(self, name):
+        return self._resources.get(name)
+
+    def _add(self, resource):
+        name = resource["name"]
+        self._resources[name] = resource
+        self._by_signoff[resource.get("signoff")].add(name)
+        self._by_lock[bool(resource.get("is_locked"))].add(name)
+        for label in self.labels_of(resource):
+            self._by_label[label].add(name)
+
+    def _remove(self, name):
+        resource = self._resources.pop(name)
+        self._discard(self._by_signoff, resource.get("signoff"), name)
+        self._by_lock[bool(resource.get("is_locked"))].discard(name)
+        for label in self.labels_of(resource):
+            self._discard(self._by_label, label, name)
+
+    @staticmethod
+    def _discard(index, key, name):
+        names = index.get(key)
+        if names is not None:
+            names.discard(name)
+            if not names:
+                del index[key]
+
+    def refresh(self, resources, partial=False):
+        """
+        Apply a new snapshot, only the records that changed are re-indexed
+        :param resources: Iterable of resource dictionaries
+        :param partial: If True, the resources are only the changed ones,
+            the others are kept instead of being removed
+        :return dict: Number of added, updated and removed records
+        """
+        changes = {"added": 0, "updated": 0, "removed": 0}
+        seen = set()
+        for resource in resources:
+            name = resource["name"]
+            seen.add(name)
+            current = self._resources.get(name)
+            if current is None:
+                changes["added"] += 1
+            elif current != resource:
+                self._remove(name)
+                changes["updated"] += 1
+            else:
+                continue
+            self._add(dict(resource))
+        if not partial:
+            for name in [name for name in self._resources if name not in seen]:
+                self._remove(name)
+                changes["removed"] += 1
+        if changes["added"] or changes["removed"]:
+            # One sort for the whole snapshot instead of an insertion per record
+            self._names = sorted(self._resources)
+        logger.debug(f"Resource index refreshed: {changes}")
+        return changes
+
+    def _with_prefix(self, prefix):
+        names = set()
+        for index in range(bisect.bisect_left(self._names, prefix), len(self._names)):
+            name = self._names[index]
+            if not name.startswith(prefix):
+                break
+            names.add(name)
+        return names
+
+    def query(self, labels=None, free=None, name=None, name_prefix=None, signoff=None):
+        """
+        Resources matching all of the given conditions
+        :param labels: Label or list of labels the resource must all have
+        :param free: True for free resources only, False for locked only, None for both
+        :param name: Exact name
+        :param name_prefix: Prefix of the name
+        :param signoff: Exact signoff
+        :return list: Resource dictionaries, sorted by name. They are shared with the
+            index, copy them before modifying
+        """
+        candidates = []
+        if name is not None:
+            candidates.append({name} if name in self._resources else set())
+        if signoff is not None:
+            candidates.append(self._by_signoff.get(signoff, set()))
+        if free is not None:
+            candidates.append(self._by_lock[not free])
+        if labels:
+            if isinstance(labels, str):
+                labels = [labels]
+            candidates.extend(self._by_label.get(label, set()) for label in labels)
+        if name_prefix:
+            candidates.append(self._with_prefix(name_prefix))
+
+        if not candidates:
+            names = self._names
+        else:
+            # Intersect starting from the smallest set
+            candidates.sort(key=len)
+            names = sorted(set(candidates[0]).intersection(*candidates[1:]))
+        return [self._resources[name] for name in names]
@@ -1,8 +1,25 @@
-from requests.exceptions import ConnectionError, ReadTimeout
-from rlockertools.exceptions import BadRequestError, TimeoutReachedForLockingResource
-from rlockertools.utils import prettify_output, parse_queue_data
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.exceptions import ConnectionError, ReadTimeout, RequestException
+from urllib.parse import urlencode
+from rlockertools.exceptions import (
+    BadRequestError,
+    CircuitOpenError,
+    PartialLockError,
+    QueueFailedError,
+    TimeoutReachedForLockingResource,
+)
+from rlockertools.utils import prettify_output, iter_json_array
+from rlockertools.session import build_session, connection_stats
+from rlockertools.pollstrategy import FixedPollStrategy
+from rlockertools.waittransport import PollingWaitTransport
+from rlockertools.circuitbreaker import backoff_delay, default_retry_budget, get_circuit_breaker, is_final, jittered
+from rlockertools.metrics import Metrics
+from rlockertools.models import Queue, Resource
+from rlockertools.queuewatcher import QueueWatcher
+from rlockertools.singleflight import SingleFlight
 import datetime
+import gzip
+import itertools
 import json
 import time
 import pprint
@@ -10,15 +27,105 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Request bodies from this size on are gzipped with compress_requests
+COMPRESS_MIN_SIZE = 1024
+# Seconds before ?fields= is sent again to a server that ignored it
+SPARSE_FIELDS_RECHECK = 3600
+# Key of the data section of a FINISHED queue naming the resource the server locked for it
+QUEUE_RESOURCE_KEY = "resource_locked"
+
 
 class ResourceLocker:
-    def __init__(self, instance_url, token, max_retries=3, retry_delay=1):
+    def __init__(
+        self,
+        instance_url,
+        token,
+        max_retries=3,
+        retry_delay=1,
+        pool_connections=10,
+        pool_maxsize=10,
+        pool_block=False,
+        keep_alive=True,
+        session=None,
+        cache=None,
+        lazy=True,
+        health_endpoint=None,
+        health_ttl=30,
+        circuit_breaker=None,
+        retry_budget=None,
+        metrics=None,
+        partial_updates=False,
+        rate_limiter=None,
+        coalesce_gets=False,
+        compress_requests=False,
+    ):
+        """
+        :param instance_url: URL of the Resource Locker Server
+        :param token: Token of the user that creates API calls
+        :param max_retries: Number of attempts for GET requests
+        :param retry_delay: Base delay in seconds for the exponential backoff
+        :param pool_connections: Number of per-host connection pools to cache
+        :param pool_maxsize: Maximum number of connections kept open per host
+        :param pool_block: Never open more than pool_maxsize connections per host
+        :param keep_alive: Reuse connections between the requests
+        :param session: Optional requests.Session to use instead of building one,
+            it is not closed by close() in that case
+        :param cache: Optional ResponseCache for the resource listings, it is invalidated
+            by lock_resource/release of this client
+        :param lazy: Do not check the connection while constructing, the first request
+            (or an explicit check_connection()) will tell if the server is reachable
+        :param health_endpoint: URL (or path relative to instance_url) probed with HEAD
+            by check_connection, the instance_url by default
+        :param health_ttl: Seconds a successful probe, or any successful API call,
+            counts as proof that the server is up. 0 probes on every check_connection
+        :param circuit_breaker: CircuitBreaker guarding the requests, the one shared by the
+            process for this instance_url by default
+        :param retry_budget: RetryBudget limiting the retries, the one shared by the process by default
+        :param metrics: Optional Metrics to record the requests, retries and time to lock to
+        :param partial_updates: Lock/release with a PATCH of the changed fields only,
+            instead of a PUT of the whole resource. The server must support PATCH
+        :param rate_limiter: Optional RateLimiter every request waits on, per endpoint
+        :param coalesce_gets: While a GET is in flight, the identical GETs of the other threads
+            wait for it and share its response instead of sending their own
+        :param compress_requests: Gzip the request bodies of COMPRESS_MIN_SIZE bytes or more,
+            the server must accept Content-Encoding: gzip. This is the only compression setting,
+            the responses are compressed anyway if the server supports it: the default
+            Accept-Encoding of requests asks for gzip/deflate, and br with the brotli package installed
+        """
         self.instance_url = instance_url
         self.token = token
         self.max_retries = max_retries
         self.retry_delay = retry_delay
 
-        self.check_connection()
+        self.cache = cache
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker(instance_url)
+        self.retry_budget = retry_budget or default_retry_budget
+        self.metrics = metrics
+        self.partial_updates = partial_updates
+        self.rate_limiter = rate_limiter
+        self.single_flight = SingleFlight() if coalesce_gets else None
+        self.compress_requests = compress_requests
+        # listing endpoint -> whether the server honours ?fields=, None until known
+        self._sparse_fields = {}
+        # listing endpoint -> time.monotonic() when the server was found ignoring ?fields=
+        self._sparse_fields_checked = {}
+        self._owns_session = session is None
+        self.session = session or build_session(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            keep_alive=keep_alive,
+        )
+
+        # queue_id -> (data section, ETag) from the last response of the queue
+        self._queue_data = {}
+
+        if health_endpoint and health_endpoint.startswith("/"):
+            health_endpoint = self.instance_url + health_endpoint
+        self.health_endpoint = health_endpoint or self.instance_url
+        self.health_ttl = health_ttl
+        self._health_method = "HEAD"
+        self._alive_until = 0
 
         self.endpoints = {
             "resources": f"{self.instance_url}/api/resources",
@@ -33,54 +140,284 @@ class ResourceLocker:
             "Authorization": f"Token {self.token}",
         }
 
-    def _get_with_retry(self, url, headers=None, timeout=None):
+        if not lazy:
+            self.check_connection()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
         """
-        Wrapper for requests.get with retry logic for non-200 status codes
+        Close the pooled connections of the session
+        :return: None
+        """
+        if self._owns_session:
+            self.session.close()
 
-        :param url: URL to make GET request to
+    def connection_stats(self):
+        """
+        Counters of the pooled session, showing how many requests
+            reused an already opened connection
+        :return dict:
+        """
+        return connection_stats(self.session)
+
+    def _request(self, method, url, long_poll=False, **kwargs):
+        """
+        Send a single request through the pooled session
+        :param method: HTTP method
+        :param url: URL to send the request to
+        :param long_poll: The server may hold the request until the timeout,
+            a ReadTimeout is then not a failure of the server
+        :param kwargs: Keyword arguments passed to requests.Session.request
+        :return: requests.Response object
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(Metrics.endpoint_of(url))
+        data = kwargs.get("data")
+        if self.compress_requests and isinstance(data, str) and len(data) >= COMPRESS_MIN_SIZE:
+            kwargs["data"] = gzip.compress(data.encode("utf8"))
+            kwargs["headers"] = dict(kwargs.get("headers") or {}, **{"Content-Encoding": "gzip"})
+        self.circuit_breaker.before_request()
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except (ConnectionError, ReadTimeout) as e:
+            if long_poll and isinstance(e, ReadTimeout):
+                # Nothing happened in time, the server is not failing
+                self.circuit_breaker.release_probe()
+                raise
+            self._alive_until = 0
+            self.circuit_breaker.record_failure()
+            if self.metrics is not None:
+                self.metrics.record_request(
+                    method, url, None, time.monotonic() - start, len(kwargs.get("data") or "")
+                )
+            raise
+        except RequestException:
+            # A broken answer: ChunkedEncodingError, TooManyRedirects, InvalidHeader...
+            self.circuit_breaker.record_failure()
+            raise
+        except BaseException:
+            # Interrupted, it tells nothing about the server
+            self.circuit_breaker.release_probe()
+            raise
+        if self.metrics is not None:
+            self._record_request(method, url, response, time.monotonic() - start, kwargs)
+        self.retry_budget.deposit()
+        if response.status_code < 500:
+            # Any answer of the server that is not a server error proves it is up
+            self._alive_until = time.monotonic() + self.health_ttl
+            self.circuit_breaker.record_success()
+        else:
+            self.circuit_breaker.record_failure()
+        return response
+
+    def _record_request(self, method, url, response, latency, kwargs):
+        # The announced size is the one on the wire (compressed), and reading the body
+        # here would defeat the streaming
+        received = int(response.headers.get("Content-Length") or 0)
+        if not received and not kwargs.get("stream"):
+            received = len(response.content)
+        self.metrics.record_request(
+            method, url, response.status_code, latency, len(kwargs.get("data") or ""), received
+        )
+
+    def _get_with_retry(self, url, headers=None, timeout=None, stream=False):
+        """
+        Wrapper for GET requests with retry logic for non-200 status codes
+            (304 is a final answer as well, it only comes to a conditional request)
+        With coalesce_gets, the identical GETs in flight share one request (and its retries),
+            except the streamed ones, their body can only be read once
+        """
+        if self.single_flight is None or stream:
+            return self._request_with_retry(
+                "GET", url, headers=headers, timeout=timeout, stream=stream
+            )
+        key = (url, timeout, tuple(sorted((headers or {}).items())))
+        return self.single_flight.do(
+            key, self._request_with_retry, "GET", url, headers=headers, timeout=timeout
+        )
+
+    def _request_with_retry(
+        self, method, url, headers=None, timeout=None, stream=False, accept=(200, 304), data=None
+    ):
+        """
+        Wrapper for requests with retry logic for non-200 status codes
+            (304 is a final answer as well, it only comes to a conditional request).
+        Writes are retried on 5xx and connection errors only, and must be idempotent.
+        The backoff is jittered, the retries are limited by the retry budget shared
+            by the process and the circuit breaker of the server is never retried.
+
+        :param method: HTTP method
+        :param url: URL to make the request to
         :param headers: Optional headers dictionary
         :param timeout: Optional timeout value
+        :param stream: Do not download the body right away
+        :param accept: Status codes that are returned without retrying
+        :param data: Optional body of the request
         :return: requests.Response object
         """
         last_response = None
         for attempt in range(self.max_retries):
             try:
-                response = requests.get(url, headers=headers, timeout=timeout)
-                if response.status_code == 200:
-                    return response
-                last_response = response
-                if attempt < self.max_retries - 1:
-                    delay = self.retry_delay * (2 ** attempt)  # Exponential backoff
-                    logger.warning(
-                        f"Request to {url} returned status {response.status_code}, "
-                        "retrying in {delay}s... (attempt {attempt + 1}/{self.max_retries})"
-                    )
-                    time.sleep(delay)
+                response = self._request(
+                    method, url, headers=headers, timeout=timeout, stream=stream, data=data
+                )
+            except CircuitOpenError:
+                raise
             except (ConnectionError, ReadTimeout):
-                if attempt < self.max_retries - 1:
-                    delay = self.retry_delay * (2 ** attempt)
-                    logger.warning(
-                        f"Connection error to {url}, retrying in {delay}s... "
-                        "(attempt {attempt + 1}/{self.max_retries})"
-                    )
-                    time.sleep(delay)
-                else:
+                delay = backoff_delay(attempt, self.max_retries, self.retry_delay, self.retry_budget, f"{method} {url}")
+                if delay is None:
                     raise
+                self._retrying(method, url, delay, attempt, "Connection error")
+                continue
+            if is_final(method, response.status_code, accept):
+                return response
+            if last_response is not None:
+                last_response.close()
+            last_response = response
+            delay = backoff_delay(attempt, self.max_retries, self.retry_delay, self.retry_budget, f"{method} {url}")
+            if delay is None:
+                break
+            self._retrying(method, url, delay, attempt, f"Status {response.status_code}")
         return last_response
 
-    def check_connection(self, silent=True):
+    def _retrying(self, method, url, delay, attempt, reason):
+        if self.metrics is not None:
+            self.metrics.record_retry(method, url)
+        logger.warning(
+            f"{reason} from {url}, retrying in {delay:.1f}s... (attempt {attempt + 1}/{self.max_retries})"
+        )
+        time.sleep(delay)
+
+    def _get_json(self, url):
+        """
+        GET a JSON listing, served from the cache when one is configured
+        :param url: URL to make GET request to
+        :return: (requests.Response object or None if served from the cache,
+            decoded JSON or None if the status code was not 200)
+        """
+        if self.cache is None:
+            req = self._get_with_retry(url, headers=self.headers)
+            if req.status_code == 200:
+                # json.loads detects the encoding of the raw bytes, no str round trip
+                return req, json.loads(req.content)
+            return req, None
+
+        cached = self.cache.lookup(url)
+        if cached and cached[1]:
+            return None, json.loads(cached[0])
+        headers = dict(self.headers, **cached[2]) if cached else self.headers
+        req = self._get_with_retry(url, headers=headers)
+        if req.status_code == 304 and cached:
+            self.cache.refresh(url)
+            return req, json.loads(cached[0])
+        if req.status_code == 200:
+            self.cache.store(url, req)
+            return req, json.loads(req.text)
+        return req, None
+
+    def _iter_listing(self, url, query=None):
         """
-        Checks Connection to the provided URL after initialization
+        Stream a JSON listing record by record.
+        A plain JSON array is parsed incrementally, a page object ({"results": [...], "next": url})
+            is followed page by page, so is a Link: <url>; rel="next" header
+        :param url: URL of the listing
+        :param query: Optional dictionary of query parameters
+        :return: generator of the records
+        :raises: BadRequestError if the server does not return 200
+        """
+        if query:
+            url = f"{url}?{urlencode(query)}"
+        while url:
+            req = self._get_with_retry(url, headers=self.headers, stream=True)
+            if req.status_code != 200:
+                prettify_output(req.text)
+                raise BadRequestError
+            with req:
+                chunks = req.iter_content(chunk_size=64 * 1024)
+                head = b""
+                for chunk in chunks:
+                    head += chunk
+                    if head.strip():
+                        break
+                if head.lstrip().startswith(b"{"):
+                    page = json.loads(head + b"".join(chunks))
+                    yield from page.get("results", [])
+                    url = page.get("next")
+                else:
+                    yield from iter_json_array(itertools.chain([head], chunks))
+                    url = req.links.get("next", {}).get("url")
 
+    def _fields_param(self, endpoint, fields):
+        """
+        :return dict: The sparse fieldset query parameter, empty if the server was found ignoring it
+            less than SPARSE_FIELDS_RECHECK seconds ago
+        """
+        if not fields:
+            return {}
+        if self._sparse_fields.get(endpoint) is False:
+            if time.monotonic() - self._sparse_fields_checked.get(endpoint, 0) < SPARSE_FIELDS_RECHECK:
+                return {}
+            # Maybe upgraded since, the next records tell again
+            self._sparse_fields[endpoint] = None
+        return {"fields": ",".join(fields)}
+
+    def _with_fields(self, url, endpoint, fields):
+        param = self._fields_param(endpoint, fields)
+        if not param:
+            return url
+        separator = "" if url.endswith(("?", "&")) else "&" if "?" in url else "?"
+        return f"{url}{separator}{urlencode(param, safe=',')}"
+
+    def _project(self, records, endpoint, fields):
+        """
+        Keep only the requested fields of the records. Servers that ignored ?fields= are
+            noticed on the first record, the parameter is not sent to them for
+            SPARSE_FIELDS_RECHECK seconds
+        :return: generator of the projected records
+        """
+        fields = set(fields)
+        for record in records:
+            if self._sparse_fields.get(endpoint) is None:
+                self._sparse_fields[endpoint] = set(record) <= fields
+                if not self._sparse_fields[endpoint]:
+                    self._sparse_fields_checked[endpoint] = time.monotonic()
+                    logger.debug(f"The server ignores ?fields= on {endpoint}, projecting locally")
+            yield {key: value for key, value in record.items() if key in fields}
+
+    def _invalidate_resources(self):
+        if self.cache is not None:
+            self.cache.invalidate(self.endpoints["resources"])
+
+    def check_connection(self, silent=True, force=False):
+        """
+        Checks Connection to the provided URL with a HEAD request on the health endpoint
+            (GET if the server does not allow HEAD).
+        The result is cached for health_ttl seconds, successful API calls refresh it too.
+
+        :param force: Probe the server even if it is known to be up
         :return: None
         :raises: Connection Error
         """
-        req = self._get_with_retry(self.instance_url)
+        if not force and self._alive_until > time.monotonic():
+            return
+        req = self._request_with_retry(
+            self._health_method, self.health_endpoint, accept=(200, 405, 501)
+        )
+        if req.status_code in (405, 501) and self._health_method == "HEAD":
+            self._health_method = "GET"
+            req = self._request_with_retry(self._health_method, self.health_endpoint)
         if req.status_code == 200:
             if not silent:
                 logger.info({"CONNECTION": "OK"})
             return
         else:
+            self._alive_until = 0
             # Raise Connection Error if no 200
             raise ConnectionError
 
@@ -105,9 +442,14 @@ class ResourceLocker:
         data_json = json.dumps(data)
 
         try:
-            req = requests.put(
-                final_endpoint, headers=self.headers, data=data_json, timeout=timeout
+            req = self._request(
+                "PUT", final_endpoint, headers=self.headers, data=data_json, timeout=timeout
             )
+            if self.metrics is not None and req.ok:
+                try:
+                    self.metrics.lock_started(req.json().get("id"))
+                except ValueError:
+                    pass
             return req
 
         except ReadTimeout:
@@ -121,15 +463,31 @@ class ResourceLocker:
             is about to lock
         :return: Response after the PUT request
         """
-        lockable_resource = dict(resource)
-        lockable_resource["is_locked"] = True
-        lockable_resource["signoff"] = signoff
+        return self._update_resource(resource, is_locked=True, signoff=signoff)
 
-        final_endpoint = self.endpoints["resource"] + lockable_resource["name"]
-        newjson = json.dumps(lockable_resource)
+    def _update_resource(self, resource, **changes):
+        """
+        Send the resource with the changes applied, or with partial_updates,
+            PATCH only the changed fields
+        :param resource: Resource dictionary or Resource model
+        :param changes: Fields to change
+        :return: Response after the PUT/PATCH request
+        """
+        if isinstance(resource, Resource):
+            lockable_resource = resource.copy()
+        else:
+            lockable_resource = Resource.from_dict(resource)
+        for field, value in changes.items():
+            setattr(lockable_resource, field, value)
 
-        req = requests.put(final_endpoint, headers=self.headers, data=newjson)
-        return req
+        final_endpoint = self.endpoints["resource"] + lockable_resource.name
+        if self.partial_updates:
+            return self._request_with_retry(
+                "PATCH", final_endpoint, headers=self.headers, data=lockable_resource.to_json(changed_only=True)
+            )
+        return self._request_with_retry(
+            "PUT", final_endpoint, headers=self.headers, data=lockable_resource.to_json()
+        )
 
     def release(self, resource):
         """
@@ -137,13 +495,8 @@ class ResourceLocker:
         :param resource: Resource to release
         :return: Response after the PUT request
         """
-        lockable_resource = dict(resource)
-        lockable_resource["is_locked"] = False
-
-        final_endpoint = self.endpoints["resource"] + lockable_resource["name"]
-        newjson = json.dumps(lockable_resource)
-
-        req = requests.put(final_endpoint, headers=self.headers, data=newjson)
+        req = self._update_resource(resource, is_locked=False)
+        self._invalidate_resources()
         if req.status_code == 200:
             logger.info(f"Released {resource['name']} successfully!")
             return req
@@ -151,15 +504,17 @@ class ResourceLocker:
             logger.error("There were some errors from the Resource Locker server:")
             prettify_output(req.text)
 
-    def all(self):
+    def all(self, fields=None):
         """
         Display all the resources
+        :param fields: Optional list of the fields to return (e.g. ["name", "is_locked"]),
+            the server is asked for a sparse fieldset, the other fields are dropped locally
         :return: Response in Dictionary
         """
-        req = self._get_with_retry(self.endpoints["resources"], headers=self.headers)
-        if req.status_code == 200:
-            # json.loads returns it to a dictionary:
-            req_dict = json.loads(req.text.encode("utf8"))
+        req, req_dict = self._get_json(self._with_fields(self.endpoints["resources"], "resources", fields))
+        if req_dict is not None:
+            if fields:
+                return list(self._project(req_dict, "resources", fields))
             return req_dict
         else:
             prettify_output(req.text)
@@ -177,41 +532,75 @@ class ResourceLocker:
 
     def abort_queue(self, queue_id, abort_msg=None):
         """
-        A method to send a POST request to abort the queue that was created, and expected
+        A method to send a PUT request to abort the queue that was created, and expected
             to have an associated lockable resource
         We do this from the client side for now.
+        The PUT is sent directly, a missing queue is reported by the response itself.
         :return: req
         """
         final_endpoint = self.endpoints["rqueue"] + str(queue_id)
-        req = self._get_with_retry(final_endpoint, headers=self.headers)
-        if req.status_code == 200:
-            data_json = json.dumps(
-                {
-                    "status": "ABORTED",
-                    "description": abort_msg,
-                }
-            )
+        data_json = json.dumps(
+            {
+                "status": "ABORTED",
+                "description": abort_msg,
+            }
+        )
 
-            req = requests.put(final_endpoint, headers=self.headers, data=data_json)
+        req = self._request_with_retry("PUT", final_endpoint, headers=self.headers, data=data_json)
+        if req.status_code == 200:
+            self._cache_queue_data(queue_id, req)
             logger.debug(pprint.pformat(req.json()))
             return req
 
         logger.error(f"Something went wrong aborting the {queue_id}")
-        logger.debug(pprint.pformat(req.json()))
+        logger.debug(pprint.pformat(req.text))
         return req
 
+    def _cache_queue_data(self, queue_id, req):
+        """
+        Remember the data section and the ETag of the queue from a successful response,
+            so change_queue can skip the GET next time.
+        Without an ETag a stale copy could not be told from a fresh one, nothing is kept
+        :param queue_id:
+        :param req: requests.Response object of the queue
+        :return: (data section, ETag or None) of the response
+        """
+        try:
+            copy = (Queue.from_dict(req.json()).data or {}, req.headers.get("ETag"))
+        except ValueError:
+            copy = ({}, None)
+        if copy[1]:
+            self._queue_data[str(queue_id)] = copy
+        else:
+            self._queue_data.pop(str(queue_id), None)
+        return copy
+
     def change_queue(self, queue_id, status, description=None, **datakwargs):
         """
-        A method to send a POST request to change the status of the queue.
+        A method to send a PUT request to change the status of the queue.
         A queue has data dictionary and some more fields that we support to modify
             Each k&v pair that is liked to be added to queue, will be added via **datakwargs
+        If the server sends ETags, the data section is merged into the locally cached copy
+            from the last get_queue/change_queue response and the PUT is conditional (If-Match),
+            a conflict (409/412) refreshes the copy and merges again.
+        Without ETags the queue is fetched right before every change, a change made by someone
+            else between that GET and the PUT is still overwritten.
         :return: req
         """
         final_endpoint = self.endpoints["rqueue"] + str(queue_id)
-        req = self._get_with_retry(final_endpoint, headers=self.headers)
-        if req.status_code == 200:
+        for refreshed in (False, True):
+            cached = None if refreshed else self._queue_data.get(str(queue_id))
+            if cached is None:
+                req = self._get_with_retry(final_endpoint, headers=self.headers)
+                if req.status_code != 200:
+                    logger.error(f"Something went wrong changing {queue_id} \n")
+                    logger.debug(pprint.pformat(req.text))
+                    return req
+                cached = self._cache_queue_data(queue_id, req)
+            cached_data, etag = cached
+
             # Check for data dictionary args to override if needed:
-            data_section = parse_queue_data(req.json().get('data'))
+            data_section = dict(cached_data)
             if datakwargs:
                 for k, v in datakwargs.items():
                     data_section[k] = v
@@ -228,26 +617,62 @@ class ResourceLocker:
             to_modify["data"] = data_section
 
             data_json = json.dumps(to_modify)
-            req = requests.put(final_endpoint, headers=self.headers, data=data_json)
+            headers = dict(self.headers, **{"If-Match": etag}) if etag else self.headers
+            req = self._request_with_retry("PUT", final_endpoint, headers=headers, data=data_json)
+            if req.status_code in (409, 412) and not refreshed:
+                logger.warning(f"Queue {queue_id} changed on the server, merging the data section again")
+                continue
+            break
+
+        if req.status_code == 200:
+            self._cache_queue_data(queue_id, req)
             logger.debug(pprint.pformat(req.json()))
             return req
 
+        self._queue_data.pop(str(queue_id), None)
         logger.error(f"Something went wrong changing {queue_id} \n")
-        logger.debug(pprint.pformat(req.json()))
+        logger.debug(pprint.pformat(req.text))
         return req
 
-    def get_queues(self, status=None):
+    def get_queues(self, status=None, fields=None):
+        """
+        :param status: Optional status to filter by
+        :param fields: Optional list of the fields to return (e.g. ["id", "status"]),
+            the server is asked for a sparse fieldset, the other fields are dropped locally
+        :return list: Queues, None if the server did not return 200
+        """
         final_endpoint = (
             self.endpoints["rqueues"] + f"?status={status}"
             if status
             else self.endpoints["rqueues"]
         )
+        final_endpoint = self._with_fields(final_endpoint, "rqueues", fields)
         req = self._get_with_retry(final_endpoint, headers=self.headers)
         if req.status_code == 200:
             # json.loads returns it to a dictionary
-            req_dict = json.loads(req.text.encode("utf8"))
+            req_dict = json.loads(req.content)
+            if fields:
+                return list(self._project(req_dict, "rqueues", fields))
             return req_dict
 
+    def iter_queues(self, status=None, models=False, fields=None):
+        """
+        Iterate over the queues one by one, the response is parsed while it is downloaded
+            and the pages are followed if the server paginates, so the memory stays flat
+            regardless of the size of the history
+        :param status: Optional status to filter by
+        :param models: Yield compact Queue models instead of dictionaries,
+            their data section is only decoded when it is accessed
+        :param fields: Optional list of the fields to return, see get_queues
+        :return: generator of queue dictionaries (or Queue models)
+        """
+        query = {"status": status} if status else {}
+        query.update(self._fields_param("rqueues", fields))
+        queues = self._iter_listing(self.endpoints["rqueues"], query)
+        if fields:
+            queues = self._project(queues, "rqueues", fields)
+        return map(Queue.from_dict, queues) if models else queues
+
     def get_queue(self, queue_id, verify_connection=False):
         """
         Return queue JSONIFIED by the given queue_id
@@ -261,6 +686,7 @@ class ResourceLocker:
         final_endpoint = self.endpoints["rqueue"] + str(queue_id)
         req = self._get_with_retry(final_endpoint, headers=self.headers)
         if req.status_code == 200:
+            self._cache_queue_data(queue_id, req)
             return req.json()
         else:
             logger.error(
@@ -278,6 +704,9 @@ class ResourceLocker:
         silent=False,
         abort_on_timeout=True,
         resume_on_connection_error=False,
+        poll_strategy=None,
+        wait_transport=None,
+        heartbeater=None,
     ):
         """
         A method that uses multiple retries until a status of queue is achieved
@@ -287,128 +716,387 @@ class ResourceLocker:
             Or printing the message silently if silent=True.
         :param queue_id:
         :param interval: Time to wait in seconds between the attempts (this is the maximum time)
-        :param attempts: Number of the attempts to try
+        :param attempts: The timeout is attempts * interval seconds, whatever the poll strategy
+            makes of the time between the attempts
         :param silent: If timeout is reached (attempts * interval), then
             it will silently return None rather than raising Exception.
         :param abort_on_timeout: Aborts the queue if timeout is reached
         :param resume_on_connection_error: Do not interrupt the waiting, if in the middle of it
             we will have connection errors (server is down).
+        :param poll_strategy: PollStrategy deciding the time between the attempts,
+            FixedPollStrategy(interval) by default
+        :param wait_transport: WaitTransport used between the attempts, it can return
+            early when the server pushes a status change. PollingWaitTransport by default
+        :param heartbeater: Optional running Heartbeater, the queue is beaten by it for the
+            time of the waiting instead of in between the status checks
 
         :return queue as JSON response:
         """
+        if poll_strategy is None:
+            poll_strategy = FixedPollStrategy(interval)
+        if wait_transport is None:
+            wait_transport = PollingWaitTransport()
         expected_status = "FINISHED"
-        total_timeout_description = f"cca {attempts * interval} seconds"
+        timeout = attempts * interval
         logger.info(
-            f"Waiting until status {expected_status}, timeout is set to {total_timeout_description}! \n"
+            f"Waiting until status {expected_status}, timeout is set to {timeout} seconds! \n"
             "If the queue is in INITIALIZING state for a while, "
             "be sure to check if your queue service is running! \n"
         )
-        for attempt in range(attempts):
-            try:
-                queue_to_check = self.get_queue(
-                    queue_id,
-                    verify_connection=True
-                )
-                if not queue_to_check:
-                    raise Exception(
-                        f"Queue {queue_id} seems to not exist on the server! \n"
-                        "Error is not recoverable, raising Exception \n"
-                        "Please check the output of the method. \n"
-                        "Or check the logs of the Resource Locker Server! \n"
+        if heartbeater is not None:
+            heartbeater.add(queue_id)
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        try:
+            while True:
+                try:
+                    queue_to_check = self.get_queue(
+                        queue_id,
+                        verify_connection=True
                     )
-                # Once we passed through the check if queue exists, we should check continuously it's status:
-                queue_status = queue_to_check.get("status")
-                if queue_status == expected_status:
-                    return queue_to_check
-
-                else:
-                    if queue_status in ["INITIALIZING"] or (queue_status == "PENDING" and not (attempt % 1000)):
-                        logger.info(
-                            f"Queue {queue_id} is {queue_status} \n"
-                            f"More info about the queue: \n"
-                            f"{self.instance_url}/rqueues/{queue_id}"
+                    if not queue_to_check:
+                        raise Exception(
+                            f"Queue {queue_id} seems to not exist on the server! \n"
+                            "Error is not recoverable, raising Exception \n"
+                            "Please check the output of the method. \n"
+                            "Or check the logs of the Resource Locker Server! \n"
                         )
-                    elif queue_status in ["PENDING"]:
-                        if (attempt % 50):
-                            logger.debug(".")
-                        else:
+                    # Once we passed through the check if queue exists, we should check continuously it's status:
+                    queue_status = queue_to_check.get("status")
+                    if queue_status == expected_status:
+                        if self.metrics is not None:
+                            self.metrics.lock_finished(queue_id)
+                        return queue_to_check
+
+                    else:
+                        if queue_status in ["INITIALIZING"] or (queue_status == "PENDING" and not (attempt % 1000)):
+                            logger.info(
+                                f"Queue {queue_id} is {queue_status} \n"
+                                f"More info about the queue: \n"
+                                f"{self.instance_url}/rqueues/{queue_id}"
+                            )
+                        elif queue_status in ["PENDING"]:
                             logger.debug(".")
-                    elif queue_status in ["ABORTED", "FAILED"]:
-                        err_msg = (
-                            "Queue did NOT finish successfully \n"
-                            f"Error is: \n {queue_to_check}"
+                        elif queue_status in ["ABORTED", "FAILED"]:
+                            err_msg = (
+                                "Queue did NOT finish successfully \n"
+                                f"Error is: \n {queue_to_check}"
+                            )
+                            if silent:
+                                logger.warning(
+                                    err_msg +
+                                    "Timeout reached, "
+                                    "silent=true provided so no exception is raised"
+                                )
+                                return None
+                            else:
+                                raise Exception(err_msg)
+
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        if heartbeater is None:
+                            self.beat_queue(queue_id, suppress_logs=True)
+                        # The last wait ends at the deadline, for a last check
+                        wait_transport.wait(
+                            self, queue_to_check, min(poll_strategy.next_interval(attempt, queue_to_check), remaining)
                         )
-                        if silent:
-                            logger.warning(
-                                err_msg +
-                                "Timeout reached, "
-                                "silent=true provided so no exception is raised"
+                        attempt += 1
+                except ConnectionError as e:
+                    logger.error(
+                        "Connection Error to the specified URL! \n"
+                        "Error is: \n"
+                        f"{str(e)}"
+                    )
+                    # If there was a connection error while waiting for the achieved status,
+                    # the user might want to wait until the server is back up.
+                    if resume_on_connection_error:
+                        # User decided to resume on connection error!
+                        # We want to continuously show this message, the time spent here
+                        # does not count towards the timeout.
+                        paused = time.monotonic()
+                        while True:
+                            logger.info(
+                                f"Will try again in {interval} seconds. NOTE: Timeout duration is paused! "
+                                "You decided to wait if connection errors will occur, your queue "
+                                f"will still have a timeout of {max(deadline - paused, 0):.0f} seconds,"
+                                "once the resource locker server is back!"
                             )
-                            return None
-                        else:
-                            raise Exception(err_msg)
-
-                    self.beat_queue(queue_id, suppress_logs=True)
-                    # in the first 2 minutes, check the status every 20 seconds, then continue with the configured
-                    # interval, which could be longer to lower the load on the service
-                    if attempt < 6:
-                        time.sleep(20)
+                            time.sleep(jittered(interval))
+                            try:
+                                self.check_connection(force=True)
+                                # If method did not raise, get out, server is up
+                                break
+                            except Exception:
+                                pass
+                        deadline += time.monotonic() - paused
                     else:
-                        time.sleep(interval)
-            except ConnectionError as e:
-                logger.error(
-                    "Connection Error to the specified URL! \n"
-                    "Error is: \n"
-                    f"{str(e)}"
-                )
-                # If there was a connection error while waiting for the achieved status,
-                # the user might want to wait until the server is back up.
-                if resume_on_connection_error:
-                    # User decided to resume on connection error!
-                    # We want to continuously show this message, in order to avoid iteration, and waste the attempts
-                    # on connection errors.
-                    while True:
-                        logger.info(
-                            f"Will try again in {interval} seconds. NOTE: Timeout duration is paused! "
-                            "You decided to wait if connection errors will occur, your queue "
-                            f"will still have a timeout of {(attempts - attempt) * interval} seconds,"
-                            "once the resource locker server is back!"
-                        )
-                        time.sleep(interval)
-                        try:
-                            self.check_connection()
-                            # If method did not raise, get out, server is up
-                            break
-                        except Exception:
-                            pass
-                else:
+                        raise
+                except Exception as e:
+                    logger.error("An unknown exception occured: \n"
+                                 f"{str(e)}")
                     raise
-            except Exception as e:
-                logger.error("An unknown exception occured: \n"
-                             f"{str(e)}")
-                raise
 
-        else:
             if abort_on_timeout:
                 self.abort_queue(
                     queue_id=queue_id,
                     abort_msg="Timeout Reached for this queue. \n"
-                    f"Attempts: {attempts} \n"
+                    f"Attempts: {attempt + 1} \n"
                     f"Interval: {interval} seconds \n"
-                    f"Time Waited: {attempts * interval} seconds",
+                    f"Time Waited: {timeout} seconds",
                 )
             if silent:
                 logger.warning("Timeout reached, silent=true provided so no exception is raised")
                 return None
             else:
-                raise Exception(
+                raise TimeoutReachedForLockingResource(
                     "Timeout Reached! \n"
                     f"Status of the queue is not {expected_status}!"
                 )
+        finally:
+            if heartbeater is not None:
+                heartbeater.remove(queue_id)
+
+    def submit_queues(self, search_strings, signoff, priority, link=None, max_workers=8):
+        """
+        Submit a queue for each of the search strings, the PUT requests are sent concurrently
+        :param search_strings: Names or labels of the acceptable resource pools
+        :param signoff:
+        :param priority:
+        :param link:
+        :param max_workers: Maximum number of requests in flight at once
+        :return dict: search string -> queue JSON, the failed submissions are logged and left out
+        :raises: The error of the first submission if none of them succeeded
+        """
+        search_strings = list(dict.fromkeys(search_strings))
+        if not search_strings:
+            raise ValueError("At least one search string is required")
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(search_strings))) as executor:
+            futures = {
+                search_string: executor.submit(
+                    self.find_resource, search_string=search_string, signoff=signoff, priority=priority, link=link
+                )
+                for search_string in search_strings
+            }
+        queues = {}
+        errors = []
+        for search_string, future in futures.items():
+            try:
+                req = future.result()
+            except Exception as e:
+                logger.error(f"Could not submit a queue for {search_string}: {str(e)}")
+                errors.append(e)
+                continue
+            if not req.ok:
+                logger.error(f"Could not submit a queue for {search_string}: {req.status_code} {req.text}")
+                errors.append(BadRequestError(f"Status code: {req.status_code} \n{req.text}"))
+                continue
+            queues[search_string] = req.json()
+        if not queues:
+            raise errors[0]
+        return queues
+
+    def wait_until_any_finished(
+        self,
+        queues,
+        interval=15,
+        attempts=120,
+        silent=False,
+        abort_on_timeout=True,
+        resume_on_connection_error=False,
+        heartbeater=None,
+        max_workers=8,
+    ):
+        """
+        Wait on several queues in one loop (a single status listing and heartbeat round per
+            interval for all of them) until the first one is FINISHED, the others are aborted
+            right away. If more than one got FINISHED before being aborted, the resources they
+            locked are released, only the resource of the returned queue stays locked.
+        :param queues: The submitted queues (JSON), in the order of preference
+            when several are FINISHED at once
+        :param interval: Time to wait in seconds between the status checks
+        :param attempts: Number of the status checks
+        :param silent: Return None instead of raising if the timeout is reached
+            or every queue failed
+        :param abort_on_timeout: Aborts the queues if timeout is reached
+        :param resume_on_connection_error: Keep waiting through the connection errors,
+            the timeout is paused meanwhile
+        :param heartbeater: Optional running Heartbeater to beat the queues with
+        :param max_workers: Number of requests (heartbeats, aborts) sent concurrently
+        :return: The FINISHED queue as JSON
+        """
+        queues = list(queues)
+        watcher = QueueWatcher(self, interval=interval, max_workers=max_workers, heartbeater=heartbeater)
+        futures = {queue["id"]: watcher.watch(queue["id"]) for queue in queues}
+        winner = None
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            attempt = 0
+            while attempt < attempts:
+                try:
+                    waiting = watcher.poll_once(executor)
+                except ConnectionError as e:
+                    logger.error(
+                        "Connection Error to the specified URL! \n"
+                        "Error is: \n"
+                        f"{str(e)}"
+                    )
+                    if not resume_on_connection_error:
+                        raise
+                    logger.info(f"Will try again in {interval} seconds. NOTE: Timeout duration is paused!")
+                    time.sleep(jittered(interval))
+                    continue
+                finished = [
+                    future.result()
+                    for future in futures.values()
+                    if future.done() and not future.cancelled() and future.exception() is None
+                ]
+                if finished:
+                    winner = finished[0]
+                    break
+                if not waiting:
+                    break
+                attempt += 1
+                time.sleep(interval)
+
+            others = [queue_id for queue_id in futures if winner is None or queue_id != winner["id"]]
+            self._abort_others(executor, watcher, others, winner, abort=winner is not None or abort_on_timeout)
+
+        if winner is not None:
+            if self.metrics is not None:
+                self.metrics.lock_finished(winner["id"])
+            if len(queues) > 1:
+                self._release_extra(winner, queues)
+            return winner
+
+        failed = [future.exception() for future in futures.values() if future.done() and not future.cancelled()]
+        if len(failed) == len(futures):
+            error = failed[-1] if isinstance(failed[-1], QueueFailedError) else QueueFailedError(failed[-1])
+        else:
+            error = TimeoutReachedForLockingResource(
+                "Timeout Reached! \n"
+                f"None of the queues {', '.join(str(queue_id) for queue_id in futures)} is FINISHED!"
+            )
+        if silent:
+            logger.warning(f"{str(error)} silent=true provided so no exception is raised")
+            return None
+        raise error
+
+    def _abort_others(self, executor, watcher, queue_ids, winner, abort=True):
+        waiting = set(watcher.pending)
+        for queue_id in queue_ids:
+            watcher.unwatch(queue_id)
+        if not abort:
+            return
+        abort_msg = (
+            f"Another pool was locked first (queue {winner['id']})"
+            if winner is not None
+            else "Timeout Reached for this queue."
+        )
+        aborts = [
+            executor.submit(self.abort_queue, queue_id=queue_id, abort_msg=abort_msg)
+            for queue_id in queue_ids
+            if queue_id in waiting
+        ]
+        for abort in aborts:
+            try:
+                abort.result()
+            except Exception as e:
+                logger.error(f"Could not abort a queue: {str(e)}")
+
+    def _release_extra(self, winner, queues):
+        """
+        Release the resources of the other queues that got FINISHED anyway, in the same status
+            check as the winner or before their abort reached the server.
+        Every other queue is read again once aborted, only one the server locked a resource for
+            (named by "resource_locked" in its data section, an abort arriving late does not remove
+            it) has a resource to release, and only while that resource is still locked with the
+            signoff of the queue. Nothing is released on a guess
+        :param winner: The FINISHED queue that keeps its resource
+        :param queues: All the queues waited on
+        :return dict: Returned from release_many for the resources released
+        """
+        extra = []
+        for queue in queues:
+            if queue["id"] == winner["id"]:
+                continue
+            current = self.get_queue(queue["id"])
+            if not current:
+                logger.error(f"Queue {queue['id']} cannot be read again, release its resource if it got one")
+                continue
+            data = Queue.from_dict(current).data or {}
+            name = data.get(QUEUE_RESOURCE_KEY)
+            if not name:
+                if current.get("status") == "FINISHED":
+                    logger.error(
+                        f"Queue {queue['id']} is FINISHED too but does not name its resource, release it manually"
+                    )
+                continue
+            resources = self.get_lockable_resources(free_only=False, name=name)
+            resource = next(
+                (r for r in resources if r.get("name") == name) if isinstance(resources, list) else (), None
+            )
+            if resource is None or not resource.get("is_locked") or resource.get("signoff") != data.get("signoff"):
+                continue
+            extra.append(resource)
+        if not extra:
+            return {}
+        logger.warning(
+            f"Several pools were locked at once, keeping the resource of queue {winner['id']}, "
+            f"releasing {', '.join(resource['name'] for resource in extra)}"
+        )
+        return self.release_many(extra)
+
+    def find_any_resource(self, search_strings, signoff, priority, link=None, **wait_kwargs):
+        """
+        Lock the first available resource of several pools: a queue is submitted for each
+            search string at once, the first FINISHED one wins and the others are aborted
+        :param search_strings: Names or labels of the acceptable resource pools, in the order
+            of preference when several are FINISHED at once
+        :param signoff:
+        :param priority:
+        :param link:
+        :param wait_kwargs: Keyword arguments of wait_until_any_finished
+        :return: The FINISHED queue as JSON
+        """
+        queues = self.submit_queues(search_strings, signoff=signoff, priority=priority, link=link)
+        return self.wait_until_any_finished(queues.values(), **wait_kwargs)
+
+    def iter_resources(
+        self, free_only=None, label_matches=None, name=None, signoff=None, models=False, fields=None
+    ):
+        """
+        Iterate over the lockable resources one by one, the response is parsed while it is
+            downloaded and the pages are followed if the server paginates
+        :param free_only: Optional, True for the free resources only
+        :param label_matches: Optional label to filter by
+        :param name: Optional name to filter by
+        :param signoff: Optional signoff to filter by
+        :param models: Yield compact Resource models instead of dictionaries
+        :param fields: Optional list of the fields to return, see all
+        :return: generator of resource dictionaries (or Resource models)
+        """
+        query = {}
+        if free_only is not None:
+            query["free_only"] = str(free_only).lower()
+        if label_matches:
+            query["label_matches"] = label_matches
+        if name:
+            query["name"] = name
+        if signoff:
+            query["signoff"] = signoff
+        query.update(self._fields_param("resources", fields))
+        resources = self._iter_listing(self.endpoints["resources"], query)
+        if fields:
+            resources = self._project(resources, "resources", fields)
+        return map(Resource.from_dict, resources) if models else resources
 
     def get_lockable_resources(
-        self, free_only=True, label_matches=None, name=None, signoff=None
+        self, free_only=True, label_matches=None, name=None, signoff=None, fields=None
     ):
+        """
+        :param fields: Optional list of the fields to return, see all
+        :return: list of the resources, the Response if the server did not return 200
+        """
         if not signoff:
             # Lets first design the final endpoint:
             final_endpoint = (
@@ -421,14 +1109,48 @@ class ResourceLocker:
         else:
             final_endpoint = self.endpoints["resources"] + f"?signoff={signoff}"
 
-        req = self._get_with_retry(final_endpoint, headers=self.headers)
-        if req.status_code == 200:
-            # json.loads returns it to a dictionary
-            req_dict = json.loads(req.text.encode("utf8"))
+        req, req_dict = self._get_json(self._with_fields(final_endpoint, "resources", fields))
+        if req_dict is not None:
+            if fields:
+                return list(self._project(req_dict, "resources", fields))
             return req_dict
 
         return req
 
+    def find_available(self, search_string, free_only=True):
+        """
+        Resources matching the search string by name or by label. Both lookups are
+            sent concurrently, so it takes a single round trip
+        :param search_string: Name or label of the lockable resource
+        :param free_only: Only the free resources
+        :return dict: {
+            "resources": the matching resources, each one once (name matches first),
+            "by_name": names of the resources matching by name,
+            "by_label": names of the resources matching by label,
+        }
+        :raises: BadRequestError if the server did not return a listing
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            by_name = executor.submit(self.get_lockable_resources, free_only=free_only, name=search_string)
+            by_label = executor.submit(
+                self.get_lockable_resources, free_only=free_only, label_matches=search_string
+            )
+        result = {"resources": [], "by_name": [], "by_label": []}
+        seen = set()
+        for key, future in (("by_name", by_name), ("by_label", by_label)):
+            resources = future.result()
+            if not isinstance(resources, list):
+                raise BadRequestError(
+                    f"Status code: {resources.status_code} \n"
+                    f"Response: {resources.text}"
+                )
+            for resource in resources:
+                result[key].append(resource["name"])
+                if resource["name"] not in seen:
+                    seen.add(resource["name"])
+                    result["resources"].append(resource)
+        return result
+
     def lock_resource(self, resource, signoff, link=None):
         """
         Method that will lock the requested resource
@@ -437,17 +1159,74 @@ class ResourceLocker:
             is about to lock
         :return: Response after the PUT request
         """
-        lockable_resource = dict(resource)
-        lockable_resource["is_locked"] = True
-        lockable_resource["signoff"] = signoff
+        changes = {"is_locked": True, "signoff": signoff}
         if link:
-            lockable_resource["link"] = link
+            changes["link"] = link
+        req = self._update_resource(resource, **changes)
+        self._invalidate_resources()
+        return req
+
+    def _fan_out(self, action, resources, max_workers):
+        """
+        Run the action for every resource on a bounded pool of threads
+        :param action: Callable taking a resource
+        :param resources: List of resources
+        :param max_workers: Maximum number of requests in flight at once
+        :return dict: resource name -> return value of the action, or the exception it raised
+        """
+        resources = list(resources)
+        results = {}
+        if not resources:
+            return results
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(resources))) as executor:
+            futures = {resource["name"]: executor.submit(action, resource) for resource in resources}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+        return results
 
-        final_endpoint = self.endpoints["resource"] + lockable_resource["name"]
-        newjson = json.dumps(lockable_resource)
+    @staticmethod
+    def _succeeded(result):
+        return result is not None and not isinstance(result, Exception) and result.status_code == 200
 
-        req = requests.put(final_endpoint, headers=self.headers, data=newjson)
-        return req
+    def lock_many(self, resources, signoff, link=None, max_workers=8, all_or_nothing=False):
+        """
+        Lock several resources at once, the PUT requests are sent concurrently
+        :param resources: List of resources to lock
+        :param signoff: A message to write when the requested resources
+            are about to lock
+        :param link: Link of the CI/CD pipeline that locks the resources
+        :param max_workers: Maximum number of requests in flight at once
+        :param all_or_nothing: If any of the resources could not be locked,
+            release the ones that were locked and raise PartialLockError
+        :return dict: resource name -> Response after the PUT request, or the exception it raised
+        """
+        resources = list(resources)
+        results = self._fan_out(
+            lambda resource: self.lock_resource(resource, signoff, link=link), resources, max_workers
+        )
+        failed = [name for name, result in results.items() if not self._succeeded(result)]
+        if failed:
+            logger.error(f"Could not lock: {', '.join(failed)}")
+            if all_or_nothing:
+                locked = [r for r in resources if r["name"] not in failed]
+                if locked:
+                    logger.info(f"Rolling back the locks of: {', '.join(r['name'] for r in locked)}")
+                    self.release_many(locked, max_workers=max_workers)
+                raise PartialLockError(results)
+        return results
+
+    def release_many(self, resources, max_workers=8):
+        """
+        Release several resources at once, the PUT requests are sent concurrently
+        :param resources: List of resources to release
+        :param max_workers: Maximum number of requests in flight at once
+        :return dict: resource name -> Response after the PUT request (None if the server
+            returned an error), or the exception it raised
+        """
+        return self._fan_out(self.release, resources, max_workers)
 
     def beat_queue(self, queue_id, suppress_logs=False):
         '''
@@ -460,16 +1239,15 @@ class ResourceLocker:
         :return:
         '''
         final_endpoint = self.endpoints["rqueue"] + str(queue_id)
-        req = self._get_with_retry(final_endpoint, headers=self.headers)
-        if req.status_code == 200:
-
-            data = {
-                "last_beat": str(datetime.datetime.utcnow()),
-            }
+        data = {
+            "last_beat": str(datetime.datetime.utcnow()),
+        }
 
-            data_json = json.dumps(data)
+        data_json = json.dumps(data)
 
-            req = requests.put(final_endpoint, headers=self.headers, data=data_json)
+        # No GET beforehand, a missing queue is reported by the PUT response itself
+        req = self._request_with_retry("PUT", final_endpoint, headers=self.headers, data=data_json)
+        if req.status_code == 200:
             if not suppress_logs:
                 logger.debug(pprint.pformat(req.json()))
             return req
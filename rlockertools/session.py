@@ -0,0 +1,56 @@
+from requests.adapters import HTTPAdapter
+import requests
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def build_session(
+    pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True
+):
+    """
+    Build a requests.Session with a connection pool mounted for http and https
+    :param pool_connections: Number of per-host connection pools to keep cached
+    :param pool_maxsize: Maximum number of connections kept open per host
+    :param pool_block: If True, never open more than pool_maxsize connections
+        to a single host, block until one is free instead
+    :param keep_alive: If False, ask the server to close the connection after
+        every response (no reuse)
+    :return: requests.Session object. Its default Accept-Encoding already asks for every
+        response compression urllib3 can decode (gzip and deflate, br/zstd if the
+        brotli/zstandard packages are installed), nothing has to be negotiated here
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def connection_stats(session):
+    """
+    Summarize how connections of the session's pools were used so far
+    :param session: requests.Session object, built by build_session
+    :return dict: Number of pools, opened connections, sent requests and
+        how many requests reused an already opened connection
+    """
+    stats = {"pools": 0, "connections": 0, "requests": 0}
+    for adapter in {id(a): a for a in session.adapters.values()}.values():
+        pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+        if pools is None:
+            continue
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats["pools"] += 1
+            stats["connections"] += pool.num_connections
+            stats["requests"] += pool.num_requests
+    stats["reused"] = max(stats["requests"] - stats["connections"], 0)
+    return stats
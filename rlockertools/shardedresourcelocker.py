@@ -0,0 +1,342 @@
+from concurrent.futures import ThreadPoolExecutor
+from requests.exceptions import ConnectionError, ReadTimeout
+from rlockertools.circuitbreaker import CircuitBreaker
+from rlockertools.exceptions import BadRequestError
+from rlockertools.models import Resource
+from rlockertools.resourcelocker import ResourceLocker
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedResourceLocker:
+    """
+    Client of several Resource Locker instances (e.g. one per region), with a pooled
+        ResourceLocker per instance.
+    The queries (all, get_lockable_resources, find_available) are sent to every instance
+        concurrently and the results merged, every resource carries the "instance_url" it
+        belongs to. lock_resource/release go to the instance owning the resource.
+    The latency (moving average) and the health of every instance are tracked on every call.
+        An instance is unhealthy while its circuit breaker is open, or for health_ttl seconds
+        after a connection error. find_resource submits the queue to the fastest healthy
+        instance having a resource matching the search string, a free one if possible.
+    Resource names and queue ids are per instance: a resource without its "instance_url", or a queue
+        without the instance_url argument, goes to the one instance it was seen on through this client.
+        If several instances have it, the instance has to be given.
+    Usage:
+        with ShardedResourceLocker([url_eu, url_us], token) as locker:
+            req = locker.find_resource(search_string="label", signoff="job-1", priority=1)
+            locker.wait_until_finished(req.json()["id"])
+    """
+
+    def __init__(self, instances, token=None, health_ttl=30, latency_alpha=0.3, max_workers=None, **locker_kwargs):
+        """
+        :param instances: The instances: URLs, (URL, token) pairs or ResourceLocker objects
+        :param token: Token for the instances given by their URL only
+        :param health_ttl: Seconds an instance counts as unhealthy after a connection error
+        :param latency_alpha: Weight of the latest call in the moving average of the latency
+        :param max_workers: Maximum number of instances queried at once, all of them by default
+        :param locker_kwargs: Keyword arguments of the ResourceLocker built for every URL
+        """
+        self.lockers = {}
+        self._owned = set()
+        for instance in instances:
+            if isinstance(instance, ResourceLocker):
+                locker = instance
+            else:
+                url, instance_token = instance if isinstance(instance, tuple) else (instance, token)
+                locker = ResourceLocker(url, instance_token, **locker_kwargs)
+                self._owned.add(url)
+            self.lockers[locker.instance_url] = locker
+        if not self.lockers:
+            raise ValueError("At least one instance is required")
+        self.health_ttl = health_ttl
+        self.latency_alpha = latency_alpha
+        self.max_workers = max_workers or len(self.lockers)
+
+        self._lock = threading.Lock()
+        # instance_url -> moving average of the latency in seconds, None until the first call
+        self._latency = dict.fromkeys(self.lockers)
+        self._failed_until = dict.fromkeys(self.lockers, 0)
+        self._errors = dict.fromkeys(self.lockers, 0)
+        self._calls = dict.fromkeys(self.lockers, 0)
+        # resource name -> instance_urls listing it, queue id -> instance_urls it was submitted to
+        self._resource_owners = {}
+        self._queue_owners = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the clients built by this object, the given ResourceLocker objects are left open
+        :return: None
+        """
+        for url in self._owned:
+            self.lockers[url].close()
+
+    def _call(self, url, method, *args, **kwargs):
+        """
+        Call a method of the client of an instance, tracking the latency and the health
+        """
+        start = time.monotonic()
+        try:
+            result = getattr(self.lockers[url], method)(*args, **kwargs)
+        except (ConnectionError, ReadTimeout):
+            with self._lock:
+                self._calls[url] += 1
+                self._errors[url] += 1
+                self._failed_until[url] = time.monotonic() + self.health_ttl
+            raise
+        latency = time.monotonic() - start
+        with self._lock:
+            self._calls[url] += 1
+            previous = self._latency[url]
+            self._latency[url] = (
+                latency if previous is None else self.latency_alpha * latency + (1 - self.latency_alpha) * previous
+            )
+            self._failed_until[url] = 0
+        return result
+
+    def healthy(self, url):
+        """
+        :param url: instance_url of an instance
+        :return bool: False while its circuit breaker is open or after a recent connection error
+        """
+        breaker = self.lockers[url].circuit_breaker
+        return breaker.state != CircuitBreaker.OPEN and self._failed_until[url] <= time.monotonic()
+
+    def ranked(self):
+        """
+        :return list: instance_urls, the healthy ones first, by latency (the unknown latency first,
+            so every instance gets measured)
+        """
+        with self._lock:
+            latency = dict(self._latency)
+        return sorted(
+            self.lockers, key=lambda url: (not self.healthy(url), latency[url] is not None, latency[url] or 0)
+        )
+
+    def stats(self):
+        """
+        :return dict: instance_url -> {"healthy", "latency" (seconds), "calls", "errors"}
+        """
+        with self._lock:
+            return {
+                url: {
+                    "healthy": self.healthy(url),
+                    "latency": self._latency[url],
+                    "calls": self._calls[url],
+                    "errors": self._errors[url],
+                }
+                for url in self.lockers
+            }
+
+    def _fan_out(self, method, *args, **kwargs):
+        """
+        Call the method on every instance concurrently
+        :return dict: instance_url -> return value, or the exception it raised
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.lockers))) as executor:
+            futures = {url: executor.submit(self._call, url, method, *args, **kwargs) for url in self.lockers}
+        for url, future in futures.items():
+            try:
+                results[url] = future.result()
+            except Exception as e:
+                logger.error(f"{method} failed on {url}: {str(e)}")
+                results[url] = e
+        return results
+
+    def _annotate(self, url, resources):
+        annotated = []
+        for resource in resources:
+            resource = dict(resource)
+            resource["instance_url"] = url
+            annotated.append(resource)
+        with self._lock:
+            for resource in annotated:
+                self._resource_owners.setdefault(resource["name"], set()).add(url)
+        return annotated
+
+    @staticmethod
+    def _only_owner(what, owners):
+        """
+        :param what: Description of the resource or the queue, for the error
+        :param owners: instance_urls it was seen on
+        :return str: The instance_url if there is only one
+        :raises: ValueError if none or several instances are known
+        """
+        if not owners:
+            raise ValueError(f"The instance of the {what} is not known, give its instance_url")
+        if len(owners) > 1:
+            raise ValueError(
+                f"The {what} exists on several instances ({', '.join(sorted(owners))}), give its instance_url"
+            )
+        return next(iter(owners))
+
+    def _merge(self, results):
+        """
+        Merge the resource listings of the instances, the instances that failed are left out
+        :raises: The error of the first instance if all of them failed
+        """
+        merged = []
+        errors = []
+        for url, result in results.items():
+            if isinstance(result, list):
+                merged.extend(self._annotate(url, result))
+            else:
+                errors.append(result if isinstance(result, Exception) else BadRequestError(
+                    f"{url} Status code: {result.status_code} \n{result.text}"
+                ))
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        return merged
+
+    def all(self, fields=None):
+        """
+        All the resources of all the instances
+        :param fields: Optional list of the fields to return, see ResourceLocker.all
+        :return list: Resources, each one with its "instance_url"
+        """
+        return self._merge(self._fan_out("all", fields=fields))
+
+    def get_lockable_resources(self, free_only=True, label_matches=None, name=None, signoff=None, fields=None):
+        """
+        Same as ResourceLocker.get_lockable_resources, on all the instances
+        :return list: Resources, each one with its "instance_url"
+        """
+        return self._merge(
+            self._fan_out(
+                "get_lockable_resources",
+                free_only=free_only,
+                label_matches=label_matches,
+                name=name,
+                signoff=signoff,
+                fields=fields,
+            )
+        )
+
+    def find_available(self, search_string, free_only=True):
+        """
+        Same as ResourceLocker.find_available, on all the instances
+        :return dict: {"resources": [...], "by_name": [...], "by_label": [...]}, the resources
+            carry their "instance_url", the names are the ones of all the instances
+        """
+        found = {"resources": [], "by_name": [], "by_label": []}
+        results = self._fan_out("find_available", search_string, free_only=free_only)
+        for url, result in results.items():
+            if isinstance(result, Exception):
+                continue
+            found["resources"].extend(self._annotate(url, result["resources"]))
+            found["by_name"].extend(result["by_name"])
+            found["by_label"].extend(result["by_label"])
+        if all(isinstance(result, Exception) for result in results.values()):
+            raise next(iter(results.values()))
+        return found
+
+    def owner(self, resource):
+        """
+        :param resource: Resource dictionary (or Resource model) returned by this client
+        :return str: instance_url of the instance owning the resource
+        :raises: ValueError if the owner is not known, or the resource has no "instance_url"
+            and its name exists on several instances
+        """
+        url = resource.get("instance_url")
+        if url is None:
+            with self._lock:
+                owners = set(self._resource_owners.get(resource.get("name"), ()))
+            url = self._only_owner(f"resource {resource.get('name')}", owners)
+        if url not in self.lockers:
+            raise ValueError(f"The instance {url} of the resource {resource.get('name')} is not known")
+        return url
+
+    @staticmethod
+    def _strip(resource):
+        # The instance_url is not a field of the server
+        fields = dict(resource)
+        fields.pop("instance_url", None)
+        return Resource.from_dict(fields)
+
+    def lock_resource(self, resource, signoff, link=None):
+        """
+        Lock the resource on the instance owning it
+        :return: Response after the PUT request
+        """
+        return self._call(self.owner(resource), "lock_resource", self._strip(resource), signoff, link=link)
+
+    def release(self, resource):
+        """
+        Release the resource on the instance owning it
+        :return: Response after the PUT request (None if the server returned an error)
+        """
+        return self._call(self.owner(resource), "release", self._strip(resource))
+
+    def find_resource(self, search_string, signoff, priority, link=None, timeout=None):
+        """
+        Submit a queue to the fastest healthy instance having a resource matching the search string,
+            preferably a free one. An instance failing to answer is skipped for the next one
+        :return: Response of the instance the queue was submitted to
+        :raises: BadRequestError if no instance has a matching resource
+        """
+        candidates = self._fan_out("find_available", search_string, free_only=False)
+        free = {}
+        for url, result in candidates.items():
+            if not isinstance(result, Exception) and result["resources"]:
+                free[url] = any(not resource.get("is_locked") for resource in result["resources"])
+        urls = sorted(
+            (url for url in self.ranked() if url in free), key=lambda url: (not self.healthy(url), not free[url])
+        )
+        if not urls:
+            raise BadRequestError(f"No instance has a resource matching {search_string}")
+        error = None
+        for url in urls:
+            try:
+                req = self._call(
+                    url, "find_resource", search_string=search_string, signoff=signoff, priority=priority,
+                    link=link, timeout=timeout,
+                )
+            except (ConnectionError, ReadTimeout) as e:
+                logger.warning(f"Could not submit the queue to {url}, trying the next instance: {str(e)}")
+                error = e
+                continue
+            if req.ok:
+                with self._lock:
+                    self._queue_owners.setdefault(req.json().get("id"), set()).add(url)
+            return req
+        raise error
+
+    def _queue_owner(self, queue_id, instance_url=None):
+        url = instance_url
+        if url is None:
+            with self._lock:
+                owners = set(self._queue_owners.get(queue_id, ()))
+            url = self._only_owner(f"queue {queue_id}", owners)
+        if url not in self.lockers:
+            raise ValueError(f"The instance {url} of the queue {queue_id} is not known")
+        return url
+
+    def _queue_call(self, method, queue_id, instance_url=None, **kwargs):
+        return self._call(self._queue_owner(queue_id, instance_url), method, queue_id, **kwargs)
+
+    def get_queue(self, queue_id, instance_url=None, verify_connection=False):
+        return self._queue_call("get_queue", queue_id, instance_url, verify_connection=verify_connection)
+
+    def abort_queue(self, queue_id, abort_msg=None, instance_url=None):
+        return self._queue_call("abort_queue", queue_id, instance_url, abort_msg=abort_msg)
+
+    def beat_queue(self, queue_id, suppress_logs=False, instance_url=None):
+        return self._queue_call("beat_queue", queue_id, instance_url, suppress_logs=suppress_logs)
+
+    def wait_until_finished(self, queue_id, instance_url=None, **kwargs):
+        """
+        ResourceLocker.wait_until_finished on the instance of the queue
+        :param kwargs: Keyword arguments of ResourceLocker.wait_until_finished
+        """
+        # Not timed, the time of the waiting is not the latency of the instance
+        return self.lockers[self._queue_owner(queue_id, instance_url)].wait_until_finished(queue_id, **kwargs)
@@ -0,0 +1,47 @@
+from concurrent.futures import Future
+import threading
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call with a key is in flight, the calls
+        with the same key wait for it and get its result (or its exception) instead of
+        running again. Nothing is cached, a call made after the previous one returned runs.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        :param key: Hashable identity of the call
+        :param function: Callable to run if no identical call is in flight
+        :return: Return value of the call
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:
+            self._land(key)
+            future.set_exception(e)
+            raise
+        self._land(key)
+        future.set_result(result)
+        return result
+
+    def _land(self, key):
+        # The calls made from now on run again
+        with self._lock:
+            del self._in_flight[key]
@@ -1,6 +1,8 @@
+import codecs
 import logging
 import pprint
 import json
+import re
 
 logger = logging.getLogger(__name__)
 
@@ -26,3 +28,87 @@ def parse_queue_data(data_section):
     :return dict:
     """
     return json.loads(data_section) if isinstance(data_section, str) else data_section
+
+
+_WHITESPACE = re.compile(r"\s*")
+
+
+def iter_json_array(chunks):
+    """
+    Parse a JSON array incrementally and yield its items one by one,
+        without holding the whole document or the whole list in memory.
+    The separators are as strict as json.loads, exactly one comma between two items,
+        and only whitespace after the closing bracket.
+    An item cut by the end of a chunk is decoded again once the buffered part of it
+        doubled, so a large item split into many small chunks is decoded a few times only
+    :param chunks: Iterable of bytes (UTF-8) or str pieces of the document
+    :return: generator of the decoded items
+    :raises: ValueError if the document is not a JSON array, or something follows it
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    # What comes next: "[", "first" (item or "]"), "item" (after a comma), "," (comma or "]"),
+    # "end" (nothing but whitespace)
+    expected = "["
+    # Length of the buffer from which the cut item is decoded again
+    retry_at = 0
+    chunks = iter(chunks)
+    final = False
+    while not final:
+        chunk = next(chunks, None)
+        if chunk is None:
+            final = True
+            buffer += utf8.decode(b"", final=True)
+        else:
+            buffer += utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if len(buffer) < retry_at:
+                continue
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            char = buffer[pos]
+            if expected == "end":
+                raise ValueError(f"Extra data after the JSON array: {buffer[pos:pos + 20]!r}")
+            if expected == "[":
+                if char != "[":
+                    raise ValueError(f"Expected a JSON array, got: {buffer[pos:pos + 20]!r}")
+                pos += 1
+                expected = "first"
+            elif expected == ",":
+                if char == "]":
+                    pos += 1
+                    expected = "end"
+                    continue
+                if char != ",":
+                    raise ValueError(f"Expected ',' or ']' at {buffer[pos:pos + 20]!r}")
+                pos += 1
+                expected = "item"
+            elif char == "]" and expected == "first":
+                pos += 1
+                expected = "end"
+            elif char in ",]":
+                raise ValueError(f"Expected a value at {buffer[pos:pos + 20]!r}")
+            else:
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    # The item continues in the next chunks
+                    retry_at = 2 * len(buffer) - pos
+                    break
+                if not final and (end == len(buffer) or buffer[end] not in " \t\r\n,]"):
+                    # A number could still continue in the next chunk ("15" of "1500.5", "2" of "2.5")
+                    retry_at = len(buffer) + 1
+                    break
+                yield item
+                pos = end
+                expected = ","
+        retry_at -= pos
+        buffer = buffer[pos:]
+        pos = 0
+    if expected != "end":
+        raise ValueError("The JSON array is truncated")
@@ -0,0 +1,145 @@
+from abc import ABC, abstractmethod
+from requests.exceptions import ConnectionError, ReadTimeout, ChunkedEncodingError
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class WaitTransport(ABC):
+    """
+    Decides how wait_until_finished waits between two checks of the queue status
+    """
+
+    @abstractmethod
+    def wait(self, locker, queue, seconds):
+        """
+        Wait up to the given time, or less if the transport learns that the status changed
+        :param locker: ResourceLocker instance
+        :param queue: Queue JSON of the last check
+        :param seconds: Maximal time to wait
+        :return bool: True if a status change was pushed before the time was up
+        """
+
+
+class PollingWaitTransport(WaitTransport):
+    """
+    Plain sleep, the next check is done after the full interval
+    """
+
+    def wait(self, locker, queue, seconds):
+        time.sleep(seconds)
+        return False
+
+
+class StreamWaitTransport(WaitTransport):
+    """
+    Holds a server-sent events (text/event-stream) request open on the queue while waiting,
+        and returns as soon as the server pushes an event with a different status.
+    Expected events are JSON queues in the data field, lines starting with ":" are keep-alive
+        comments. If the server does not support the stream (404, 405, 406 or another content
+        type), the transport falls back to polling for the rest of its life. Any other error
+        (a 502 during a deploy) falls back to polling for the current wait only.
+    """
+
+    # Status codes telling that the server has no event stream
+    UNSUPPORTED_STATUSES = (404, 405, 406)
+
+    def __init__(self, path="/api/rqueue/{queue_id}/events", connect_timeout=10):
+        """
+        :param path: Path of the event stream of a queue, relative to the instance URL
+        :param connect_timeout: Timeout to open the stream
+        """
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self.supported = None
+        self._fallback = PollingWaitTransport()
+
+    def _events(self, response):
+        """
+        Parse the event stream into the data fields of the events
+        :param response: Streamed requests.Response object
+        :return: generator of str
+        """
+        data = []
+        for line in response.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if not line:
+                if data:
+                    yield "\n".join(data)
+                    data = []
+                else:
+                    # Keep-alive, let the caller check its deadline
+                    yield None
+            elif line.startswith(":"):
+                yield None
+            elif line.startswith("data:"):
+                data.append(line[5:].lstrip())
+
+    def wait(self, locker, queue, seconds):
+        if self.supported is False or seconds <= 0:
+            return self._fallback.wait(locker, queue, seconds)
+
+        deadline = time.monotonic() + seconds
+        url = locker.instance_url + self.path.format(queue_id=queue.get("id"))
+        headers = dict(locker.headers, Accept="text/event-stream")
+        try:
+            response = locker._request(
+                "GET", url, headers=headers, stream=True, timeout=(self.connect_timeout, seconds), long_poll=True
+            )
+        except ReadTimeout:
+            return False
+        with response:
+            streamed = "text/event-stream" in response.headers.get("Content-Type", "")
+            if response.status_code in self.UNSUPPORTED_STATUSES or (response.status_code == 200 and not streamed):
+                logger.info(
+                    f"The server does not stream queue events (status {response.status_code}), "
+                    "falling back to polling"
+                )
+                self.supported = False
+                return self._fallback.wait(locker, queue, max(deadline - time.monotonic(), 0))
+            if response.status_code != 200:
+                logger.debug(f"The event stream returned status {response.status_code}, polling this time")
+                return self._fallback.wait(locker, queue, max(deadline - time.monotonic(), 0))
+            self.supported = True
+            try:
+                for event in self._events(response):
+                    if event is not None:
+                        try:
+                            pushed = json.loads(event)
+                        except ValueError:
+                            pushed = {}
+                        if not isinstance(pushed, dict):
+                            # Valid JSON but not a queue ("ok", [], 1...)
+                            pushed = {}
+                        if pushed.get("status") and pushed.get("status") != queue.get("status"):
+                            return True
+                    if time.monotonic() >= deadline:
+                        return False
+            except (ReadTimeout, ConnectionError, ChunkedEncodingError):
+                # No event in time, or the stream broke, the next check will tell
+                pass
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            # Stream ended early, wait the rest of the time the regular way
+            self._fallback.wait(locker, queue, remaining)
+        return False
+
+
+WAIT_TRANSPORTS = {
+    "poll": PollingWaitTransport,
+    "stream": StreamWaitTransport,
+}
+
+
+def get_wait_transport(name):
+    """
+    Build a wait transport by its name, as used by the rlock --wait-transport argument
+    :param name: One of WAIT_TRANSPORTS
+    :return: WaitTransport object
+    """
+    if name not in WAIT_TRANSPORTS:
+        raise ValueError(f"Unknown wait transport {name}, choose from {', '.join(WAIT_TRANSPORTS)}")
+    return WAIT_TRANSPORTS[name]()
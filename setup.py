@@ -13,7 +13,7 @@ setup_args = dict(
     long_description_content_type="text/markdown",
     long_description=README + "\n\n" + HISTORY,
     license="MIT",
-    packages=find_packages(),
+    packages=find_packages(exclude=("tests", "tests.*")),
     author="Jim Erginbash",
     author_email="jimshapedcoding@gmail.com",
     keywords=["Rlocker", "rlocker", "ResourceLocker", "Python 3", "Resource Locker"],
@@ -25,6 +25,11 @@ install_requires = [
     "requests",
 ]
 
+# br compressed responses
+extras_require = {
+    "brotli": ["brotli"],
+}
+
 entry_points = {
     "console_scripts": [
         "rlock=framework.main:main",
@@ -32,4 +37,6 @@ entry_points = {
 }
 
 if __name__ == "__main__":
-    setup(**setup_args, install_requires=install_requires, entry_points=entry_points)
+    setup(
+        **setup_args, install_requires=install_requires, extras_require=extras_require, entry_points=entry_points
+    )
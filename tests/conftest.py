@@ -0,0 +1,29 @@
+from benchmarks.fakeserver import FakeResourceLockerServer
+from rlockertools.circuitbreaker import CircuitBreaker, RetryBudget
+from rlockertools.resourcelocker import ResourceLocker
+import pytest
+
+
+@pytest.fixture
+def server():
+    with FakeResourceLockerServer() as server:
+        yield server
+
+
+@pytest.fixture
+def client_kwargs():
+    """
+    A circuit breaker and a retry budget of its own for every client, the shared ones
+        of the process would carry the failures over from one test to the next
+    """
+    return {
+        "retry_delay": 0.01,
+        "circuit_breaker": CircuitBreaker(),
+        "retry_budget": RetryBudget(max_tokens=100),
+    }
+
+
+@pytest.fixture
+def locker(server, client_kwargs):
+    with ResourceLocker(server.url, "token", **client_kwargs) as locker:
+        yield locker
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from rlockertools.agent import Agent
+from rlockertools.agentclient import AgentClient
+from rlockertools.exceptions import TimeoutReachedForLockingResource
+import os
+import pytest
+import time
+
+
+@pytest.fixture
+def agent(locker, tmp_path):
+    with Agent(locker, socket_path=os.path.join(tmp_path, "agent.sock"), interval=0.05) as agent:
+        yield agent
+
+
+def test_wait_through_the_socket(server, agent):
+    server.finish_after = 3
+    client = AgentClient(agent.socket_path, timeout=10)
+    queue = client.request("enqueue", search_string="pool", signoff="job-1", priority=1)
+    assert client.request("wait", queue_id=queue["id"], attempts=100, interval=0.05)["status"] == "FINISHED"
+
+
+def test_scheduler_survives_an_unexpected_error(server, locker, agent, monkeypatch):
+    server.finish_after = 3
+    get_queues = locker.get_queues
+    calls = []
+
+    def flaky_get_queues(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise ValueError("Expecting value: line 1 column 1 (char 0)")
+        return get_queues(*args, **kwargs)
+
+    monkeypatch.setattr(locker, "get_queues", flaky_get_queues)
+    queue_id = server.create_queue("pool")["id"]
+    assert agent.wait(queue_id, attempts=100, interval=0.05)["status"] == "FINISHED"
+    assert agent._scheduler.is_alive()
+
+
+def test_wait_any_releases_the_resource_of_the_loser(server, agent):
+    server.resources["resource-1"]["labels_string"] = "other"
+    queues = [server.create_queue(search_string, signoff="job") for search_string in ("pool", "other")]
+    server.set_status(queues[0]["id"], "FINISHED")
+    server.set_status(queues[1]["id"], "FINISHED")
+    assert agent.wait_any(queues, attempts=100, interval=0.05)["id"] == queues[0]["id"]
+    assert server.resources["resource-0"]["is_locked"]
+    assert not server.resources["resource-1"]["is_locked"]
+
+
+def test_a_burst_of_jobs_is_checked_once(server, locker, tmp_path):
+    server.finish_after = None
+    queue_ids = [server.create_queue("pool", signoff=f"job-{i}")["id"] for i in range(50)]
+    with Agent(locker, socket_path=os.path.join(tmp_path, "agent.sock"), interval=5) as agent:
+        # Let the first round pass, then the jobs arrive between two rounds
+        time.sleep(0.2)
+        server.reset_counters()
+        with ThreadPoolExecutor(max_workers=50) as executor:
+            waits = [
+                executor.submit(agent.wait, queue_id, attempts=1, interval=1.5, abort_on_timeout=False)
+                for queue_id in queue_ids
+            ]
+            for wait in waits:
+                with pytest.raises(TimeoutReachedForLockingResource):
+                    wait.result()
+    # Every queue is checked and beaten once when it arrives, not on the arrival of every other one
+    assert server.count("PUT", "/api/rqueue/") == 50
+    assert server.count() <= 3 * 50
@@ -0,0 +1,106 @@
+from rlockertools.asyncresourcelocker import AsyncResourceLocker
+from rlockertools.circuitbreaker import RetryBudget
+from rlockertools.pollstrategy import FixedPollStrategy
+from rlockertools.resourcelocker import ResourceLocker
+import asyncio
+import pytest
+
+FAST = FixedPollStrategy(interval=0.01, warmup_interval=0.01)
+
+
+def _async_get(server, client_kwargs, url, failures):
+    async def get():
+        async with AsyncResourceLocker(server.url, "token", **client_kwargs) as locker:
+            server.reset_counters()
+            server.fail_next(failures)
+            return await locker._get_with_retry(url)
+
+    return asyncio.run(get())
+
+
+@pytest.mark.parametrize("failures, status", [(0, 200), (2, 200), (3, 503)])
+def test_get_retries_like_the_sync_client(server, client_kwargs, failures, status):
+    url = f"{server.url}/api/resources"
+    with ResourceLocker(server.url, "token", **client_kwargs) as locker:
+        server.fail_next(failures)
+        assert locker._get_with_retry(url).status_code == status
+        sync_requests = server.count()
+    assert _async_get(server, client_kwargs, url, failures).status_code == status
+    assert server.count() == sync_requests == min(failures + 1, 3)
+
+
+def test_writes_are_retried_on_server_errors(server, client_kwargs):
+    async def lock_and_release():
+        async with AsyncResourceLocker(server.url, "token", **client_kwargs) as locker:
+            resource = server.resources["resource-0"]
+            server.reset_counters()
+            server.fail_next(2)
+            locked = await locker.lock_resource(resource, signoff="job")
+            locked_requests = server.count()
+            server.fail_next(1)
+            released = await locker.release(dict(resource, is_locked=True))
+            return locked, locked_requests, released
+
+    locked, locked_requests, released = asyncio.run(lock_and_release())
+    assert locked.status_code == 200 and locked_requests == 3
+    assert released.status_code == 200
+    assert server.count("PUT") == 5
+    assert not server.resources["resource-0"]["is_locked"]
+
+
+def test_writes_are_not_retried_on_client_errors(server, client_kwargs):
+    async def abort():
+        async with AsyncResourceLocker(server.url, "token", **client_kwargs) as locker:
+            server.reset_counters()
+            return await locker.abort_queue(12345)
+
+    assert asyncio.run(abort()).status_code == 404
+    assert server.count() == 1
+
+
+def test_retry_budget_stops_the_retries(server, client_kwargs):
+    client_kwargs["retry_budget"] = RetryBudget(ratio=0, min_per_second=0, max_tokens=0)
+    response = _async_get(server, client_kwargs, f"{server.url}/api/resources", 3)
+    assert response.status_code == 503
+    assert server.count() == 1
+
+
+def test_concurrent_wait_until_finished(server, client_kwargs):
+    server.finish_after = 3
+    queue_ids = [server.create_queue("pool", signoff=f"job-{i}")["id"] for i in range(20)]
+
+    async def wait_all():
+        async with AsyncResourceLocker(server.url, "token", max_workers=4, **client_kwargs) as locker:
+            return await asyncio.gather(
+                *(locker.wait_until_finished(queue_id, interval=0.01, attempts=100, poll_strategy=FAST) for queue_id in queue_ids)
+            )
+
+    queues = asyncio.run(wait_all())
+    assert [queue["id"] for queue in queues] == queue_ids
+    assert all(queue["status"] == "FINISHED" for queue in queues)
+    assert server.count("PUT", "/api/rqueue/") >= len(queue_ids) * 2
+
+
+def test_wait_until_finished_times_out(server, client_kwargs):
+    server.finish_after = None
+    queue_id = server.create_queue("pool")["id"]
+
+    async def wait():
+        async with AsyncResourceLocker(server.url, "token", **client_kwargs) as locker:
+            return await locker.wait_until_finished(queue_id, interval=0.01, attempts=3, silent=True, poll_strategy=FAST)
+
+    assert asyncio.run(wait()) is None
+    assert server.queues[queue_id]["status"] == "ABORTED"
+
+
+def test_wait_does_not_probe_the_root_page(server, client_kwargs):
+    server.finish_after = 5
+    queue_id = server.create_queue("pool")["id"]
+
+    async def wait():
+        async with AsyncResourceLocker(server.url, "token", **client_kwargs) as locker:
+            return await locker.wait_until_finished(queue_id, interval=0.01, attempts=100, poll_strategy=FAST)
+
+    assert asyncio.run(wait())["status"] == "FINISHED"
+    # A single HEAD on entering, the successful polls prove the server is up afterwards
+    assert [request for request in server.requests if request[1] == "/"] == [("HEAD", "/")]
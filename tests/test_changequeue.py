@@ -0,0 +1,37 @@
+from benchmarks.fakeserver import FakeResourceLockerServer
+from rlockertools.resourcelocker import ResourceLocker
+import json
+import pytest
+
+
+@pytest.fixture(params=[False, True], ids=["no-etag", "etag"])
+def etag_server(request):
+    with FakeResourceLockerServer(finish_after=None, etag=request.param) as server:
+        yield server
+
+
+def _data(server, queue_id):
+    return json.loads(server.queues[queue_id]["data"])
+
+
+def test_concurrent_change_is_not_overwritten(etag_server, client_kwargs):
+    queue_id = etag_server.create_queue("pool")["id"]
+    with ResourceLocker(etag_server.url, "token", **client_kwargs) as mine, \
+            ResourceLocker(etag_server.url, "token", **client_kwargs) as theirs:
+        mine.get_queue(queue_id)
+        theirs.change_queue(queue_id, "PENDING", theirs_key="set")
+        assert mine.change_queue(queue_id, "PENDING", mine_key="set").status_code == 200
+    assert _data(etag_server, queue_id)["theirs_key"] == "set"
+    assert _data(etag_server, queue_id)["mine_key"] == "set"
+
+
+def test_cached_copy_only_with_etag(etag_server, client_kwargs):
+    queue_id = etag_server.create_queue("pool")["id"]
+    with ResourceLocker(etag_server.url, "token", **client_kwargs) as locker:
+        locker.change_queue(queue_id, "PENDING", step=1)
+        etag_server.reset_counters()
+        locker.change_queue(queue_id, "PENDING", step=2)
+    # With an ETag the cached copy replaces the GET, the PUT is conditional
+    assert etag_server.count("GET") == (0 if etag_server.etag else 1)
+    assert etag_server.count("PUT") == 1
+    assert _data(etag_server, queue_id)["step"] == 2
@@ -0,0 +1,100 @@
+from requests.exceptions import ChunkedEncodingError, ReadTimeout, TooManyRedirects
+from rlockertools.asyncresourcelocker import AsyncResourceLocker
+from rlockertools.circuitbreaker import CircuitBreaker, RetryBudget
+from rlockertools.exceptions import CircuitOpenError
+from rlockertools.resourcelocker import ResourceLocker
+from rlockertools.waittransport import StreamWaitTransport
+import asyncio
+import threading
+import pytest
+
+
+class _Response:
+    status_code = 200
+    headers = {}
+    content = b"[]"
+
+
+class _Session:
+    """
+    Session raising the given errors on the first requests, answering 200 afterwards
+    """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.requests = 0
+
+    def request(self, method, url, **kwargs):
+        self.requests += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return _Response()
+
+    def close(self):
+        pass
+
+
+def _opened_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    return breaker
+
+
+@pytest.mark.parametrize("error", [ChunkedEncodingError(), TooManyRedirects(), KeyboardInterrupt()])
+def test_probe_raising_an_unexpected_error_is_resolved(error):
+    breaker = _opened_breaker()
+    locker = ResourceLocker("http://rlocker", "token", session=_Session(error), circuit_breaker=breaker)
+    with pytest.raises(type(error)):
+        locker._request("GET", "http://rlocker/api/resources")
+    assert not breaker._probing
+    # The next request probes again instead of failing with CircuitOpenError forever
+    assert locker._request("GET", "http://rlocker/api/resources").status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_async_probe_is_released():
+    breaker = _opened_breaker()
+    started = threading.Event()
+    release = threading.Event()
+
+    class _BlockingSession(_Session):
+        def request(self, method, url, **kwargs):
+            started.set()
+            release.wait(5)
+            return _Response()
+
+    async def cancel_probe():
+        locker = AsyncResourceLocker(
+            "http://rlocker", "token", session=_BlockingSession(), circuit_breaker=breaker,
+            retry_budget=RetryBudget(),
+        )
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(locker._request("GET", "http://rlocker/"), 0.1)
+        release.set()
+        await locker.close()
+
+    asyncio.run(cancel_probe())
+    assert started.is_set()
+    assert not breaker._probing
+    breaker.before_request()
+
+
+def test_long_poll_timeout_is_not_a_failure():
+    breaker = CircuitBreaker(failure_threshold=1)
+    session = _Session(*[ReadTimeout() for _ in range(3)])
+    locker = ResourceLocker("http://rlocker", "token", session=session, circuit_breaker=breaker)
+    transport = StreamWaitTransport()
+    for _ in range(3):
+        assert transport.wait(locker, {"id": 1, "status": "PENDING"}, 0.01) is False
+    assert session.requests == 3
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_regular_timeout_is_a_failure():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+    locker = ResourceLocker("http://rlocker", "token", session=_Session(ReadTimeout()), circuit_breaker=breaker)
+    with pytest.raises(ReadTimeout):
+        locker._request("GET", "http://rlocker/")
+    with pytest.raises(CircuitOpenError):
+        locker._request("GET", "http://rlocker/")
@@ -0,0 +1,51 @@
+from benchmarks.fakeserver import FakeResourceLockerServer
+import json
+import pytest
+
+RESOURCES = [
+    {"name": "a-0", "labels_string": "a", "is_locked": False, "signoff": None},
+    {"name": "b-0", "labels_string": "b", "is_locked": False, "signoff": None},
+    # Locked before by another job reusing the signoff
+    {"name": "b-1", "labels_string": "b", "is_locked": True, "signoff": "job", "locked_time": "2999-01-01 00:00:00"},
+]
+
+
+@pytest.fixture
+def server():
+    with FakeResourceLockerServer(resources=RESOURCES, finish_after=1) as server:
+        yield server
+
+
+def _locked(server):
+    return sorted(name for name, resource in server.resources.items() if resource["is_locked"])
+
+
+def test_both_pools_finished_at_once(server, locker):
+    winner = locker.find_any_resource(["a", "b"], signoff="job", priority=1, interval=0.01, attempts=100)
+    assert json.loads(winner["data"])["search_string"] == "a"
+    # Both queues got FINISHED in the same status check, only the resource of the loser is released
+    assert [queue["status"] for queue in server.queues.values()] == ["FINISHED", "FINISHED"]
+    assert _locked(server) == ["a-0", "b-1"]
+
+
+def test_abort_arriving_after_the_finish(server, locker):
+    queues = locker.submit_queues(["a", "b"], signoff="job", priority=1)
+    server.set_status(queues["a"]["id"], "FINISHED")
+    server.set_status(queues["b"]["id"], "FINISHED")
+    locker.abort_queue(queues["b"]["id"], abort_msg="Too late")
+    assert server.queues[queues["b"]["id"]]["status"] == "ABORTED"
+    locker._release_extra(server._public(server.queues[queues["a"]["id"]]), queues.values())
+    assert _locked(server) == ["a-0", "b-1"]
+
+
+def test_nothing_released_when_the_others_were_aborted(server, locker):
+    server.resources["b-0"]["is_locked"] = True
+    server.finish_after = None
+    queues = locker.submit_queues(["a", "b"], signoff="job", priority=1)
+    server.set_status(queues["a"]["id"], "FINISHED")
+    server.reset_counters()
+    winner = locker.wait_until_any_finished(queues.values(), interval=0.01, attempts=100)
+    assert winner["id"] == queues["a"]["id"]
+    assert server.queues[queues["b"]["id"]]["status"] == "ABORTED"
+    assert _locked(server) == ["a-0", "b-0", "b-1"]
+    assert server.count("GET", "/api/resources") == 0
@@ -0,0 +1,70 @@
+from framework.main import _run, init_argparser
+from rlockertools import journal as journal_module
+from rlockertools.exceptions import TimeoutReachedForLockingResource
+from rlockertools.journal import Journal
+import os
+import time
+import pytest
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return Journal(os.path.join(tmp_path, "journal.jsonl"), max_lines=10, max_age=60)
+
+
+def _lines(journal):
+    with open(journal.path) as f:
+        return len(f.readlines())
+
+
+def test_find_resumable(journal):
+    journal.record(1, search_string="pool", signoff="job", status="PENDING", submitted=1)
+    journal.record(2, search_string="pool", signoff="job", status="PENDING", submitted=2)
+    journal.record(2, status="ABORTED")
+    assert journal.find_resumable("pool", "job")["queue_id"] == 1
+    assert journal.find_resumable("pool", "other") is None
+
+
+def test_queues_left_waiting_are_aged_out(journal, monkeypatch):
+    # Crashed runs: a single PENDING record each, never a final one
+    for queue_id in range(20):
+        journal.record(queue_id, search_string="pool", signoff=f"job-{queue_id}", status="PENDING")
+    now = time.time()
+    monkeypatch.setattr(journal_module.time, "time", lambda: now + 120)
+    journal.record(100, search_string="pool", signoff="job-100", status="PENDING")
+    assert list(journal.entries()) == ["100"]
+    assert _lines(journal) == 1
+
+
+def test_compaction_keeps_the_recent_queues(journal):
+    for queue_id in range(10):
+        journal.record(queue_id, status="PENDING")
+        journal.record(queue_id, status="FINISHED")
+    assert len(journal.entries()) == 10
+    assert _lines(journal) <= 20
+    journal.compact()
+    assert _lines(journal) == 10
+
+
+def test_timeout_is_recorded_as_aborted(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server.finish_after = None
+    path = os.path.join(tmp_path, "journal.jsonl")
+    args = init_argparser(
+        [
+            "--server-url", server.url, "--token", "t", "lock", "--search-string", "pool", "--signoff", "job",
+            "--priority", "1", "--interval", "1", "--attempts", "1", "--journal", path,
+        ]
+    )
+    with pytest.raises(TimeoutReachedForLockingResource):
+        _run(args)
+    (entry,) = Journal(path).entries().values()
+    assert entry["status"] == "ABORTED"
+    assert Journal(path).find_resumable("pool", "job") is None
+
+
+def test_without_fcntl_there_is_no_journal(monkeypatch, tmp_path):
+    from framework.main import _open_journal
+
+    monkeypatch.setattr(journal_module, "fcntl", None)
+    assert _open_journal(os.path.join(tmp_path, "journal.jsonl")) is None
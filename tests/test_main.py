@@ -0,0 +1,80 @@
+from framework.main import POLL_STRATEGY_CHOICES, WAIT_TRANSPORT_CHOICES, init_argparser, main
+from rlockertools.agent import Agent
+from rlockertools.pollstrategy import POLL_STRATEGIES
+from rlockertools.resourcelocker import ResourceLocker
+from rlockertools.waittransport import WAIT_TRANSPORTS
+import os
+import pytest
+
+CONNECTION = ["--server-url", "http://rlocker", "--token", "t"]
+
+
+def test_choices_match_the_registries():
+    assert POLL_STRATEGY_CHOICES == tuple(POLL_STRATEGIES)
+    assert WAIT_TRANSPORT_CHOICES == tuple(WAIT_TRANSPORTS)
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        CONNECTION + ["check", "--search-string", "a"],
+        ["check", "--search-string", "a"] + CONNECTION,
+        ["--server-url", "http://rlocker", "check", "--token", "t", "--search-string", "a"],
+        CONNECTION + ["--check", "--search-string", "a"],
+    ],
+)
+def test_options_before_or_after_the_subcommand(argv):
+    args = init_argparser(argv)
+    assert args.check
+    assert (args.server_url, args.token, args.search_string) == ("http://rlocker", "t", "a")
+    assert args.output == "text"
+
+
+def test_output_before_the_subcommand():
+    assert init_argparser(["--output", "json", "check", "--search-string", "a"] + CONNECTION).output == "json"
+    assert init_argparser(["--output", "text", "check", "--output", "json"] + CONNECTION).output == "json"
+
+
+def test_lock_options_keep_their_defaults():
+    args = init_argparser(CONNECTION + ["--interval", "5", "lock", "--search-string", "a", "--attempts", "3"])
+    assert (args.lock, args.interval, args.attempts) == (True, 5, 3)
+    assert (args.poll_strategy, args.wait_transport, args.resume) == ("fixed", "poll", False)
+
+
+def test_connection_is_required():
+    with pytest.raises(SystemExit):
+        init_argparser(["check", "--search-string", "a"])
+
+
+def test_agent_socket_does_not_take_the_command():
+    args = init_argparser(["--agent-socket", "lock", "--search-string", "a", "--signoff", "s", "--priority", "1"])
+    assert args.agent_socket and args.lock
+    assert args.agent_socket_path is None
+
+
+def test_an_action_is_required(capsys):
+    with pytest.raises(SystemExit) as exited:
+        init_argparser(["--agent-socket"])
+    assert exited.value.code != 0
+    with pytest.raises(SystemExit) as exited:
+        main(CONNECTION)
+    assert exited.value.code != 0
+
+
+def test_agent_socket_lock(server, client_kwargs, tmp_path, monkeypatch):
+    server.finish_after = 2
+    monkeypatch.chdir(tmp_path)
+    socket_path = os.path.join(tmp_path, "agent.sock")
+    with ResourceLocker(server.url, "token", **client_kwargs) as locker, \
+            Agent(locker, socket_path=socket_path, interval=0.05):
+        main(
+            [
+                "--agent-socket", "lock", "--agent-socket-path", socket_path, "--search-string", "pool",
+                "--signoff", "job", "--priority", "1", "--interval", "1", "--attempts", "10",
+            ]
+        )
+    assert server.count("PUT", "/api/resource/retrieve_entrypoint/pool") == 1
+    (queue,) = server.queues.values()
+    assert queue["status"] == "FINISHED"
+    with open(os.path.join(tmp_path, "queue_id.log")) as f:
+        assert f.read() == str(queue["id"])
@@ -0,0 +1,112 @@
+from benchmarks.fakeserver import FakeResourceLockerServer
+from rlockertools.queueanalytics import QueueAnalytics
+import datetime
+import os
+import pytest
+
+START = datetime.datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def server():
+    with FakeResourceLockerServer(finish_after=None) as server:
+        yield server
+
+
+def _finished(server, search_string="pool", requested=0, finished=60):
+    queue = server.create_queue(search_string)
+    server.queues[queue["id"]].update(
+        status="FINISHED",
+        time_requested=str(START + datetime.timedelta(seconds=requested)),
+        last_beat=str(START + datetime.timedelta(seconds=finished)),
+    )
+    return server._public(server.queues[queue["id"]])
+
+
+def test_add_accounts_a_queue_once(server, locker):
+    analytics = QueueAnalytics(locker)
+    queue = _finished(server, requested=0, finished=30)
+    assert analytics.add(queue)
+    assert not analytics.add(queue)
+    never_beaten = dict(_finished(server), last_beat=None)
+    assert not analytics.add(never_beaten)
+    assert not analytics.add(dict(never_beaten, last_beat=queue["last_beat"]))
+    assert analytics.history("pool")["count"] == 1
+    assert analytics.history("pool")["mean_wait"] == 30
+
+
+def test_seen_ids_are_bounded(server, locker):
+    analytics = QueueAnalytics(locker, id_window=3)
+    queues = [_finished(server, finished=i + 1) for i in range(10)]
+    assert analytics.refresh() == 10
+    assert analytics._floor == 7
+    assert analytics._counted == {8, 9, 10}
+    for queue in queues:
+        assert not analytics.add(queue)
+    assert analytics.refresh() == 0
+    # Finished out of order, but within the window
+    late = server.create_queue("pool")
+    _finished(server)
+    server.queues[late["id"]].update(
+        status="FINISHED", time_requested=str(START), last_beat=str(START + datetime.timedelta(seconds=5))
+    )
+    assert analytics.refresh() == 2
+    assert analytics.history(None)["count"] == 12
+
+
+def test_estimate(server, locker):
+    for i in range(4):
+        _finished(server, requested=i * 100, finished=i * 100 + 60)
+    pending = [server.create_queue(search_string) for search_string in ("pool", "pool", "pool", "other")]
+    for queue in pending:
+        server.set_status(queue["id"], "PENDING")
+    mine = pending[2]
+    for name in server.resources:
+        server.resources[name]["is_locked"] = True
+    analytics = QueueAnalytics(locker)
+    estimate = analytics.estimate(queue_id=mine["id"])
+    assert estimate["position"] == 2
+    assert estimate["free_resources"] == 0
+    assert estimate["total_resources"] == 2
+    assert estimate["history"]["count"] == 4
+    # One pace of the finishes for each of the queues ahead, and one for this queue
+    assert estimate["estimated_wait"] == 3 * 100
+
+    server.resources["resource-0"]["is_locked"] = False
+    _finished(server)
+    server.reset_counters()
+    estimate = analytics.estimate(search_string="pool")
+    # The FINISHED queues are not listed again within refresh_interval
+    assert server.count("GET", "/api/rqueues?status=FINISHED") == 0
+    assert estimate["history"]["count"] == 4
+    assert estimate["position"] == 3
+    assert estimate["estimated_wait"] == 3 * 100
+
+    analytics.refresh_interval = 0
+    assert analytics.estimate(search_string="pool")["history"]["count"] == 5
+    assert server.count("GET", "/api/rqueues?status=FINISHED") == 1
+
+
+def test_save_and_load(server, locker, tmp_path):
+    path = os.path.join(tmp_path, "state", "analytics.json")
+    for i in range(5):
+        _finished(server, "pool" if i % 2 else "other", requested=i, finished=i + 10)
+    analytics = QueueAnalytics(locker, path=path, id_window=2)
+    analytics.refresh()
+    analytics.save()
+
+    loaded = QueueAnalytics(locker, path=path, id_window=2)
+    assert loaded._floor == analytics._floor == 3
+    assert loaded._counted == analytics._counted == {4, 5}
+    for search_string in (None, "pool", "other"):
+        assert loaded.history(search_string) == analytics.history(search_string)
+    assert loaded.refresh() == 0
+    _finished(server)
+    assert loaded.refresh() == 1
+
+
+def test_corrupted_state_is_ignored(locker, tmp_path):
+    path = os.path.join(tmp_path, "analytics.json")
+    with open(path, "w") as f:
+        f.write("{not json")
+    assert QueueAnalytics(locker, path=path).history()["count"] == 0
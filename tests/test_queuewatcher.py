@@ -0,0 +1,43 @@
+from rlockertools.exceptions import QueueFailedError
+from rlockertools.queuewatcher import QueueWatcher
+import pytest
+
+
+def test_futures_are_resolved_from_the_bulk_listing(server, locker):
+    server.finish_after = 2
+    queue_ids = [server.create_queue("pool")["id"] for _ in range(3)]
+    watcher = QueueWatcher(locker, interval=0.01)
+    futures = [watcher.watch(queue_id) for queue_id in queue_ids]
+    watcher.run(attempts=10)
+    assert [future.result(timeout=0)["status"] for future in futures] == ["FINISHED"] * 3
+
+
+def test_failed_queue_fails_its_future(server, locker):
+    server.finish_after = None
+    queue_id = server.create_queue("pool")["id"]
+    server.set_status(queue_id, "ABORTED")
+    watcher = QueueWatcher(locker, interval=0.01)
+    future = watcher.watch(queue_id)
+    watcher.run(attempts=3)
+    with pytest.raises(QueueFailedError):
+        future.result(timeout=0)
+
+
+def test_unexpected_error_does_not_stop_the_loop(server, locker, monkeypatch):
+    server.finish_after = 2
+    queue_id = server.create_queue("pool")["id"]
+    get_queues = locker.get_queues
+    calls = []
+
+    def flaky_get_queues(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise ValueError("Expecting value: line 1 column 1 (char 0)")
+        return get_queues(*args, **kwargs)
+
+    monkeypatch.setattr(locker, "get_queues", flaky_get_queues)
+    watcher = QueueWatcher(locker, interval=0.01)
+    future = watcher.watch(queue_id)
+    watcher.start(attempts=20)
+    assert future.result(timeout=5)["status"] == "FINISHED"
+    watcher.stop(timeout=5)
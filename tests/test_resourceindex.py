@@ -0,0 +1,46 @@
+from rlockertools.resourceindex import ResourceIndex
+import random
+
+
+def _resource(name, labels="pool", locked=False, signoff=None):
+    return {"name": name, "labels_string": labels, "is_locked": locked, "signoff": signoff}
+
+
+def test_compound_query():
+    index = ResourceIndex(
+        [
+            _resource("cluster-1", "aws east"),
+            _resource("cluster-2", "aws west", locked=True, signoff="job"),
+            _resource("cluster-3", "aws east", locked=True, signoff="job"),
+            _resource("db-1", "aws east"),
+        ]
+    )
+    assert [r["name"] for r in index.query(labels=["aws", "east"], name_prefix="cluster-")] == [
+        "cluster-1",
+        "cluster-3",
+    ]
+    assert [r["name"] for r in index.query(free=False, signoff="job", labels="west")] == ["cluster-2"]
+    assert index.query(name="missing") == []
+
+
+def test_names_stay_sorted_through_refreshes():
+    names = [f"resource-{i:05d}" for i in range(5000)]
+    random.shuffle(names)
+    index = ResourceIndex(_resource(name) for name in names)
+    assert index._names == sorted(names)
+
+    kept = sorted(names)[:4000]
+    changes = index.refresh([_resource(name) for name in kept] + [_resource("new-1"), _resource("a-new")])
+    assert changes == {"added": 2, "updated": 0, "removed": 1000}
+    assert index._names == sorted(kept + ["new-1", "a-new"])
+
+    changes = index.refresh([_resource("resource-00000", locked=True)], partial=True)
+    assert changes["updated"] == 1
+    assert index.query(free=False)[0]["name"] == "resource-00000"
+
+
+def test_prefix_lookup():
+    index = ResourceIndex(_resource(f"{prefix}-{i}") for prefix in ("a", "b", "c") for i in range(100))
+    assert len(index.query(name_prefix="b-")) == 100
+    assert [r["name"] for r in index.query(name_prefix="c-99")] == ["c-99"]
+    assert index.query(name_prefix="d") == []
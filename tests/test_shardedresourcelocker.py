@@ -0,0 +1,130 @@
+from benchmarks.fakeserver import FakeResourceLockerServer
+from rlockertools.circuitbreaker import CircuitBreaker, RetryBudget
+from rlockertools.resourcelocker import ResourceLocker
+from rlockertools.shardedresourcelocker import ShardedResourceLocker
+import pytest
+
+
+def _resources(*names, label="pool"):
+    return [{"name": name, "labels_string": label, "is_locked": False, "signoff": None} for name in names]
+
+
+@pytest.fixture
+def servers():
+    servers = [
+        FakeResourceLockerServer(resources=_resources("eu-0", "shared"), finish_after=None).start(),
+        FakeResourceLockerServer(resources=_resources("us-0", "shared"), finish_after=None).start(),
+        FakeResourceLockerServer(resources=_resources("ap-0"), finish_after=None).start(),
+    ]
+    yield servers
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def sharded(servers):
+    # A circuit breaker and a retry budget of its own for every instance
+    lockers = [
+        ResourceLocker(
+            server.url,
+            "token",
+            retry_delay=0.01,
+            max_retries=1,
+            circuit_breaker=CircuitBreaker(),
+            retry_budget=RetryBudget(max_tokens=100),
+        )
+        for server in servers
+    ]
+    with ShardedResourceLocker(lockers, health_ttl=60) as sharded:
+        yield sharded
+    for locker in lockers:
+        locker.close()
+
+
+def test_merge_with_instance_url(servers, sharded):
+    resources = sharded.all()
+    assert sorted((r["instance_url"], r["name"]) for r in resources) == sorted(
+        (server.url, name) for server in servers for name in server.resources
+    )
+    assert sharded.owner({"name": "us-0"}) == servers[1].url
+    with pytest.raises(ValueError, match="several instances"):
+        sharded.owner({"name": "shared"})
+    with pytest.raises(ValueError, match="not known"):
+        sharded.owner({"name": "nowhere"})
+
+
+def test_lock_and_release_go_to_the_owner(servers, sharded):
+    shared = [r for r in sharded.get_lockable_resources(label_matches="pool") if r["name"] == "shared"]
+    us = next(r for r in shared if r["instance_url"] == servers[1].url)
+    for server in servers:
+        server.reset_counters()
+    assert sharded.lock_resource(us, signoff="job").status_code == 200
+    assert servers[1].resources["shared"]["is_locked"]
+    assert not servers[0].resources["shared"]["is_locked"]
+    assert [server.count("PUT") for server in servers] == [0, 1, 0]
+    # The instance_url is not sent to the server
+    assert "instance_url" not in servers[1].resources["shared"]
+
+    sharded.release(us)
+    assert not servers[1].resources["shared"]["is_locked"]
+    assert [server.count("PUT") for server in servers] == [0, 2, 0]
+
+
+def test_queues_with_the_same_id(servers, sharded):
+    # Only one instance has the resource free at a time, the queue goes there
+    servers[1].resources["shared"]["is_locked"] = True
+    first = sharded.find_resource("shared", signoff="job", priority=1)
+    servers[0].resources["shared"]["is_locked"] = True
+    servers[1].resources["shared"]["is_locked"] = False
+    second = sharded.find_resource("shared", signoff="job", priority=1)
+    assert first.url.startswith(servers[0].url) and second.url.startswith(servers[1].url)
+    assert first.json()["id"] == second.json()["id"] == 1
+    with pytest.raises(ValueError, match="several instances"):
+        sharded.get_queue(1)
+    assert sharded.get_queue(1, instance_url=servers[1].url)["id"] == 1
+    assert servers[0].count("GET", "/api/rqueue/1") == 0
+
+
+def test_ranking_by_health_and_latency(servers, sharded):
+    servers[0].latency = 0.05
+    for _ in range(3):
+        sharded.all()
+    assert sharded.ranked()[-1] == servers[0].url
+    servers[1].stop()
+    sharded.all()
+    stats = sharded.stats()
+    assert not stats[servers[1].url]["healthy"]
+    assert stats[servers[1].url]["errors"] == 1
+    assert sharded.ranked()[-1] == servers[1].url
+    assert sharded.ranked()[-2] == servers[0].url
+
+
+def test_find_resource_prefers_the_fastest_healthy_instance(servers, sharded):
+    servers[0].latency = 0.05
+    for _ in range(3):
+        sharded.all()
+    req = sharded.find_resource("shared", signoff="job", priority=1)
+    assert req.url.startswith(servers[1].url)
+
+
+def test_find_resource_fails_over_when_an_instance_is_stopped(servers, sharded):
+    servers[2].stop()
+    req = sharded.find_resource("pool", signoff="job", priority=1)
+    assert not req.url.startswith(servers[2].url)
+    assert not sharded.healthy(servers[2].url)
+
+    # Stopped between the lookup and the submission: the next instance gets the queue
+    first = sharded.ranked()[0]
+    locker = sharded.lockers[first]
+    stopped = next(server for server in servers if server.url == first)
+    find_resource = locker.find_resource
+
+    def stop_then_find_resource(**kwargs):
+        stopped.stop()
+        return find_resource(**kwargs)
+
+    locker.find_resource = stop_then_find_resource
+    req = sharded.find_resource("pool", signoff="job", priority=1)
+    assert req.ok
+    assert not req.url.startswith(first)
+    assert not sharded.healthy(first)
@@ -0,0 +1,50 @@
+from benchmarks.fakeserver import FakeResourceLockerServer
+from rlockertools import resourcelocker
+import pytest
+import requests
+
+
+@pytest.fixture(params=[False, True], ids=["ignored", "honoured"])
+def server(request):
+    with FakeResourceLockerServer(sparse_fields=request.param, finish_after=None) as server:
+        for search_string in ("a", "b"):
+            server.create_queue(search_string)
+        yield server
+
+
+def _fields_sent(server):
+    return [path for method, path in server.requests if "fields=" in path]
+
+
+def test_projection(server, locker):
+    assert locker.get_queues(fields=["id", "status"]) == [
+        {"id": 1, "status": "INITIALIZING"},
+        {"id": 2, "status": "INITIALIZING"},
+    ]
+    assert [set(r) for r in locker.all(fields=["name"])] == [{"name"}, {"name"}]
+    assert locker._sparse_fields == {"rqueues": server.sparse_fields, "resources": server.sparse_fields}
+
+    server.reset_counters()
+    assert [q["status"] for q in locker.iter_queues(fields=["status"])] == ["INITIALIZING", "INITIALIZING"]
+    # Not asked anymore once ignored
+    assert len(_fields_sent(server)) == (1 if server.sparse_fields else 0)
+
+
+def test_recheck_after_upgrade(server, locker, monkeypatch):
+    server.sparse_fields = False
+    locker.get_queues(fields=["id"])
+    assert locker._sparse_fields["rqueues"] is False
+
+    server.sparse_fields = True
+    server.reset_counters()
+    locker.get_queues(fields=["id"])
+    assert _fields_sent(server) == []
+
+    monkeypatch.setattr(resourcelocker, "SPARSE_FIELDS_RECHECK", 0)
+    assert locker.get_queues(fields=["id"]) == [{"id": 1}, {"id": 2}]
+    assert len(_fields_sent(server)) == 1
+    assert locker._sparse_fields["rqueues"] is True
+
+
+def test_session_keeps_the_default_accept_encoding(locker):
+    assert locker.session.headers["Accept-Encoding"] == requests.utils.default_headers()["Accept-Encoding"]
@@ -0,0 +1,58 @@
+from rlockertools.utils import iter_json_array
+import json
+import random
+import pytest
+
+
+def _chunks(text, size):
+    data = text.encode("utf8")
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize(
+    "document",
+    [
+        "[]",
+        " [ ] ",
+        "[1]",
+        '[1, 2.5e3, -3, "a,]b", true, false, null]',
+        '[{"name": "é", "labels": ["a", "b"]}, [[]], {}]',
+        "[\n  15,\n  1500.5\n]\n",
+    ],
+)
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1024])
+def test_same_items_as_json_loads(document, size):
+    assert list(iter_json_array(_chunks(document, size))) == json.loads(document)
+
+
+@pytest.mark.parametrize(
+    "document", ["[1,,2]", "[1,2,]", "[,1]", "[1 2]", "[1,", "[1", "[1,,,2,]", '{"a": 1}', "[1]x", "[] []", "[1]]"]
+)
+@pytest.mark.parametrize("size", [1, 1024])
+def test_malformed_arrays_raise(document, size):
+    with pytest.raises(ValueError):
+        list(iter_json_array(_chunks(document, size)))
+
+
+def test_large_item_in_small_chunks_is_not_decoded_on_every_chunk(monkeypatch):
+    item = {"name": "resource", "description": "x" * 200000, "labels": list(range(1000))}
+    document = json.dumps([1, item, 2])
+    calls = []
+    raw_decode = json.JSONDecoder.raw_decode
+
+    def counting(self, s, idx=0):
+        calls.append(idx)
+        return raw_decode(self, s, idx)
+
+    monkeypatch.setattr(json.JSONDecoder, "raw_decode", counting)
+    chunks = _chunks(document, 16)
+    assert list(iter_json_array(chunks)) == [1, item, 2]
+    assert len(calls) < 50 < len(chunks)
+
+
+def test_random_split_points():
+    document = json.dumps([{"id": i, "data": "y" * random.randint(0, 300)} for i in range(200)])
+    data = document.encode("utf8")
+    cuts = sorted(random.sample(range(1, len(data)), 500))
+    chunks = [data[a:b] for a, b in zip([0] + cuts, cuts + [len(data)])]
+    assert list(iter_json_array(chunks)) == json.loads(document)
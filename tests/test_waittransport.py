@@ -0,0 +1,69 @@
+from benchmarks.fakeserver import FakeResourceLockerServer
+from rlockertools.resourcelocker import ResourceLocker
+from rlockertools.waittransport import StreamWaitTransport, WaitTransport
+import threading
+import time
+import pytest
+
+
+@pytest.fixture
+def push_server():
+    with FakeResourceLockerServer(finish_after=None, push=True) as server:
+        yield server
+
+
+def test_pushed_status_change_ends_the_wait(push_server, client_kwargs):
+    queue = push_server.create_queue("pool")
+    transport = StreamWaitTransport()
+    threading.Timer(0.2, push_server.set_status, (queue["id"], "FINISHED")).start()
+    with ResourceLocker(push_server.url, "token", **client_kwargs) as locker:
+        start = time.monotonic()
+        assert transport.wait(locker, queue, 5) is True
+    assert time.monotonic() - start < 2
+    assert transport.supported is True
+
+
+def test_no_event_waits_the_whole_time(push_server, client_kwargs):
+    queue = push_server.create_queue("pool")
+    with ResourceLocker(push_server.url, "token", **client_kwargs) as locker:
+        start = time.monotonic()
+        assert StreamWaitTransport().wait(locker, queue, 0.5) is False
+    assert time.monotonic() - start >= 0.5
+
+
+def test_missing_stream_falls_back_to_polling_for_good(server, locker):
+    queue = server.create_queue("pool")
+    transport = StreamWaitTransport()
+    assert transport.wait(locker, queue, 0.1) is False
+    assert transport.supported is False
+    server.reset_counters()
+    transport.wait(locker, queue, 0.1)
+    assert server.count() == 0
+
+
+def test_server_error_falls_back_for_one_wait_only(push_server, client_kwargs):
+    queue = push_server.create_queue("pool")
+    transport = StreamWaitTransport()
+    with ResourceLocker(push_server.url, "token", **client_kwargs) as locker:
+        push_server.fail_next(1, status=502)
+        start = time.monotonic()
+        assert transport.wait(locker, queue, 0.3) is False
+        assert time.monotonic() - start >= 0.3
+        assert transport.supported is not False
+        threading.Timer(0.2, push_server.set_status, (queue["id"], "FINISHED")).start()
+        assert transport.wait(locker, queue, 5) is True
+    assert transport.supported is True
+
+
+def test_wait_transport_is_abstract():
+    with pytest.raises(TypeError):
+        WaitTransport()
+
+
+def test_events_that_are_not_queues_are_skipped(push_server, client_kwargs):
+    queue = push_server.create_queue("pool")
+    transport = StreamWaitTransport()
+    transport._events = lambda response: iter(['"ok"', "[]", "1", "null", '{"status": "FINISHED"}'])
+    with ResourceLocker(push_server.url, "token", **client_kwargs) as locker:
+        assert transport.wait(locker, queue, 5) is True
+    assert transport.supported is True
@@ -0,0 +1,48 @@
+from rlockertools.pollstrategy import (
+    ExponentialPollStrategy,
+    FixedPollStrategy,
+    PollStrategy,
+    QueuePositionPollStrategy,
+)
+import time
+import pytest
+
+
+def _time_out(locker, queue_id, poll_strategy, interval=0.25, attempts=4):
+    start = time.monotonic()
+    assert locker.wait_until_finished(
+        queue_id, interval=interval, attempts=attempts, silent=True, poll_strategy=poll_strategy
+    ) is None
+    return time.monotonic() - start
+
+
+def test_finished_queue_is_returned(server, locker):
+    server.finish_after = 3
+    queue_id = server.create_queue("pool")["id"]
+    queue = locker.wait_until_finished(queue_id, interval=0.01, poll_strategy=FixedPollStrategy(0.01, 0.01))
+    assert queue["status"] == "FINISHED"
+
+
+def test_short_sleeps_do_not_shorten_the_timeout(server, locker):
+    server.finish_after = None
+    queue_id = server.create_queue("pool")["id"]
+    elapsed = _time_out(locker, queue_id, ExponentialPollStrategy(interval=0.25, initial=0.01))
+    assert 1.0 <= elapsed < 1.5
+    assert server.queues[queue_id]["status"] == "ABORTED"
+
+
+def test_long_sleeps_do_not_stretch_the_timeout(server, locker):
+    server.finish_after = None
+    for _ in range(10):
+        server.set_status(server.create_queue("pool")["id"], "PENDING")
+    queue_id = server.create_queue("pool", priority=5)["id"]
+    server.set_status(queue_id, "PENDING")
+    # Last in the line, the strategy sleeps its max_interval of 4 * interval
+    strategy = QueuePositionPollStrategy(locker, interval=0.25, seconds_per_position=60)
+    elapsed = _time_out(locker, queue_id, strategy)
+    assert 1.0 <= elapsed < 1.5
+
+
+def test_poll_strategy_is_abstract():
+    with pytest.raises(TypeError):
+        PollStrategy()